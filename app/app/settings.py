@@ -45,11 +45,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',  # first, to time everything below
+    'core.middleware.RepeatedQueryMiddleware',  # with DEBUG only
+    'core.middleware.CompressionMiddleware',  # above anything setting content
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,16 +82,222 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# with DB_POOL=1 connections are borrowed from an in-process pool (sized
+# per worker) for each request, otherwise they persist for DB_CONN_MAX_AGE
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(
+            os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'HEALTH_CHECKS': os.environ.get('DB_HEALTH_CHECKS', '1') == '1',
+        'POOL': {
+            'ENABLED': DB_POOL,
+            'SIZE': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+        },
     }
 }
 
+# read replicas, DB_REPLICA_HOSTS is a comma separated list of hosts that
+# share the primary's name and credentials
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    alias = 'replica%d' % number
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# clients stay on the primary for this long after a write
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+DATABASE_REPLICA_PIN_CACHE = 'state'
+# a replica that failed to connect is skipped for this long
+DATABASE_REPLICA_RETRY_SECONDS = int(
+    os.environ.get('DB_REPLICA_RETRY_SECONDS', 30))
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # shared between the worker processes of one host, culled when full,
+    # sized below from TAG_LIST_CACHE
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'SHARED_CACHE_DIR', '/tmp/recipe-app-api-cache'),
+    },
+    # stamps, revocations and replica pins, shared by the workers of one
+    # host and never culled: entries only go when they expire
+    'state': {
+        'BACKEND': 'core.cache.ExpiringFileBasedCache',
+        'LOCATION': os.environ.get(
+            'STATE_CACHE_DIR', '/tmp/recipe-app-api-state'),
+    },
+}
+
+# login and signup throttle counters, a table of fixed size in a file that
+# every worker process of the host maps, 24 bytes per slot
+THROTTLE_STORE_PATH = os.environ.get(
+    'THROTTLE_STORE_PATH', '/tmp/recipe-app-api-throttle.counters')
+THROTTLE_STORE_SLOTS = int(os.environ.get('THROTTLE_STORE_SLOTS', 100000))
+
+
+# API tokens expire this many seconds after login or rotation
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 14 * 24 * 3600))
+
+
+# Token authentication cache
+# the local LRU tier is per process. every hit is checked against the
+# stamps of the user and token in TOKEN_CACHE_STAMP_ALIAS, so changes made
+# through any worker sharing that alias apply at once
+
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 30))
+TOKEN_CACHE_SHARED_ALIAS = os.environ.get('TOKEN_CACHE_SHARED_ALIAS') or None
+TOKEN_CACHE_SHARED_TTL = int(os.environ.get('TOKEN_CACHE_SHARED_TTL', 300))
+TOKEN_CACHE_STAMP_ALIAS = os.environ.get('TOKEN_CACHE_STAMP_ALIAS', 'state')
+
+
+# Rendered tag lists, per user. BACKEND is the alias of a django cache
+# shared between workers, or 'local' for an in-process LRU (only safe with
+# a single worker process, other workers would miss the invalidations)
+
+TAG_LIST_CACHE = {
+    'BACKEND': os.environ.get('TAG_LIST_CACHE_BACKEND', 'shared'),
+    'MAX_SIZE': int(os.environ.get('TAG_LIST_CACHE_MAX_SIZE', 10000)),
+    'TTL': int(os.environ.get('TAG_LIST_CACHE_TTL', 300)),
+}
+if TAG_LIST_CACHE['BACKEND'] in CACHES:
+    # plus the generation key of each user
+    CACHES[TAG_LIST_CACHE['BACKEND']].setdefault('OPTIONS', {}).setdefault(
+        'MAX_ENTRIES', 2 * TAG_LIST_CACHE['MAX_SIZE'])
+
+
+# Tag export, rows fetched per database round trip and bytes per write
+TAG_EXPORT_CHUNK_SIZE = int(os.environ.get('TAG_EXPORT_CHUNK_SIZE', 2000))
+TAG_EXPORT_BLOCK_SIZE = int(os.environ.get('TAG_EXPORT_BLOCK_SIZE', 65536))
+
+
+# Bulk tag changes, items accepted per request and rows per statement
+TAG_BULK_MAX_ITEMS = int(os.environ.get('TAG_BULK_MAX_ITEMS', 1000))
+TAG_BULK_BATCH_SIZE = int(os.environ.get('TAG_BULK_BATCH_SIZE', 500))
+
+
+# Tags returned by the autocomplete endpoint
+TAG_AUTOCOMPLETE_LIMIT = int(os.environ.get('TAG_AUTOCOMPLETE_LIMIT', 10))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/2.1/topics/auth/passwords/
+# the first hasher is used for new hashes, hashes made by the others (or
+# with another work factor) are upgraded on the next successful login
+
+PASSWORD_HASHERS = os.environ.get('PASSWORD_HASHERS', ','.join([
+    'core.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+])).split(',')
+
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 120000))
+
+# worker processes hashing passwords off the request thread, 0 hashes inline
+PASSWORD_HASHING_POOL_SIZE = int(
+    os.environ.get('PASSWORD_HASHING_POOL_SIZE', 0))
+PASSWORD_HASHING_QUEUE_FACTOR = int(
+    os.environ.get('PASSWORD_HASHING_QUEUE_FACTOR', 4))
+PASSWORD_HASHING_TIMEOUT = int(os.environ.get('PASSWORD_HASHING_TIMEOUT', 10))
+
+
+REST_FRAMEWORK = {
+    # JSON stays the default, MessagePack is picked with the Accept header
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+    ),
+    # sliding window rates of core.throttling, <scope>_<ip|email>
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '30/min'),
+        'login_email': os.environ.get('THROTTLE_LOGIN_EMAIL', '10/min'),
+        'signup_ip': os.environ.get('THROTTLE_SIGNUP_IP', '20/hour'),
+        'signup_email': os.environ.get('THROTTLE_SIGNUP_EMAIL', '5/hour'),
+    },
+}
+
+
+# Admin changelists of larger results show the planner's row estimate
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('ADMIN_EXACT_COUNT_LIMIT', 100000))
+
+
+# Response compression, brotli when installed and accepted, else gzip
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+# only API bodies, pages reflecting input next to a CSRF token are open to
+# BREACH when compressed
+COMPRESSION_CONTENT_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/msgpack')
+
+
+# Per-view request metrics, served on /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# every worker writes its metrics here at most every interval in seconds,
+# /metrics sums the files of all workers
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/recipe-app-api-metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+# /metrics answers these addresses or networks, or a bearer token
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get(
+        'METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+
+# With DEBUG, log SQL statements repeated more than this in one request
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+
+# Task queue, see core.tasks. TASKS_EAGER runs tasks inline when queued
+TASKS_EAGER = os.environ.get('TASKS_EAGER', '') == '1'
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', 5))
+TASK_RETRY_DELAY = int(os.environ.get('TASK_RETRY_DELAY', 10))  # doubles
+TASK_LEASE = int(os.environ.get('TASK_LEASE', 300))  # seconds to run
+
+# Deleted accounts are purged by a task this many seconds later
+USER_PURGE_DELAY = int(os.environ.get('USER_PURGE_DELAY', 0))
+USER_PURGE_BATCH_SIZE = int(os.environ.get('USER_PURGE_BATCH_SIZE', 1000))
+
+
+# Email, sent by the task workers (the welcome email after signup)
+EMAIL_BACKEND = os.environ.get(
+    'EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = os.environ.get(
+    'DEFAULT_FROM_EMAIL', 'recipe-app@localhost')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
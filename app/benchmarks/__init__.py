@@ -0,0 +1,7 @@
+'''load and micro benchmarks of the API
+
+python -m benchmarks seed     create the seeded dataset and its manifest
+python -m benchmarks run      drive HTTP load against a server
+python -m benchmarks micro    in-process benchmarks of single components
+python -m benchmarks compare  diff two result files
+'''
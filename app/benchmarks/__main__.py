@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import platform
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from benchmarks import driver, scenarios
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    sys.path.insert(0, APP_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    import django
+    django.setup()
+
+
+def commit():
+    '''the commit benchmarked, BENCH_COMMIT where there is no git checkout'''
+    if os.environ.get('BENCH_COMMIT'):
+        return os.environ['BENCH_COMMIT']
+    try:
+        sha = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=APP_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(
+            ['git', 'diff', '--quiet', 'HEAD'], cwd=APP_DIR,
+            stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return sha + ('-dirty' if dirty else '')
+
+
+def write_results(kind, config, results, output):
+    document = {
+        'kind': kind,
+        'commit': commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'host': {'python': platform.python_version(),
+                 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'config': config,
+        'results': results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'Server on {host}:{port} did not come up')
+
+
+def seed(args):
+    setup_django()
+    from benchmarks import data
+    manifest = data.seed(args.users, args.tags_per_user, args.seed,
+                         args.batch_size)
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f)
+    print(f'Seeded {args.users} users with {args.tags_per_user} tags each, '
+          f'manifest written to {args.manifest}')
+
+
+def start_background(args, users):
+    '''drive the background scenario until the returned function is called,
+    which stops it and returns its summary'''
+    stop = threading.Event()
+    summary = {}
+
+    def target():
+        summary.update(driver.run(
+            args.url, scenarios.SCENARIOS[args.background], users,
+            concurrency=args.background_concurrency, stop=stop))
+    thread = threading.Thread(target=target)
+    thread.start()
+    time.sleep(args.background_lead)
+
+    def finish():
+        stop.set()
+        thread.join()
+        return summary
+    return finish
+
+
+def run(args):
+    with open(args.manifest) as f:
+        users = json.load(f)['users']
+    names = args.scenario or scenarios.DEFAULT
+
+    server = None
+    if args.serve is not None:
+        parts = urlsplit(args.url)
+        server = subprocess.Popen(
+            [sys.executable, 'manage.py', 'serve',
+             '--bind', f'{parts.hostname}:{parts.port}'] +
+            shlex.split(args.serve), cwd=APP_DIR)
+        wait_for_port(parts.hostname, parts.port, 60)
+    try:
+        results = {}
+        for name in names:
+            if args.background:
+                background = start_background(args, users)
+            results[name] = driver.run(
+                args.url, scenarios.SCENARIOS[name], users,
+                concurrency=args.concurrency, requests=args.requests,
+                duration=args.duration, warmup=args.warmup)
+            if args.background:
+                results[name]['background'] = background()
+            print(f'{name}: {results[name]}', file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    config = {key: value for key, value in vars(args).items()
+              if key not in ('func', 'output')}
+    config['scenario'] = list(names)
+    config['users'] = len(users)
+    config['server_env'] = {
+        key: value for key, value in os.environ.items()
+        if key.startswith(('DB_', 'PASSWORD_', 'TAG_', 'TOKEN_', 'METRICS',
+                           'THROTTLE_'))
+        and key != 'DB_PASS'
+    }
+    write_results('load', config, results, args.output)
+
+
+def micro(args):
+    setup_django()
+    from benchmarks import micro as benchmarks
+    names = args.benchmark or list(benchmarks.BENCHMARKS)
+    results = {name: benchmarks.BENCHMARKS[name]() for name in names}
+    write_results('micro', {'benchmark': names}, results, args.output)
+
+
+def flatten(results, prefix=''):
+    '''the numbers of nested results keyed by their dotted path'''
+    numbers = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            numbers.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[prefix + key] = value
+    return numbers
+
+
+# higher is better for these, lower for timings (*_ms) and sizes (*_bytes)
+RATES = ('rps', 'hashes_per_second', 'speedup')
+
+
+def compare(args):
+    '''print the change of every timing and rate, fail on regressions'''
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f'{old["commit"]} -> {new["commit"]}')
+    before = flatten(old['results'])
+    regressions = 0
+    for path, value in sorted(flatten(new['results']).items()):
+        key = path.rsplit('.', 1)[-1]
+        was = before.get(path)
+        if not was or not (key.endswith(('_ms', '_bytes')) or key in RATES):
+            continue
+        change = (value - was) / was * 100
+        worse = -change if key in RATES else change
+        regression = worse > args.threshold
+        regressions += regression
+        print(f'{path:40} {was:>12} {value:>12} {change:+7.1f}%'
+              f'{"  REGRESSION" if regression else ""}')
+    if regressions:
+        raise SystemExit(f'{regressions} regressions over {args.threshold}%')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('seed', help='create the dataset')
+    command.add_argument('--users', type=int, default=100)
+    command.add_argument('--tags-per-user', type=int, default=100)
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--batch-size', type=int, default=5000)
+    command.add_argument('--manifest', default='benchmark-manifest.json')
+    command.set_defaults(func=seed)
+
+    command = commands.add_parser('run', help='drive HTTP load')
+    command.add_argument('--url', default='http://127.0.0.1:8000')
+    command.add_argument('--manifest', default='benchmark-manifest.json')
+    command.add_argument(
+        '--scenario', action='append',
+        choices=sorted(scenarios.SCENARIOS),
+        help='scenario to run, repeatable (default: %s)' %
+        ', '.join(scenarios.DEFAULT))
+    command.add_argument('--concurrency', type=int, default=8)
+    command.add_argument('--requests', type=int, default=2000)
+    command.add_argument(
+        '--duration', type=float,
+        help='seconds per scenario, instead of a request count')
+    command.add_argument('--warmup', type=int, default=100)
+    command.add_argument(
+        '--background', choices=sorted(scenarios.SCENARIOS),
+        help='scenario driven alongside each measured one, e.g. '
+        'login_attack, summarized under "background"')
+    command.add_argument('--background-concurrency', type=int, default=8)
+    command.add_argument(
+        '--background-lead', type=float, default=2,
+        help='seconds the background load runs before measuring')
+    command.add_argument(
+        '--serve', metavar='ARGS', nargs='?', const='',
+        help='start "manage.py serve ARGS" on the url for the run')
+    command.add_argument('--output', help='also write the results here')
+    command.set_defaults(func=run)
+
+    command = commands.add_parser('micro', help='in-process benchmarks')
+    command.add_argument(
+        '--benchmark', action='append',
+        choices=('serializers', 'metrics', 'hashers', 'deletion',
+                 'payloads'))
+    command.add_argument('--output', help='also write the results here')
+    command.set_defaults(func=micro)
+
+    command = commands.add_parser('compare', help='diff two result files')
+    command.add_argument('old')
+    command.add_argument('new')
+    command.add_argument(
+        '--threshold', type=float, default=10,
+        help='percent of slowdown reported as a regression')
+    command.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
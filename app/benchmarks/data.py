@@ -0,0 +1,101 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from core import hashers
+from core.models import AuthToken, Tag, digest_token_key
+
+from recipe.management.commands.generate_tags import tag_names
+
+
+# every benchmark user shares it, so seeding hashes a single password
+PASSWORD = 'benchpass123'
+
+# seeded tokens outlive any benchmark campaign
+TOKEN_TTL = timedelta(days=365)
+
+# the IN lists of a batch stay under the SQLite variable limit
+MAX_USERS_PER_BATCH = 500
+
+
+def email(seed, index):
+    return f'bench-{seed}-{index}@example.com'
+
+
+def seed_batch(seed, start, emails, keys, existing, password, expires_at,
+               tags_per_user, batch_size):
+    '''create the users of a batch that don't exist yet with their tags,
+    and make sure every user of the batch has its token'''
+    User = get_user_model()
+    new = [address for address in emails if address not in existing]
+    User.objects.bulk_create(
+        (User(email=address, name=address.split('@')[0],
+              password=password) for address in new),
+        batch_size=batch_size)
+    ids = dict(User.objects.filter(email__in=emails)
+               .values_list('email', 'id'))
+
+    # keys come from the seed, so existing tokens are found by digest
+    digests = {digest_token_key(key): ids[address]
+               for address, key in zip(emails, keys)}
+    tokens = AuthToken.objects.filter(digest__in=list(digests))
+    found = {bytes(digest) for digest in
+             tokens.values_list('digest', flat=True)}
+    tokens.update(expires_at=expires_at)
+    AuthToken.objects.bulk_create(
+        (AuthToken(digest=digest, user_id=user_id, expires_at=expires_at)
+         for digest, user_id in digests.items() if digest not in found),
+        batch_size=batch_size)
+
+    tags = []
+    for index, address in enumerate(emails, start):
+        if address in existing:
+            continue
+        # names per user, the same whichever batch the seed resumes at
+        names = tag_names(random.Random(f'{seed}:{index}'))
+        tags.extend(Tag(user_id=ids[address], name=next(names))
+                    for _index in range(tags_per_user))
+    Tag.objects.bulk_create(tags, batch_size=batch_size)
+
+
+def seed(users=100, tags_per_user=100, seed=0, batch_size=5000):
+    '''create the dataset of a seed and return its manifest
+
+    the same seed always gives the same users, token keys and tag names.
+    users are created with their token and tags in batches of about
+    batch_size rows, each committed on its own, so a large seed that is
+    interrupted resumes where it stopped: users that already exist are
+    kept as they are. the manifest lists the credentials the load driver
+    authenticates with
+    '''
+    rng = random.Random(seed)
+    emails = [email(seed, index) for index in range(users)]
+    keys = ['%040x' % rng.getrandbits(160) for _email in emails]
+
+    User = get_user_model()
+    prefix = f'bench-{seed}-'
+    existing = set(User.objects.filter(email__startswith=prefix)
+                   .values_list('email', flat=True))
+    password = hashers.make_password(PASSWORD)
+    expires_at = timezone.now() + TOKEN_TTL
+
+    step = max(1, min(MAX_USERS_PER_BATCH,
+                      batch_size // max(1, tags_per_user)))
+    for start in range(0, users, step):
+        with transaction.atomic():
+            seed_batch(
+                seed, start, emails[start:start + step],
+                keys[start:start + step], existing, password, expires_at,
+                tags_per_user, batch_size)
+
+    return {
+        'seed': seed,
+        'tags_per_user': tags_per_user,
+        'users': [
+            {'email': address, 'password': PASSWORD, 'token': key}
+            for address, key in zip(emails, keys)
+        ],
+    }
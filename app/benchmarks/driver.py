@@ -0,0 +1,158 @@
+import collections
+import http.client
+import itertools
+import json
+import math
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class Client:
+    '''a keep-alive HTTP connection, reopened after errors'''
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=()):
+        '''return the status, lowercased headers and body of a request'''
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        return response.status, \
+            {key.lower(): value for key, value in response.getheaders()}, \
+            content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def percentile(ordered, fraction):
+    '''nearest rank percentile of sorted values'''
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, errors, elapsed, statuses=None, sizes=None):
+    '''latency percentiles in milliseconds, the request rate and the mean
+    size of the bodies as sent, before any decompression'''
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    return {
+        'requests': total,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(total / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else None,
+        'mean_bytes': round(sum(sizes) / len(sizes)) if sizes else None,
+        'statuses': {str(status): count
+                     for status, count in sorted((statuses or {}).items(),
+                                                 key=str)},
+    }
+
+
+def run(base_url, scenario, users, concurrency=8, requests=1000,
+        duration=None, warmup=0, stop=None):
+    '''drive a scenario from concurrent threads and summarize it
+
+    threads take request numbers from a shared counter until `requests`
+    are made, or until `duration` seconds passed when it is given. each
+    thread keeps its connection open and cycles through the users. the
+    first `warmup` requests are made but not measured. responses with an
+    unexpected status count as errors. given a `stop` event, it runs until
+    the event is set instead, as background load for another run
+    '''
+    numbers = itertools.count()
+    limit = None if duration or stop else requests + warmup
+    latencies = []
+    sizes = []
+    errors = [0]
+    statuses = collections.Counter()
+    lock = threading.Lock()
+    started = []  # when the first measured request was sent
+    deadline = [None]
+
+    def worker():
+        client = Client(base_url)
+        state = {}
+        own_latencies = []
+        own_sizes = []
+        own_errors = 0
+        own_statuses = collections.Counter()
+        try:
+            while True:
+                number = next(numbers)
+                if limit is not None and number >= limit:
+                    break
+                if stop is not None and stop.is_set():
+                    break
+                if deadline[0] is not None and \
+                        time.perf_counter() > deadline[0]:
+                    break
+                user = users[number % len(users)]
+                method, path, body, headers = scenario.request(user, state)
+                start = time.perf_counter()
+                try:
+                    status, response_headers, content = client.request(
+                        method, path, body, headers)
+                except (OSError, http.client.HTTPException):
+                    status = None
+                latency = time.perf_counter() - start
+                if number < warmup:
+                    continue
+                own_statuses[status] += 1
+                if not started:
+                    with lock:
+                        if not started:
+                            started.append(start)
+                            if duration:
+                                deadline[0] = start + duration
+                if status in scenario.ok:
+                    own_latencies.append(latency)
+                    own_sizes.append(len(content))
+                    scenario.after(
+                        user, state, status, response_headers, content)
+                else:
+                    own_errors += 1
+        finally:
+            client.close()
+            with lock:
+                latencies.extend(own_latencies)
+                sizes.extend(own_sizes)
+                errors[0] += own_errors
+                statuses.update(own_statuses)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started[0] if started else 0
+    return summarize(latencies, errors[0], elapsed, statuses, sizes)
@@ -0,0 +1,202 @@
+import time
+import tracemalloc
+from statistics import median
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import Client, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from core import compression, fastpath, hashers
+from core.models import AuthToken, Tag
+from core.renderers import MessagePackRenderer
+
+from recipe.serializers import TagSerializer
+
+
+class Rollback(Exception):
+    '''leaves the atomic block of a benchmark, undoing its fixtures'''
+
+
+def best(func, repeat):
+    '''median seconds of repeated calls'''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return median(timings)
+
+
+def fixture_user():
+    return get_user_model().objects.create_user(
+        'micro@example.com', 'benchpass123')
+
+
+def serializers(rows=(10, 1000, 100000), repeat=5):
+    '''TagSerializer against the values() fast path, rendered to JSON'''
+    results = {}
+    renderer = JSONRenderer()
+    for count in rows:
+        try:
+            with transaction.atomic():
+                user = fixture_user()
+                Tag.objects.bulk_create(
+                    Tag(user=user, name=f'tag {index}')
+                    for index in range(count))
+                tags = Tag.objects.filter(user=user).order_by('-name')
+                serializer = best(lambda: renderer.render(
+                    TagSerializer(tags.all(), many=True).data), repeat)
+                fast = best(lambda: renderer.render(
+                    list(fastpath.values(tags.all(), TagSerializer))), repeat)
+                raise Rollback
+        except Rollback:
+            pass
+        results[str(count)] = {
+            'serializer_ms': round(serializer * 1000, 3),
+            'fastpath_ms': round(fast * 1000, 3),
+            'speedup': round(serializer / fast, 2),
+        }
+    return results
+
+
+def metrics_overhead(requests=2000, rounds=5):
+    '''per request cost of MetricsMiddleware on /me and the tag list
+
+    rounds alternate with the middleware on and off so drifts of the
+    machine hit both sides alike. the in-process client has no network or
+    WSGI server cost, compare overhead_ms with the latency of a load run
+    '''
+    results = {}
+    try:
+        with transaction.atomic():
+            user = fixture_user()
+            token = AuthToken.objects.issue(user)
+            Tag.objects.bulk_create(
+                Tag(user=user, name=f'tag {index}') for index in range(100))
+            client = Client(
+                HTTP_HOST='localhost', HTTP_AUTHORIZATION='Token ' + token.key)
+            for path in ('/api/user/me/', '/api/recipe/tags/?page_size=100'):
+                timings = {True: [], False: []}
+                for _round in range(rounds):
+                    for enabled in (True, False):
+                        with override_settings(METRICS_ENABLED=enabled):
+                            timings[enabled].append(best(
+                                lambda: client.get(path), requests) * 1000)
+                on, off = median(timings[True]), median(timings[False])
+                results[path] = {
+                    'enabled_ms': round(on, 4),
+                    'disabled_ms': round(off, 4),
+                    'overhead_ms': round(on - off, 4),
+                    'overhead_pct': round((on - off) / off * 100, 2),
+                }
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+def password_hashing(iterations=(36000, 120000, 260000),
+                     pool_sizes=(0, 2, 4), passwords=32):
+    '''password hashes per second by work factor and hashing pool size'''
+    results = {}
+    for count in iterations:
+        for size in pool_sizes:
+            with override_settings(PASSWORD_HASH_ITERATIONS=count,
+                                   PASSWORD_HASHING_POOL_SIZE=size):
+                hashers.make_passwords(['warm'] * size)  # start the workers
+                start = time.perf_counter()
+                hashers.make_passwords(['benchpass123'] * passwords)
+                seconds = time.perf_counter() - start
+                hashers.shutdown_pool()  # joined before the next size
+            results[f'{count}/{size}'] = {
+                'iterations': count,
+                'pool_size': size,
+                'hashes_per_second': round(passwords / seconds, 1),
+            }
+    return results
+
+
+def user_deletion(rows=(1000, 10000, 100000), batch_size=1000):
+    '''time and peak Python memory of deleting a user with many tags,
+    User.purge() against the collector of a plain delete(). DEBUG is off,
+    the query log would grow with the number of batches'''
+    results = {}
+    for count in rows:
+        for method in ('purge', 'delete'):
+            try:
+                with transaction.atomic(), override_settings(DEBUG=False):
+                    user = fixture_user()
+                    for start in range(0, count, 10000):
+                        Tag.objects.bulk_create(
+                            Tag(user=user, name=f'tag {index % 500}')
+                            for index in range(start, min(start + 10000,
+                                                          count)))
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    if method == 'purge':
+                        user.purge(batch_size)
+                    else:
+                        user.delete()
+                    seconds = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    raise Rollback
+            except Rollback:
+                pass
+            results[f'{count}/{method}'] = {
+                'tags': count,
+                'total_ms': round(seconds * 1000, 3),
+                'peak_kb': round(peak / 1024, 1),
+            }
+    return results
+
+
+def payloads(rows=(10, 100, 1000, 10000), repeat=5):
+    '''bytes and render time of tag lists as JSON and MessagePack, and
+    of compressing the JSON with gzip and, when installed, brotli'''
+    results = {}
+    renderers = {'json': JSONRenderer(), 'msgpack': MessagePackRenderer()}
+    encodings = ['gzip'] + (['br'] if compression.brotli else [])
+    for count in rows:
+        try:
+            with transaction.atomic():
+                user = fixture_user()
+                Tag.objects.bulk_create(
+                    Tag(user=user, name=f'tag {index}')
+                    for index in range(count))
+                data = list(fastpath.values(
+                    Tag.objects.filter(user=user).order_by('-name'),
+                    TagSerializer))
+                raise Rollback
+        except Rollback:
+            pass
+        for name, renderer in renderers.items():
+            content = renderer.render(data)
+            results[f'{count}/{name}'] = {
+                'rows': count,
+                'raw_bytes': len(content),
+                'render_ms': round(
+                    best(lambda: renderer.render(data), repeat) * 1000, 3),
+            }
+        content = renderers['json'].render(data)
+        for encoding in encodings:
+            compressed = compression.compress(encoding, content)
+            results[f'{count}/json+{encoding}'] = {
+                'rows': count,
+                'raw_bytes': len(content),
+                'compressed_bytes': len(compressed),
+                'ratio': round(len(content) / len(compressed), 2),
+                'compress_ms': round(best(lambda: compression.compress(
+                    encoding, content), repeat) * 1000, 3),
+            }
+    return results
+
+
+BENCHMARKS = {
+    'serializers': serializers,
+    'metrics': metrics_overhead,
+    'hashers': password_hashing,
+    'deletion': user_deletion,
+    'payloads': payloads,
+}
@@ -0,0 +1,178 @@
+import json
+import uuid
+
+
+class Scenario:
+    '''one kind of request, built for a benchmark user
+
+    state is private to the driver thread, scenarios keep what they need
+    between requests there (an ETag, a cursor)
+    '''
+    name = None
+    ok = (200, )
+
+    def request(self, user, state):
+        '''return the method, path, JSON body or None and extra headers'''
+        raise NotImplementedError
+
+    def after(self, user, state, status, headers, body):
+        '''look at the response, for scenarios that chain requests'''
+
+
+def token_auth(user):
+    return {'Authorization': 'Token ' + user['token']}
+
+
+class Login(Scenario):
+    '''token login, dominated by the password hash'''
+    name = 'login'
+
+    def request(self, user, state):
+        return 'POST', '/api/user/token/', \
+            {'email': user['email'], 'password': user['password']}, {}
+
+
+class LoginAttack(Scenario):
+    '''password guessing against the benchmark accounts from one address,
+    answered 400 until the throttles answer 429'''
+    name = 'login_attack'
+    ok = (400, 429)
+
+    def request(self, user, state):
+        state['guesses'] = state.get('guesses', 0) + 1
+        guess = 'guess%d' % state['guesses']
+        return 'POST', '/api/user/token/', \
+            {'email': user['email'], 'password': guess}, {}
+
+
+class Signup(Scenario):
+    '''new user, hashing, inserting it and queueing its welcome email'''
+    name = 'signup'
+    ok = (201, )
+
+    def request(self, user, state):
+        address = f'signup-{uuid.uuid4().hex}@example.com'
+        return 'POST', '/api/user/create/', \
+            {'email': address, 'password': 'benchpass123', 'name': 'bench'}, {}
+
+
+class MeRead(Scenario):
+    '''profile read with a token'''
+    name = 'me_read'
+
+    def request(self, user, state):
+        return 'GET', '/api/user/me/', None, token_auth(user)
+
+
+class MeRevalidate(Scenario):
+    '''profile poll with If-None-Match, answered 304'''
+    name = 'me_revalidate'
+    ok = (200, 304)
+
+    def request(self, user, state):
+        headers = token_auth(user)
+        etag = state.get(('me', user['email']))
+        if etag:
+            headers['If-None-Match'] = etag
+        return 'GET', '/api/user/me/', None, headers
+
+    def after(self, user, state, status, headers, body):
+        if 'etag' in headers:
+            state[('me', user['email'])] = headers['etag']
+
+
+class MeUpdate(Scenario):
+    '''profile name change, one UPDATE'''
+    name = 'me_update'
+
+    def request(self, user, state):
+        state['updates'] = state.get('updates', 0) + 1
+        return 'PATCH', '/api/user/me/', \
+            {'name': 'bench %d' % state['updates']}, token_auth(user)
+
+
+class TagList(Scenario):
+    '''first page of the tag list'''
+    name = 'tag_list'
+
+    def request(self, user, state):
+        return 'GET', '/api/recipe/tags/', None, token_auth(user)
+
+
+class TagListMessagePack(Scenario):
+    '''first page of the tag list rendered as MessagePack'''
+    name = 'tag_list_msgpack'
+
+    def request(self, user, state):
+        headers = token_auth(user)
+        headers['Accept'] = 'application/msgpack'
+        return 'GET', '/api/recipe/tags/', None, headers
+
+
+class TagListCompressed(Scenario):
+    '''first page of the tag list from a client accepting brotli and gzip'''
+    name = 'tag_list_compressed'
+
+    def request(self, user, state):
+        headers = token_auth(user)
+        headers['Accept-Encoding'] = 'br, gzip'
+        return 'GET', '/api/recipe/tags/?page_size=100', None, headers
+
+
+class TagListPages(Scenario):
+    '''walks every page of the tag list following the cursor'''
+    name = 'tag_list_pages'
+
+    def request(self, user, state):
+        path = state.get(('next', user['email'])) or '/api/recipe/tags/'
+        return 'GET', path, None, token_auth(user)
+
+    def after(self, user, state, status, headers, body):
+        following = json.loads(body).get('next') if status == 200 else None
+        if following:  # keep the path, the host is the server's own
+            following = following[following.index('/api/'):]
+        state[('next', user['email'])] = following
+
+
+class TagSearch(Scenario):
+    '''substring search over the tag names'''
+    name = 'tag_search'
+    terms = ('vegan', 'curry', 'summer', 'spicy', 'quick')
+
+    def request(self, user, state):
+        state['searches'] = state.get('searches', 0) + 1
+        term = self.terms[state['searches'] % len(self.terms)]
+        return 'GET', '/api/recipe/tags/?search=' + term, None, \
+            token_auth(user)
+
+
+class TagAutocomplete(Scenario):
+    '''prefix suggestions'''
+    name = 'tag_autocomplete'
+    prefixes = ('ve', 'cu', 'su', 'sp', 'qu', 'gr')
+
+    def request(self, user, state):
+        state['completions'] = state.get('completions', 0) + 1
+        prefix = self.prefixes[state['completions'] % len(self.prefixes)]
+        return 'GET', '/api/recipe/tags/autocomplete/?q=' + prefix, None, \
+            token_auth(user)
+
+
+class TagExport(Scenario):
+    '''every tag of the user, streamed'''
+    name = 'tag_export'
+
+    def request(self, user, state):
+        return 'GET', '/api/recipe/tags/export/', None, token_auth(user)
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        Login(), LoginAttack(), Signup(), MeRead(), MeRevalidate(),
+        MeUpdate(), TagList(), TagListMessagePack(), TagListCompressed(),
+        TagListPages(), TagSearch(), TagAutocomplete(), TagExport(),
+    )
+}
+
+# run when no scenario is named
+DEFAULT = ('login', 'me_read', 'me_update', 'tag_list')
@@ -3,12 +3,16 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 
 from core import models
+from core.changelist import ScalableAdminMixin
 
 
-class UserAdmin(BaseUserAdmin):  # extend default django UserAdmin
-    # list email, name and order by id
+class UserAdmin(ScalableAdminMixin, BaseUserAdmin):  # extend UserAdmin
+    # list email, name and order by id, paged by id
     ordering = ['id']
     list_display = ['email', 'name']
+    list_filter = ['is_active', 'is_staff']
+    # trigram indexed on postgresql, see migration 0012
+    search_fields = ['email', 'name']
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name', )}),
@@ -25,6 +29,40 @@ class UserAdmin(BaseUserAdmin):  # extend default django UserAdmin
         }),
     )
 
+    # deleting deactivates, a purge_user task removes the rows in batches
+    def get_deleted_objects(self, objs, request):
+        '''list the users only, instead of collecting every tag'''
+        objs = list(objs)
+        opts = self.model._meta
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(opts.verbose_name)
+        return [str(obj) for obj in objs], \
+            {opts.verbose_name_plural: len(objs)}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        obj.deactivate()
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            user.deactivate()
+
+
+class TagAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # newest first, the name comes annotated by Tag.objects
+    ordering = ['-id']
+    list_display = ['__str__', 'user', 'updated_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'tag_name']
+    search_fields = ['tag_name__name', 'user__email']
+
+
+class TagNameAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    ordering = ['id']
+    list_display = ['name', 'key']
+    search_fields = ['name']
+
 
 admin.site.register(models.User, UserAdmin)  # UserAdmin page to User model
-admin.site.register(models.Tag)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.TagName, TagNameAdmin)
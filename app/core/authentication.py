@@ -0,0 +1,183 @@
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import LRUCache
+from core.models import AuthToken, digest_token_key
+
+
+class TokenCache:
+    '''two tier token digest -> (user, token) cache
+
+    a bounded in-process LRU tier answers most lookups, an optional django
+    cache alias (shared between worker processes) sits behind it. values
+    are pickled so every request gets its own copy of the user object.
+
+    the local tier of one worker can't see writes handled by another, so
+    every hit is checked against the stamp alias, shared by the workers:
+    it holds the updated_at of each user's last saved change and the
+    tokens deleted since. a cached user older than its stamp, or a
+    revoked token, is a miss
+    '''
+    key_prefix = 'auth-token:'
+    stamp_prefix = 'auth-user-stamp:'
+    revoked_prefix = 'auth-token-revoked:'
+
+    def __init__(self, max_size, ttl, shared_alias=None, shared_ttl=None,
+                 stamp_alias=None):
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl
+        self.stamp_alias = stamp_alias
+        self.shared_hits = 0
+        self.stale_hits = 0
+
+    @property
+    def shared(self):
+        if self.shared_alias is None:
+            return None
+        return caches[self.shared_alias]
+
+    @property
+    def stamps(self):
+        if self.stamp_alias is None:
+            return None
+        return caches[self.stamp_alias]
+
+    def get(self, key):
+        '''return the cached (user, token) pair or None'''
+        data = self.local.get(key)
+        if data is None and self.shared is not None:
+            data = self.shared.get(self.key_prefix + key)
+            if data is not None:
+                self.shared_hits += 1
+                self.local.set(key, data)  # promote to the local tier
+        if data is None:
+            return None
+        user, token = pickle.loads(data)
+        if not self.current(key, user):
+            self.stale_hits += 1
+            self.invalidate(key)
+            return None
+        return user, token
+
+    def current(self, key, user):
+        '''whether a cached pair still holds, whichever worker wrote since'''
+        if self.stamps is None:
+            return True
+        stamp_key = self.stamp_prefix + str(user.pk)
+        revoked_key = self.revoked_prefix + key
+        stamps = self.stamps.get_many([stamp_key, revoked_key])
+        return revoked_key not in stamps and \
+            stamps.get(stamp_key) == user.updated_at
+
+    def set(self, key, user, token):
+        '''cache the pair in every tier, read from the database'''
+        data = pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, data)
+        if self.shared is not None:
+            self.shared.set(self.key_prefix + key, data, self.shared_ttl)
+        if self.stamps is not None:
+            # a newer stamp means a change committed since the row was read
+            stamp = self.stamps.get(self.stamp_prefix + str(user.pk))
+            if stamp is None or stamp < user.updated_at:
+                self.user_changed(user.pk, user.updated_at)
+
+    def user_changed(self, user_id, updated_at):
+        '''stamp a committed change, older cached copies become misses'''
+        if self.stamps is not None:
+            self.stamps.set(self.stamp_prefix + str(user_id), updated_at, None)
+
+    def revoke(self, key):
+        '''drop a deleted token, from the local tiers of every worker too'''
+        self.invalidate(key)
+        if self.stamps is not None:
+            # local entries are gone after their ttl, and so is this
+            self.stamps.set(self.revoked_prefix + key, True, self.local.ttl)
+
+    def invalidate(self, *keys):
+        '''drop token keys from every tier'''
+        for key in keys:
+            self.local.delete(key)
+            if self.shared is not None:
+                self.shared.delete(self.key_prefix + key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared_hits = self.stale_hits = 0
+
+    def stats(self):
+        '''return hit, miss and eviction counters for dashboards'''
+        stats = self.local.stats()
+        stats['shared_hits'] = self.shared_hits
+        stats['stale_hits'] = self.stale_hits
+        # a local miss answered by the shared tier is not a real miss,
+        # a stale hit is one
+        stats['misses'] += self.stale_hits - self.shared_hits
+        stats['hits'] -= self.stale_hits
+        return stats
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    '''return the process wide token cache, built from the settings'''
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(
+            max_size=settings.TOKEN_CACHE_MAX_SIZE,
+            ttl=settings.TOKEN_CACHE_TTL,
+            shared_alias=settings.TOKEN_CACHE_SHARED_ALIAS,
+            shared_ttl=settings.TOKEN_CACHE_SHARED_TTL,
+            stamp_alias=settings.TOKEN_CACHE_STAMP_ALIAS,
+        )
+    return _token_cache
+
+
+def token_cache_stats():
+    '''counters of the token cache, for monitoring'''
+    return get_token_cache().stats()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''TokenAuthentication over expiring AuthTokens, with a cache in front
+
+    a miss is one query probing the key digest, joined to the user and
+    checking the expiry. hits check the expiry in memory and the stamps
+    of the user and token in the stamp cache
+    '''
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        cache_key = digest_token_key(key).hex()
+        cache = get_token_cache()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user, token = cached
+        else:
+            # cache misses (and invalid keys) go to the database
+            try:
+                token = AuthToken.objects.select_related('user').get(
+                    digest=digest_token_key(key),
+                    expires_at__gt=timezone.now())
+            except AuthToken.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            cache.set(cache_key, user, token)
+
+        if token.expired:
+            cache.invalidate(cache_key)
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        return (user, token)
@@ -0,0 +1,185 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class LRUCache:
+    '''bounded, thread safe least recently used cache with a time to live'''
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl  # seconds, None to keep entries until evicted
+        self._data = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        '''return the cached value and mark it as recently used'''
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        '''store a value, evicting the least recently used ones if full'''
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        '''drop a key, return True when it was cached'''
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        '''drop every entry and reset the counters'''
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        '''return counters for monitoring'''
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class SharedCounters:
+    '''expiring counters in a file that every worker process maps
+
+    a fixed table of `slots` entries, so memory stays bounded. a key
+    hashes to a slot and probes the next few, taking its own, a free or
+    expired one, or else the one expiring first. reads and increments
+    happen under locked(), flock() across processes and a lock across
+    threads, and an increment keeps the expiry its counter was created
+    with
+    '''
+    # key hash, expires at (epoch seconds), count
+    SLOT = struct.Struct('<QdI4x')
+    PROBES = 8
+
+    def __init__(self, path, slots=100000):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        # forked workers map the file again with their own descriptor
+        size = self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def locked(self):
+        '''hold the table for a sequence of reads and increments'''
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _find(self, key, now):
+        '''the slot of a live key or the one to put it in, and its count'''
+        digest = int.from_bytes(hashlib.blake2b(
+            key.encode(), digest_size=8).digest(), 'big') or 1
+        start = digest % self.slots
+        victim = None
+        for probe in range(self.PROBES):
+            index = (start + probe) % self.slots
+            stored, expires, count = self.SLOT.unpack_from(
+                self._map, index * self.SLOT.size)
+            if stored == digest and expires > now:
+                return index, digest, expires, count
+            if victim is None or expires < victim[1]:
+                victim = (index, expires)
+        return victim[0], digest, None, 0
+
+    def get(self, key, now):
+        '''the count of a key, 0 once expired. call under locked()'''
+        return self._find(key, now)[3]
+
+    def incr(self, key, expires, now):
+        '''add one to a key, a new counter expires at `expires`. call
+        under locked()'''
+        index, digest, current, count = self._find(key, now)
+        self.SLOT.pack_into(
+            self._map, index * self.SLOT.size, digest,
+            expires if current is None else current, count + 1)
+        return count + 1
+
+    def clear(self):
+        with self.locked():
+            self._map[:] = bytes(len(self._map))
+
+
+class ExpiringFileBasedCache(FileBasedCache):
+    '''a FileBasedCache that only ever deletes expired entries
+
+    the stock backend deletes a random third of its files once it holds
+    MAX_ENTRIES, live or not, so a stamp or marker could vanish before its
+    timeout. here entries stay until they expire, and instead of listing
+    the directory on every set the expired files are swept at most every
+    SWEEP_INTERVAL seconds (OPTIONS, default 300). size it with the
+    timeouts, entries without one stay until deleted
+    '''
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._sweep_interval = params.get('OPTIONS', {}).get(
+            'SWEEP_INTERVAL', 300)
+        self._swept = time.monotonic()
+
+    def _cull(self):
+        now = time.monotonic()
+        if now - self._swept < self._sweep_interval:
+            return
+        self._swept = now
+        for fname in self._list_cache_files():
+            try:
+                with open(fname, 'rb') as f:
+                    self._is_expired(f)  # deletes the file when expired
+            except FileNotFoundError:
+                pass  # deleted by another process
@@ -0,0 +1,135 @@
+import json
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+CURSOR_VAR = 'after'
+
+
+def estimate_count(queryset):
+    '''rows the postgresql planner expects the queryset to return'''
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    '''paginator counting from planner statistics on postgresql
+
+    the estimate comes from EXPLAIN, so filters and searches are
+    estimated too. below ADMIN_EXACT_COUNT_LIMIT rows, where COUNT(*) is
+    cheap, and on other backends the count is exact
+    '''
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimate_count(queryset)
+            if estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                self.estimated = True
+                return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    '''changelist paging past the primary key of the last row shown
+
+    ordered by primary key alone (the admin default), ?after=<pk> seeks
+    on the index rather than scanning the rows of an OFFSET, so a deep
+    page costs what the first one does. pages are next/first links
+    instead of numbers. other orderings, "show all" and editable lists
+    are paged by number as usual
+    '''
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset = False
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # sorting, filtering or searching starts from the first page
+        remove = [CURSOR_VAR] + list(remove or [])
+        return super().get_query_string(new_params, remove)
+
+    def keyset_ordering(self):
+        '''the primary key ordering of the list, None if not ordered so'''
+        pk = self.lookup_opts.pk.name
+        # the admin ordering can come twice, from the queryset and the list
+        ordering = {
+            field.replace(pk, 'pk') if field.lstrip('-') == pk else field
+            for field in self.queryset.query.order_by}
+        if len(ordering) == 1 and ordering <= {'pk', '-pk'}:
+            return ordering.pop()
+        return None
+
+    def get_results(self, request):
+        ordering = self.keyset_ordering()
+        if ordering is None or self.show_all or self.list_editable:
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if self.cursor is not None:
+            try:
+                cursor = self.lookup_opts.pk.to_python(self.cursor)
+            except ValidationError:
+                raise IncorrectLookupParameters
+            lookup = 'pk__lt' if ordering.startswith('-') else 'pk__gt'
+            queryset = queryset.filter(**{lookup: cursor})
+        # one extra row tells whether there is a next page
+        result_list = list(queryset[:self.list_per_page + 1])
+        if len(result_list) > self.list_per_page:
+            result_list = result_list[:self.list_per_page]
+            self.next_cursor = result_list[-1].pk
+
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page)
+        show_full_result_count = self.model_admin.show_full_result_count
+        full_result_count = self.root_queryset.count() \
+            if show_full_result_count else None
+
+        self.keyset = True
+        self.result_count = paginator.count
+        self.show_full_result_count = show_full_result_count
+        self.show_admin_actions = \
+            not show_full_result_count or bool(full_result_count)
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = False  # no numbered links
+        self.paginator = paginator
+
+    def first_page_url(self):
+        return self.get_query_string()
+
+    def next_page_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class ScalableAdminMixin:
+    '''changelist of a large table: estimated counts, keyset pages and no
+    second COUNT(*) of the unfiltered table'''
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
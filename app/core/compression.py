@@ -0,0 +1,80 @@
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # optional, responses are gzipped without it
+    brotli = None
+
+
+def accepted_encodings(header):
+    '''the content codings of an Accept-Encoding header and their q'''
+    encodings = {}
+    for part in header.split(','):
+        coding, _sep, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _sep, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[coding] = q
+    return encodings
+
+
+def choose_encoding(header):
+    '''br or gzip, whichever the client accepts and prefers, else None'''
+    encodings = accepted_encodings(header)
+    default = encodings.get('*', 0.0)
+    available = ('br', 'gzip') if brotli is not None else ('gzip', )
+    # brotli wins ties, it is smaller at the same speed
+    best = max(available, key=lambda coding: encodings.get(coding, default))
+    if encodings.get(best, default) <= 0:
+        return None
+    return best
+
+
+class Compressor:
+    '''incremental compression in one of the supported codings'''
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self.brotli = brotli.Compressor(
+                quality=settings.COMPRESSION_BROTLI_QUALITY)
+            self.zlib = None
+        else:
+            self.brotli = None
+            self.zlib = zlib.compressobj(
+                settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED,
+                16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.brotli is not None:
+            return self.brotli.process(data)
+        return self.zlib.compress(data)
+
+    def finish(self):
+        if self.brotli is not None:
+            return self.brotli.finish()
+        return self.zlib.flush()
+
+
+def compress(encoding, data):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(encoding, chunks):
+    '''compress chunks as they come, holding only the compressor state'''
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
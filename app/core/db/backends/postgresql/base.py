@@ -0,0 +1,76 @@
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.db.pool import ConnectionPool, get_pool
+
+
+def ping(connection):
+    '''raise if the server no longer answers on this connection'''
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def reset(connection):
+    '''roll back whatever a request left open before pooling again'''
+    status = connection.get_transaction_status()
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''postgresql backend with health checks and an optional pool
+
+    with HEALTH_CHECKS set, a persistent connection is pinged once per
+    request before it is reused. with POOL['ENABLED'] set, connections
+    come from an in-process pool and go back to it when django closes
+    them, so keep CONN_MAX_AGE at 0 to release them after every request
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool_settings(self):
+        return self.settings_dict.get('POOL') or {}
+
+    def get_pool(self, conn_params):
+        options = self.pool_settings
+        return get_pool(self.alias, lambda: ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params),
+            size=options.get('SIZE', 5),
+            max_overflow=options.get('MAX_OVERFLOW', 10),
+            timeout=options.get('TIMEOUT', 30),
+            recycle=options.get('RECYCLE'),
+            ping=ping if options.get('PRE_PING', True) else None,
+            reset=reset,
+        ))
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_settings.get('ENABLED'):
+            return super().get_new_connection(conn_params)
+        return self.get_pool(conn_params).acquire()
+
+    def _close(self):
+        if self.connection is None or not self.pool_settings.get('ENABLED'):
+            return super()._close()
+        with self.wrap_database_errors:
+            pool = self.get_pool(self.get_connection_params())
+            pool.release(self.connection, discard=self.errors_occurred)
+
+    def ensure_connection(self):
+        '''ping a reused connection once per request when enabled'''
+        if (self.connection is not None and
+                self.settings_dict.get('HEALTH_CHECKS') and
+                not self.health_check_done and
+                not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+        self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # runs at the start and the end of every request
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
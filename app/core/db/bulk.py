@@ -0,0 +1,19 @@
+from django.db import models
+
+
+def raw_delete(queryset):
+    '''delete the rows of queryset in one DELETE, return how many
+
+    unlike queryset.delete() no rows are loaded, no pre_delete/post_delete
+    signals are sent and nothing cascades, so callers invalidate caches
+    themselves. only for models nothing points to, others raise ValueError
+    rather than leave dangling rows. wraps QuerySet._raw_delete, which is
+    private Django API, so it is used here only
+    '''
+    model = queryset.model
+    dependants = [relation for relation in model._meta.related_objects
+                  if relation.on_delete is not models.DO_NOTHING]
+    if dependants:
+        raise ValueError(
+            f'{model.__name__} rows have dependants, use delete()')
+    return queryset._raw_delete(queryset.db)
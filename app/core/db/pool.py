@@ -0,0 +1,176 @@
+import os
+import queue
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    '''no connection became available within the acquire timeout'''
+
+
+class ConnectionPool:
+    '''in-process pool of raw DB-API connections
+
+    keeps up to `size` idle connections for reuse and lets up to
+    `max_overflow` extra connections be opened under load; those are
+    closed instead of pooled when released. callers wait at most
+    `timeout` seconds for a connection when the pool is exhausted
+    '''
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=30,
+                 recycle=None, ping=None, reset=None):
+        self._connect = connect  # opens a new raw connection
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle  # seconds a connection may live, or None
+        self._ping = ping  # raises when a connection is unusable
+        self._reset = reset  # cleans a connection up before reuse
+        self._idle = queue.LifoQueue()  # hot connections are reused first
+        self._opened_at = {}  # id(connection) -> time it was opened
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self.stats_counters = {
+            'connects': 0,
+            'reuses': 0,
+            'closes': 0,
+            'failed_pings': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def acquire(self):
+        '''return a healthy connection, opening one if allowed'''
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = None
+                with self._lock:
+                    can_open = self._open < self.size + self.max_overflow
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    return self._open_connection()
+                remaining = deadline - time.monotonic()
+                if not waited:
+                    self._count('waits')
+                    waited = True
+                try:
+                    connection = self._idle.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    self._count('timeouts')
+                    raise PoolTimeout(
+                        'No connection available within %ss' % self.timeout)
+
+            if self._is_healthy(connection):
+                with self._lock:
+                    self._in_use += 1
+                self._count('reuses')
+                return connection
+            self._discard(connection)
+
+    def release(self, connection, discard=False):
+        '''give a connection back, closing it if broken or surplus'''
+        with self._lock:
+            self._in_use -= 1
+        if not discard and self._reset is not None:
+            try:
+                self._reset(connection)
+            except Exception:
+                discard = True
+        if discard or self._idle.qsize() >= self.size:
+            self._discard(connection)
+        else:
+            self._idle.put(connection)
+
+    def close(self):
+        '''close every idle connection'''
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self):
+        '''return gauges and counters for monitoring'''
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+            })
+        return stats
+
+    def _open_connection(self):
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        with self._lock:
+            self._opened_at[id(connection)] = time.monotonic()
+            self._in_use += 1
+        self._count('connects')
+        return connection
+
+    def _is_healthy(self, connection):
+        opened_at = self._opened_at.get(id(connection), 0)
+        if self.recycle is not None and \
+                time.monotonic() - opened_at >= self.recycle:
+            return False
+        if self._ping is None:
+            return True
+        try:
+            self._ping(connection)
+        except Exception:
+            self._count('failed_pings')
+            return False
+        return True
+
+    def _discard(self, connection):
+        with self._lock:
+            self._open -= 1
+            self._opened_at.pop(id(connection), None)
+        self._count('closes')
+        try:
+            connection.close()
+        except Exception:
+            pass  # it is being thrown away anyway
+
+    def _count(self, name):
+        with self._lock:
+            self.stats_counters[name] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def get_pool(alias, factory):
+    '''return the pool of a database alias, building it with factory
+
+    pools are per process: a forked worker never reuses sockets opened by
+    its parent
+    '''
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if alias not in _pools:
+            _pools[alias] = factory()
+        return _pools[alias]
+
+
+def pool_stats():
+    '''return the stats of every pool of this process, by alias'''
+    return {alias: pool.stats() for alias, pool in list(_pools.items())}
@@ -0,0 +1,47 @@
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, \
+    parse_http_date_safe
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    '''build a quoted strong ETag from the parts identifying a response'''
+    value = ':'.join(str(part) for part in parts)
+    return '"%s"' % hashlib.md5(value.encode()).hexdigest()
+
+
+def not_modified(request, etag, last_modified=None):
+    '''return a 304 response if the client already has this version'''
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        # the ETag takes precedence over the date when both are sent.
+        # compared weakly, compressed responses carry it as W/"..."
+        etags = [tag[2:] if tag.startswith('W/') else tag
+                 for tag in parse_etags(if_none_match)]
+        matches = etag in etags or if_none_match.strip() == '*'
+    elif last_modified is not None:
+        since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        matches = since is not None and \
+            int(last_modified.timestamp()) <= since
+    else:
+        matches = False
+
+    if not matches:
+        return None
+    return set_validators(
+        Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    '''set the ETag and Last-Modified headers of a response'''
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # clients may keep the body but must revalidate it on every use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+
+
+# model fields whose python value is exactly what DRF would output
+PLAIN_FIELDS = (
+    models.AutoField,
+    models.BooleanField,
+    models.CharField,  # includes EmailField
+    models.IntegerField,
+    models.TextField,
+)
+
+# declared serializer fields that output the python value unchanged, the
+# queryset has to provide their name as a field or an annotation
+PLAIN_SERIALIZER_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+)
+
+
+def plain_serializer_field(field):
+    '''whether a declared field is, or outputs like, a plain field
+
+    subclasses count when they keep the to_representation, e.g. fields
+    only cleaning their input
+    '''
+    return any(type(field).to_representation is plain.to_representation
+               for plain in PLAIN_SERIALIZER_FIELDS)
+
+
+@lru_cache(maxsize=None)
+def readable_fields(serializer_class):
+    '''return the names of the fields a ModelSerializer outputs, in order
+
+    the serializer stays the declared schema of the response. only plain
+    model fields and plain declared fields without a source are supported,
+    anything DRF would convert is refused
+    '''
+    meta = serializer_class.Meta
+    declared = serializer_class._declared_fields
+    extra_kwargs = getattr(meta, 'extra_kwargs', {})
+    names = []
+    for name in meta.fields:
+        if name in declared:
+            field = declared[name]
+            if field.write_only:
+                continue
+            if not plain_serializer_field(field) or \
+                    field.source not in (None, name):
+                raise ImproperlyConfigured(
+                    '%s.%s is not a plain field, it has no fast path' %
+                    (serializer_class.__name__, name))
+            names.append(name)
+            continue
+        if extra_kwargs.get(name, {}).get('write_only'):
+            continue
+        field = meta.model._meta.get_field(name)
+        if not isinstance(field, PLAIN_FIELDS):
+            raise ImproperlyConfigured(
+                '%s.%s needs conversion, it has no fast path' %
+                (serializer_class.__name__, name))
+        names.append(name)
+    return tuple(names)
+
+
+def values(queryset, serializer_class):
+    '''return the queryset as dicts holding exactly the serializer output
+
+    rows come straight from the database cursor as tuples, no model
+    instance or serializer field is built for them
+    '''
+    return queryset.values(*readable_fields(serializer_class))
+
+
+def represent(instance, serializer_class):
+    '''return the serializer output for an instance already in memory'''
+    return OrderedDict(
+        (name, getattr(instance, name))
+        for name in readable_fields(serializer_class))
@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class TunablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    '''PBKDF2 hasher with the work factor taken from the settings
+
+    changing PASSWORD_HASH_ITERATIONS makes every stored hash with another
+    count "must update", so it is rehashed on the next successful login
+    '''
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+_pool = None
+_pool_size = 0
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    '''return the hashing process pool, None when hashing runs inline'''
+    global _pool, _pool_size, _pool_slots
+    size = settings.PASSWORD_HASHING_POOL_SIZE
+    if size == _pool_size:
+        return _pool
+    with _pool_lock:
+        if size != _pool_size:  # (re)build after a settings change
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=size) if size else None
+            # bound the backlog so a login storm queues in the workers
+            backlog = size * settings.PASSWORD_HASHING_QUEUE_FACTOR
+            _pool_slots = threading.BoundedSemaphore(backlog or 1)
+            _pool_size = size
+    return _pool
+
+
+def shutdown_pool():
+    '''stop the worker processes, the pool is rebuilt on next use'''
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_size = None, 0
+
+
+def _run(func, *args):
+    '''run a hashing call in the pool, or inline when there is none
+
+    the calling thread waits for the result without holding the GIL, so
+    the other threads of a worker keep serving requests
+    '''
+    pool = get_pool()
+    if pool is None:
+        return func(*args)
+    slots = _pool_slots
+    slots.acquire()
+    try:
+        future = pool.submit(func, *args)
+        return future.result(timeout=settings.PASSWORD_HASHING_TIMEOUT)
+    finally:
+        slots.release()
+
+
+def make_password(password):
+    '''hash a raw password with the preferred hasher'''
+    if password is None:  # unusable password, nothing to compute
+        return hashers.make_password(None)
+    return _run(hashers.make_password, password)
+
+
+def make_passwords(passwords, pool=None, chunksize=64):
+    '''hash many raw passwords, in parallel when a pool is available'''
+    pool = pool or get_pool()
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(hashers.make_password, passwords,
+                         chunksize=chunksize))
+
+
+def must_update(encoded):
+    '''whether a stored hash should be upgraded to the preferred hasher'''
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return (hasher.algorithm != preferred.algorithm or
+            preferred.must_update(encoded))
+
+
+def check_password(password, encoded, setter=None):
+    '''verify a raw password, calling setter when the hash is outdated'''
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    is_correct = _run(hashers.check_password, password, encoded)
+    if setter and is_correct and must_update(encoded):
+        setter(password)
+    return is_correct
@@ -0,0 +1,130 @@
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+# the key csv.DictReader puts the fields of a row past its header under
+EXTRA_COLUMNS = None
+
+
+class Command(BaseCommand):
+    '''Django command to import users in bulk from a CSV or JSONL file'''
+    help = 'Stream users from a CSV or JSONL file into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header) or JSONL file')
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help='input format, guessed from the file extension by default')
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='rows read, hashed and committed together')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='processes hashing passwords, 0 to hash inline')
+        parser.add_argument(
+            '--checkpoint',
+            help='file recording progress, defaults to <path>.checkpoint')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        chunk_size = options['chunk_size']
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+
+        done = self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after row {done}')
+
+        pool = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(max_workers=options['workers'])
+        manager = get_user_model().objects
+        created_total = rejected_total = 0
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = itertools.islice(self.read_rows(f, fmt), done, None)
+                for number in itertools.count(1):
+                    chunk = list(itertools.islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    valid = self.valid_rows(manager, chunk, done)
+                    with transaction.atomic():
+                        created = manager.bulk_create_users(valid, pool=pool)
+                    done += len(chunk)
+                    created_total += len(created)
+                    rejected_total += len(chunk) - len(valid)
+                    self.write_checkpoint(checkpoint, done)
+                    self.stdout.write(
+                        f'Chunk {number}: {len(chunk)} rows, '
+                        f'{len(created)} created, '
+                        f'{len(valid) - len(created)} skipped, '
+                        f'{len(chunk) - len(valid)} rejected '
+                        f'({done} rows done)')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)  # finished, nothing left to resume
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created_total} users from {done} rows, '
+            f'{rejected_total} rejected'))
+
+    def valid_rows(self, manager, chunk, done):
+        '''the importable rows of a chunk, reporting the others by number'''
+        valid = []
+        for line, row in enumerate(chunk, done + 1):
+            if not isinstance(row, dict):
+                self.stderr.write(f'Row {line} rejected: not an object')
+                continue
+            if EXTRA_COLUMNS in row:
+                self.stderr.write(
+                    f'Row {line} rejected: '
+                    f'{len(row[EXTRA_COLUMNS])} extra columns')
+                continue
+            unknown = manager.unknown_import_fields(row)
+            if unknown:
+                self.stderr.write(
+                    f'Row {line} rejected: cannot import '
+                    f'{", ".join(unknown)}')
+                continue
+            valid.append(row)
+        return valid
+
+    def read_rows(self, f, fmt):
+        '''yield the rows of the file as dicts, one at a time'''
+        if fmt == 'csv':
+            # extra fields go under the EXTRA_COLUMNS key, rejected later
+            for row in csv.DictReader(f, restkey=EXTRA_COLUMNS):
+                yield {key: value for key, value in row.items() if value}
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise CommandError(f'Invalid JSON on line {line_number}')
+
+    def read_checkpoint(self, checkpoint):
+        '''return the number of rows already imported'''
+        try:
+            with open(checkpoint) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, checkpoint, done):
+        '''record progress atomically, so a crash never leaves it torn'''
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(done))
+        os.replace(tmp, checkpoint)
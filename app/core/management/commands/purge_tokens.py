@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.db.bulk import raw_delete
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    '''Django command deleting expired API tokens'''
+    help = 'Delete expired tokens in short batches, pausing between them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='tokens deleted per statement and transaction')
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='seconds to pause between batches, sparing the database')
+
+    def handle(self, *args, **options):
+        # tokens expiring while the command runs wait for the next run
+        expired = AuthToken.objects.expired(timezone.now()).order_by()
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('pk', flat=True)
+                       [:options['batch_size']])
+            if not ids:
+                break
+            # no signals, the authentication cache checks the expiry itself
+            with transaction.atomic(using=expired.db):
+                deleted += raw_delete(
+                    AuthToken.objects.using(expired.db).filter(pk__in=ids))
+            if len(ids) < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} tokens deleted'))
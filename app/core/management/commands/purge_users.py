@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    '''Django command deleting deactivated users and their rows
+
+    deactivate() queues a purge_user task for each user, this sweeps up
+    after tasks that failed or were dropped
+    '''
+    help = 'Delete the users deactivated for deletion, tags in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='tags deleted per statement and transaction')
+        parser.add_argument(
+            '--grace', type=float, default=0,
+            help='hours a deactivated user is kept before it is deleted')
+        parser.add_argument(
+            '--limit', type=int,
+            help='users deleted per run, all due ones by default')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options['grace'])
+        users = get_user_model().objects.deactivated(before) \
+            .order_by('deactivated_at')
+        if options['limit'] is not None:
+            users = users[:options['limit']]
+
+        purged = 0
+        # one user at a time, a large account never sits in memory
+        for pk in list(users.values_list('pk', flat=True)):
+            user = get_user_model().objects.get(pk=pk)
+            tags = user.purge(options['batch_size'])
+            purged += 1
+            self.stdout.write(f'Deleted user {pk} and {tags} tags')
+        self.stdout.write(self.style.SUCCESS(f'{purged} users deleted'))
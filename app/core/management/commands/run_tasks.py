@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    '''Django command running the queued tasks'''
+    help = 'Run queued tasks, polling for new ones until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='tasks claimed per poll')
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='seconds between polls when the queue is empty')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='run the due tasks and exit instead of polling')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = tasks.run_pending(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'{done} tasks done, {failed} failed')
+            if options['once']:
+                return
+            close_old_connections()  # honours CONN_MAX_AGE between polls
+            if not done and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,103 @@
+import importlib
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+
+def close_connections(server, worker):
+    '''gunicorn hook, never share database sockets across processes'''
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    '''gunicorn hook, keep the metrics of the exiting worker'''
+    from core import metrics
+
+    connections.close_all()
+    metrics.archive()
+
+
+class GunicornApplication(BaseApplication):
+    '''gunicorn application configured from a dict instead of argv'''
+
+    def __init__(self, app_path, options):
+        self.app_path = app_path
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        module, name = self.app_path.split(':')
+        return getattr(importlib.import_module(module), name)
+
+
+class Command(BaseCommand):
+    '''Django command to run the API with a production server'''
+    help = 'Run the API with a multi-process, multi-threaded gunicorn server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='0.0.0.0:8000')
+        parser.add_argument(
+            '--workers', type=int,
+            default=multiprocessing.cpu_count() * 2 + 1,
+            help='worker processes, 2 x CPU count + 1 by default')
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='threads per worker process')
+        parser.add_argument(
+            '--max-requests', type=int, default=1000,
+            help='recycle a worker after this many requests, 0 to disable')
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=100,
+            help='random extra requests, so workers do not recycle together')
+        parser.add_argument(
+            '--timeout', type=int, default=30,
+            help='seconds before a silent worker is killed and restarted')
+        parser.add_argument(
+            '--graceful-timeout', type=int, default=30,
+            help='seconds workers get to finish requests on shutdown')
+        parser.add_argument(
+            '--no-preload', action='store_false', dest='preload',
+            help='import the app in every worker instead of once')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='serve app.asgi with uvicorn workers (needs uvicorn)')
+
+    def handle(self, *args, **options):
+        app_path = 'app.wsgi:application'
+        worker_class = 'gthread'
+        if options['asgi']:
+            try:
+                importlib.import_module('uvicorn.workers')
+            except ImportError:
+                raise CommandError('--asgi needs uvicorn to be installed')
+            app_path = 'app.asgi:application'
+            worker_class = 'uvicorn.workers.UvicornWorker'
+
+        config = {
+            'bind': options['bind'],
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'worker_class': worker_class,
+            # import once in the master, workers share the pages on fork
+            'preload_app': options['preload'],
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests_jitter'],
+            'timeout': options['timeout'],
+            'graceful_timeout': options['graceful_timeout'],
+            'pre_fork': close_connections,
+            'worker_exit': worker_exit,
+            'accesslog': '-',
+        }
+        self.stdout.write(
+            f"Serving {app_path} on {config['bind']} with "
+            f"{config['workers']} workers x {config['threads']} threads")
+        self.run(app_path, config)
+
+    def run(self, app_path, config):
+        GunicornApplication(app_path, config).run()
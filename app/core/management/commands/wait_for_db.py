@@ -1,21 +1,108 @@
+import functools
+import itertools
+import math
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     '''Django command to pause execution until database is available'''
+    help = 'Wait until every configured database accepts queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='database alias to check, repeatable (default: all)')
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='total seconds to wait before giving up, also bounds the '
+                 'connection attempt of --probe')
+        parser.add_argument(
+            '--base-delay', type=float, default=0.1,
+            help='first retry delay in seconds, doubled on every attempt')
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='upper bound of a single retry delay in seconds')
+        parser.add_argument(
+            '--probe', action='store_true',
+            help='check once and exit with a status code, for health checks')
 
     def handle(self, *args, **options):
-        self.stdout.write('Wating for database...')
-        db_conn = None  # db connection
-        while not db_conn:
+        aliases = options['databases'] or list(settings.DATABASES)
+        self.options = options
+
+        deadline = time.monotonic() + options['timeout']
+        if options['probe']:
+            check = functools.partial(self.check_database, deadline=deadline)
+        else:
+            self.stdout.write('Waiting for database...')
+            check = functools.partial(
+                self.wait_for_database, deadline=deadline)
+
+        # one thread per database, each thread opens its own connection
+        with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+            results = dict(zip(aliases, executor.map(check, aliases)))
+
+        unavailable = [alias for alias, ok in results.items() if not ok]
+        if unavailable:
+            raise CommandError(
+                'Database unavailable: ' + ', '.join(unavailable))
+
+        if not options['probe']:
+            self.stdout.write(self.style.SUCCESS('Database available!'))
+
+    def check_database(self, alias, deadline):
+        '''open a real connection and run a cheap query
+
+        the connection attempt gives up at the deadline, a host dropping
+        packets would otherwise block it for the OS connect timeout
+        '''
+        try:
+            connection = connections[alias]
+            connection.settings_dict = self.probe_settings(
+                connection, deadline)
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, wating 1 second...')
-                time.sleep(1)  # pause execution for a second
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()  # the connection belongs to this thread
+        except OperationalError:
+            return False
+        return True
+
+    def probe_settings(self, connection, deadline):
+        '''the settings of the connection, never pooled and with a connect
+        timeout of the seconds left, for this thread's connection only'''
+        settings_dict = dict(connection.settings_dict)
+        settings_dict['POOL'] = dict(
+            settings_dict.get('POOL') or {}, ENABLED=False)
+        if connection.vendor in ('postgresql', 'mysql'):
+            # whole seconds, at least one, zero would mean no timeout
+            remaining = max(1, math.ceil(deadline - time.monotonic()))
+            settings_dict['OPTIONS'] = dict(
+                settings_dict.get('OPTIONS') or {}, connect_timeout=remaining)
+        return settings_dict
 
-        self.stdout.write(self.style.SUCCESS('Database available!'))
+    def wait_for_database(self, alias, deadline):
+        '''retry with jittered exponential backoff until the deadline'''
+        base, cap = self.options['base_delay'], self.options['max_delay']
+        for attempt in itertools.count():
+            if self.check_database(alias, deadline):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # full jitter keeps many containers from retrying in lockstep,
+            # the exponent is capped, 2.0 ** 1024 overflows a float
+            bound = min(cap, base * 2 ** min(attempt, 32))
+            delay = min(random.uniform(0, bound), remaining)
+            self.stdout.write(
+                f'Database {alias} unavailable, '
+                f'waiting {delay:.2f} seconds...')
+            time.sleep(delay)  # pause execution before the next attempt
@@ -0,0 +1,272 @@
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+
+# request and database time buckets in seconds, query count buckets
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    '''counts of observations per bucket, with their sum
+
+    observing is a bisect and two additions under a lock, buckets are
+    only made cumulative when rendered
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        '''return the cumulative bucket counts and the sum'''
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+
+class HistogramFamily:
+    '''a histogram per view, rendered in the Prometheus text format'''
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, view):
+        histogram = self.histograms.get(view)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(
+                    view, Histogram(self.buckets))
+        return histogram
+
+    def snapshot(self):
+        '''view -> (cumulative counts, sum) of this process'''
+        with self._lock:
+            histograms = dict(self.histograms)
+        return {view: histogram.snapshot()
+                for view, histogram in histograms.items()}
+
+    def render(self, series):
+        '''the text format of view -> (cumulative counts, sum)'''
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        bounds = [repr(float(bound)) for bound in self.buckets]
+        for view, (counts, total) in sorted(series.items()):
+            label = f'view="{escape(view)}"'
+            for bound, count in zip(bounds + ['+Inf'], counts):
+                yield f'{self.name}_bucket{{{label},le="{bound}"}} {count}'
+            yield f'{self.name}_sum{{{label}}} {total}'
+            yield f'{self.name}_count{{{label}}} {counts[-1]}'
+
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+REQUEST_SECONDS = HistogramFamily(
+    'http_request_duration_seconds', 'Time spent handling requests.',
+    DURATION_BUCKETS)
+DB_SECONDS = HistogramFamily(
+    'http_request_db_seconds', 'Time spent in SQL queries per request.',
+    DURATION_BUCKETS)
+DB_QUERIES = HistogramFamily(
+    'http_request_db_queries', 'SQL queries executed per request.',
+    QUERY_BUCKETS)
+# the serializers run in the views, their time is in the request duration
+RENDER_SECONDS = HistogramFamily(
+    'http_response_render_seconds',
+    'Time spent rendering response data to its media type.',
+    DURATION_BUCKETS)
+
+FAMILIES = (REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, RENDER_SECONDS)
+
+
+def observe_request(view, seconds, queries, db_seconds, render_seconds):
+    '''record the measurements of one request'''
+    REQUEST_SECONDS.labels(view).observe(seconds)
+    DB_SECONDS.labels(view).observe(db_seconds)
+    DB_QUERIES.labels(view).observe(queries)
+    if render_seconds is not None:
+        RENDER_SECONDS.labels(view).observe(render_seconds)
+
+
+def gauges(name, documentation, stats, label=None):
+    '''render dicts of stats as gauges named <name>_<key>
+
+    stats is a dict of values, or with a label name a dict of label value
+    to a dict of values
+    '''
+    series = {None: stats} if label is None else stats
+    keys = sorted({key for values in series.values() for key in values})
+    for key in keys:
+        yield f'# HELP {name}_{key} {documentation}'
+        yield f'# TYPE {name}_{key} gauge'
+        for label_value, values in sorted(series.items()):
+            if key not in values:
+                continue
+            labels = '' if label is None else \
+                f'{{{label}="{escape(label_value)}"}}'
+            yield f'{name}_{key}{labels} {values[key]}'
+
+
+# token cache stats that are not counters, not kept for exited processes
+CACHE_GAUGES = ('size', 'max_size')
+
+_flush_lock = threading.Lock()
+_process = {'pid': None, 'id': None, 'flushed': 0.0}
+
+
+def snapshot():
+    '''the observations and stats of this process, as JSON data'''
+    from core.authentication import token_cache_stats
+    from core.db.pool import pool_stats
+
+    return {
+        'histograms': {family.name: family.snapshot()
+                       for family in FAMILIES},
+        'token_cache': token_cache_stats(),
+        'db_pool': pool_stats(),
+    }
+
+
+def merge(total, data, gauges=True):
+    '''add the snapshot of a process to a running total'''
+    for name, series in data.get('histograms', {}).items():
+        merged = total.setdefault('histograms', {}).setdefault(name, {})
+        for view, (counts, value) in series.items():
+            if view in merged:
+                counts = [a + b for a, b in zip(merged[view][0], counts)]
+                value += merged[view][1]
+            merged[view] = [counts, value]
+    cache = total.setdefault('token_cache', {})
+    for key, value in data.get('token_cache', {}).items():
+        if gauges or key not in CACHE_GAUGES:
+            cache[key] = cache.get(key, 0) + value
+    if gauges:
+        pools = total.setdefault('db_pool', {})
+        for alias, stats in data.get('db_pool', {}).items():
+            merged = pools.setdefault(alias, {})
+            for key, value in stats.items():
+                merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def process_path():
+    '''the snapshot file of this process in METRICS_DIR'''
+    if _process['pid'] != os.getpid():
+        # forked workers inherit the module, pids get reused
+        _process.update(pid=os.getpid(), id=uuid.uuid4().hex, flushed=0.0)
+    return os.path.join(
+        settings.METRICS_DIR, f"{_process['pid']}-{_process['id']}.json")
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    '''replace a file atomically, readers never see it half written'''
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def flush(force=False):
+    '''write the snapshot of this process for the other workers to read,
+    at most every METRICS_FLUSH_INTERVAL seconds unless forced'''
+    path = process_path()
+    now = time.monotonic()
+    if not force and now - _process['flushed'] < \
+            settings.METRICS_FLUSH_INTERVAL:
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return  # another thread is writing it
+    try:
+        _process['flushed'] = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        write_json(path, snapshot())
+    finally:
+        _flush_lock.release()
+
+
+def archive():
+    '''fold the counters of this process into archive.json as it exits,
+    so the totals never go backwards and the directory stays small'''
+    flush(force=True)
+    path = process_path()
+    archive_path = os.path.join(settings.METRICS_DIR, 'archive.json')
+    with open(os.path.join(settings.METRICS_DIR, 'archive.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        total = read_json(archive_path) or {}
+        merge(total, read_json(path) or {}, gauges=False)
+        write_json(archive_path, total)
+    os.remove(path)
+
+
+def collect():
+    '''the snapshots of every worker process in METRICS_DIR, summed'''
+    flush(force=True)
+    total = {}
+    for name in sorted(os.listdir(settings.METRICS_DIR)):
+        if name.endswith('.json'):
+            merge(total, read_json(
+                os.path.join(settings.METRICS_DIR, name)) or {})
+    return total
+
+
+def render():
+    '''return the metrics of every worker process in the Prometheus text
+    format, counters and gauges summed over the processes'''
+    data = collect()
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.render(
+            data.get('histograms', {}).get(family.name, {})))
+    lines.extend(gauges(
+        'token_cache', 'Authentication token cache counter.',
+        data.get('token_cache', {})))
+    lines.extend(gauges(
+        'db_pool', 'Database connection pool gauge.',
+        data.get('db_pool', {}), label='alias'))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    '''forget every observation, for tests'''
+    for family in FAMILIES:
+        with family._lock:
+            family.histograms.clear()
+    _process['flushed'] = 0.0
+    if os.path.isdir(settings.METRICS_DIR):
+        for name in os.listdir(settings.METRICS_DIR):
+            os.remove(os.path.join(settings.METRICS_DIR, name))
@@ -0,0 +1,247 @@
+import hashlib
+import logging
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from core import compression, metrics, routers
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# IN (%s, %s, ..) lists of any length have the same shape
+PLACEHOLDER_LIST = re.compile(r'\((?:%s, )*%s\)')
+
+query_logger = logging.getLogger('core.queries')
+
+
+def pin_key(credentials):
+    '''the cache key pinning a client to the primary'''
+    digest = hashlib.sha1(credentials.encode()).hexdigest()
+    return 'replica-pin:' + digest
+
+
+def client_credentials(request):
+    '''identify the client of a request, by its address when anonymous'''
+    return request.META.get('HTTP_AUTHORIZATION') or \
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME) or \
+        'address:' + request.META.get('REMOTE_ADDR', '')
+
+
+class ReplicaRoutingMiddleware:
+    '''send the reads of safe requests to a replica
+
+    after a client writes, its reads stay on the primary for
+    DATABASE_REPLICA_PIN_SECONDS so it reads its own writes back despite
+    the replication lag. so do the credentials it was just given, the
+    session cookie of a login or those views pass to routers.pin()
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        cache = caches[settings.DATABASE_REPLICA_PIN_CACHE]
+        credentials = client_credentials(request)
+        safe = request.method in SAFE_METHODS
+        pinned = cache.get(pin_key(credentials)) is not None
+
+        routers.take_pins()
+        routers.use_replicas(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.use_replicas(False)
+            pins = routers.take_pins()
+
+        if not safe:
+            session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+            if session is not None and session.value:
+                pins += (session.value, )
+            cache.set_many(
+                {pin_key(value): True for value in (credentials, ) + pins},
+                settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+
+class CompressionMiddleware:
+    '''compress responses in brotli or gzip, as the client accepts
+
+    bodies under COMPRESSION_MIN_SIZE bytes are left as they are, they
+    barely shrink. streamed bodies are compressed chunk by chunk as they
+    are sent, never buffered. a strong ETag becomes weak, the compressed
+    body isn't the same bytes
+
+    only COMPRESSION_CONTENT_TYPES are compressed, never responses using a
+    CSRF token or sent with Cache-Control: no-transform. compressing
+    secrets next to reflected input leaks them by size (BREACH)
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or \
+                response.status_code in (204, 304):
+            return response
+        if not self.compressible(request, response):
+            return response
+        if not response.streaming and \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        encoding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = compression.compress(encoding, response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def compressible(request, response):
+        media_type = response.get('Content-Type', '').partition(';')[0]
+        if media_type.strip().lower() not in \
+                settings.COMPRESSION_CONTENT_TYPES:
+            return False
+        if request.META.get('CSRF_COOKIE_USED'):
+            return False
+        cache_control = response.get('Cache-Control', '').lower()
+        return 'no-transform' not in cache_control
+
+
+class QueryRecorder:
+    '''database execute wrapper counting queries and the time they take'''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    '''record the time, queries and render time of requests per view
+
+    the measurements go to the histograms of core.metrics, flushed to
+    METRICS_DIR and summed over the workers on /metrics. the queries of
+    streamed response bodies run after the view returned and are not
+    counted
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        match = request.resolver_match
+        metrics.observe_request(
+            match.view_name if match is not None else '<unresolved>',
+            seconds, recorder.count, recorder.seconds,
+            getattr(request, 'render_seconds', None))
+        metrics.flush()
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are serialized by render(), right after this hook
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds = time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def query_shape(sql):
+    '''the statement with its parameter lists collapsed'''
+    return PLACEHOLDER_LIST.sub('(...)', sql)
+
+
+def caller_stack(limit=8):
+    '''the innermost frames of the project code running a query'''
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if '/site-packages/' not in frame.filename and
+        not frame.filename.endswith(('/core/middleware.py', '/contextlib.py'))
+    ]
+    return ''.join(traceback.format_list(frames[-limit:]))
+
+
+class RepeatedQueryDetector:
+    '''execute wrapper logging statements repeated within a request
+
+    the first time a shape runs more than threshold times, a warning
+    with the calling stack is logged, it is most likely a query per row
+    '''
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        if self.shapes[shape] == self.threshold + 1:
+            query_logger.warning(
+                'Query repeated more than %d times in one request: %s\n%s',
+                self.threshold, shape, caller_stack())
+        return execute(sql, params, many, context)
+
+
+class RepeatedQueryMiddleware:
+    '''detect N+1 queries while developing, only loaded with DEBUG'''
+
+    def __init__(self, get_response):
+        if not settings.DEBUG or not settings.QUERY_REPEAT_THRESHOLD:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = RepeatedQueryDetector(settings.QUERY_REPEAT_THRESHOLD)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(detector))
+            return self.get_response(request)
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+# matches the UPPER(name::text) LIKE UPPER(%s) that icontains and
+# istartswith compile to on postgresql, so ?search= can use the index
+CREATE_INDEX = '''
+CREATE INDEX CONCURRENTLY IF NOT EXISTS core_tag_name_trgm_idx
+ON core_tag USING gin (UPPER(name::text) gin_trgm_ops)
+'''
+DROP_INDEX = 'DROP INDEX CONCURRENTLY IF EXISTS core_tag_name_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    '''add the trigram index on postgresql, other backends scan instead'''
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('core', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_tag_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('key', models.CharField(db_index=True, max_length=255)),
+            ],
+        ),
+        # nullable until the existing tags are pointed at their names
+        migrations.AddField(
+            model_name='tag',
+            name='tag_name',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tags', to='core.TagName'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+import unicodedata
+
+from django.db import migrations, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Length
+
+
+# tags rewritten per transaction, each batch only locks its own rows
+BATCH_SIZE = 500
+
+
+def fold_tag_name(name):
+    # copy of core.models.fold_tag_name as of this migration
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+def intern_tag_names(apps, schema_editor):
+    '''point every tag at an interned name, one id range at a time'''
+    Tag = apps.get_model('core', 'Tag')
+    TagName = apps.get_model('core', 'TagName')
+    db = schema_editor.connection.alias
+    tags = Tag.objects.using(db)
+    names = TagName.objects.using(db)
+
+    last_id = tags.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        batch = tags.filter(id__gt=start, id__lte=start + BATCH_SIZE)
+        with transaction.atomic(using=db):
+            new = set(batch.values_list('name', flat=True)) - set(
+                names.filter(name__in=batch.values('name'))
+                .values_list('name', flat=True))
+            names.bulk_create(
+                TagName(name=name, key=fold_tag_name(name)) for name in new)
+            batch.update(tag_name_id=Subquery(
+                names.filter(name=OuterRef('name')).values('id')[:1]))
+
+    report(tags, names)
+
+
+def report(tags, names):
+    '''print how many name bytes the interning saved'''
+    count = tags.count()
+    if not count:
+        return
+    before = tags.aggregate(size=Sum(Length('name')))['size'] or 0
+    after = names.aggregate(size=Sum(Length('name')))['size'] or 0
+    print(f'\n  Interned {count} tags onto {names.count()} names, '
+          f'{before} name characters stored as {after}', end='')
+
+
+def restore_tag_names(apps, schema_editor):
+    '''copy the interned names back onto the tags'''
+    Tag = apps.get_model('core', 'Tag')
+    TagName = apps.get_model('core', 'TagName')
+    db = schema_editor.connection.alias
+    tags = Tag.objects.using(db)
+
+    last_id = tags.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        with transaction.atomic(using=db):
+            tags.filter(id__gt=start, id__lte=start + BATCH_SIZE).update(
+                name=Subquery(TagName.objects.using(db).filter(
+                    id=OuterRef('tag_name_id')).values('name')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # one short transaction per batch instead of one long
+
+    dependencies = [
+        ('core', '0006_tagname'),
+    ]
+
+    operations = [
+        migrations.RunPython(intern_tag_names, restore_tag_names),
+    ]
@@ -0,0 +1,111 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+INDEX_NAME = 'core_tag_user_tag_name_idx'
+
+# SET NOT NULL scans the table under an ACCESS EXCLUSIVE lock, unless a
+# validated CHECK already proves it (postgresql 12+). NOT VALID adds the
+# check without a scan, VALIDATE scans without blocking writes. before 12
+# the validated check stays as the not null guarantee instead
+ADD_CHECK = '''
+ALTER TABLE core_tag ADD CONSTRAINT core_tag_tag_name_not_null
+CHECK (tag_name_id IS NOT NULL) NOT VALID
+'''
+VALIDATE_CHECK = '''
+ALTER TABLE core_tag VALIDATE CONSTRAINT core_tag_tag_name_not_null
+'''
+SET_NOT_NULL = 'ALTER TABLE core_tag ALTER COLUMN tag_name_id SET NOT NULL'
+DROP_CHECK = '''
+ALTER TABLE core_tag DROP CONSTRAINT IF EXISTS core_tag_tag_name_not_null
+'''
+DROP_NOT_NULL = 'ALTER TABLE core_tag ALTER COLUMN tag_name_id DROP NOT NULL'
+CREATE_INDEX = f'''
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME}
+ON core_tag (user_id, tag_name_id)
+'''
+DROP_INDEX = f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'
+
+
+def tag_name_fields(apps):
+    '''the nullable tag_name of the previous state and the required one'''
+    Tag = apps.get_model('core', 'Tag')
+    nullable = Tag._meta.get_field('tag_name')
+    required = models.ForeignKey(
+        apps.get_model('core', 'TagName'),
+        on_delete=django.db.models.deletion.PROTECT, related_name='tags')
+    required.set_attributes_from_name('tag_name')
+    required.model = Tag
+    return Tag, nullable, required
+
+
+def index():
+    return models.Index(fields=['user', 'tag_name'], name=INDEX_NAME)
+
+
+def require_tag_name(apps, schema_editor):
+    '''make tag_name required and index it without long locks'''
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        statements = [ADD_CHECK, VALIDATE_CHECK]
+        if connection.pg_version >= 120000:
+            statements += [SET_NOT_NULL, DROP_CHECK]
+        for sql in statements + [CREATE_INDEX]:
+            schema_editor.execute(sql)
+        return
+    Tag, nullable, required = tag_name_fields(apps)
+    schema_editor.alter_field(Tag, nullable, required)
+    schema_editor.add_index(Tag, index())
+
+
+def allow_null_tag_name(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in (DROP_INDEX, DROP_CHECK, DROP_NOT_NULL):
+            schema_editor.execute(sql)
+        return
+    Tag, nullable, required = tag_name_fields(apps)
+    schema_editor.remove_index(Tag, index())
+    schema_editor.alter_field(Tag, required, nullable)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('core', '0007_intern_tag_names'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='core_tag_user_name_idx',
+        ),
+        # gives the column a default to come back with when reversed
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(default='', max_length=255),
+        ),
+        # also drops core_tag_name_trgm_idx on postgresql
+        migrations.RemoveField(
+            model_name='tag',
+            name='name',
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(require_tag_name, allow_null_tag_name),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='tag',
+                    name='tag_name',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='tags', to='core.TagName'),
+                ),
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(fields=['user', 'tag_name'], name='core_tag_user_tag_name_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# the admin user search matches UPPER(email::text) and UPPER(name::text)
+INDEXES = {
+    'core_user_email_trgm_idx': 'email',
+    'core_user_name_trgm_idx': 'name',
+}
+CREATE_INDEX = '''
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+ON core_user USING gin (UPPER({column}::text) gin_trgm_ops)
+'''
+DROP_INDEX = 'DROP INDEX CONCURRENTLY IF EXISTS {name}'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    '''add the trigram indexes on postgresql, other backends scan instead'''
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in INDEXES.items():
+        schema_editor.execute(CREATE_INDEX.format(name=name, column=column))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in INDEXES:
+            schema_editor.execute(DROP_INDEX.format(name=name))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('core', '0011_user_deactivated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
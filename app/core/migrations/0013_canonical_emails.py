@@ -0,0 +1,67 @@
+from django.db import IntegrityError, migrations, transaction
+from django.db.models import Count, Max
+from django.db.models.functions import Lower
+
+
+# users rewritten per transaction, each batch only locks its own rows
+BATCH_SIZE = 1000
+
+
+def canonical_email(email):
+    # copy of core.models.UserManager.normalize_email as of this migration
+    return email.lower()
+
+
+def check_collisions(users):
+    '''refuse to migrate while two accounts share an email up to case'''
+    collisions = list(
+        users.values(canonical=Lower('email'))
+        .annotate(accounts=Count('id')).filter(accounts__gt=1)
+        .values_list('canonical', flat=True)[:20])
+    if collisions:
+        raise RuntimeError(
+            'Emails used by more than one account when compared without '
+            'case: %s. Merge or rename those accounts and migrate again.'
+            % ', '.join(collisions))
+
+
+def lower_emails(apps, schema_editor):
+    '''store every email in its canonical form, one id range at a time'''
+    User = apps.get_model('core', 'User')
+    db = schema_editor.connection.alias
+    users = User.objects.using(db)
+    check_collisions(users)
+
+    last_id = users.aggregate(last=Max('id'))['last'] or 0
+    changed = 0
+    for start in range(0, last_id, BATCH_SIZE):
+        batch = users.filter(id__gt=start, id__lte=start + BATCH_SIZE)
+        with transaction.atomic(using=db):
+            for pk, email in batch.values_list('id', 'email'):
+                if canonical_email(email) == email:
+                    continue
+                try:
+                    users.filter(id=pk).update(email=canonical_email(email))
+                except IntegrityError:
+                    # casings the database folds differently from python
+                    raise RuntimeError(
+                        f'User {pk} collides with another account once '
+                        f'{email} is lower-cased. Merge or rename it and '
+                        f'migrate again.')
+                changed += 1
+    if changed:
+        print(f'\n  Lower-cased {changed} emails', end='')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # one short transaction per batch instead of one long
+
+    dependencies = [
+        ('core', '0012_user_search_trigram_indexes'),
+    ]
+
+    operations = [
+        # the original casing is gone, nothing to restore
+        migrations.RunPython(lower_emails, migrations.RunPython.noop),
+    ]
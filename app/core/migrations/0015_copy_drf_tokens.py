@@ -0,0 +1,64 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, transaction
+from django.utils import timezone
+
+
+# tokens copied per transaction
+BATCH_SIZE = 1000
+
+
+def digest_token_key(key):
+    # copy of core.models.digest_token_key as of this migration
+    return hashlib.sha256(key.encode()).digest()
+
+
+def copy_tokens(apps, schema_editor):
+    '''hash the keys of the authtoken tokens into expiring AuthTokens
+
+    clients keep their key, it gets a full TTL from now and is created
+    now. the authtoken table is left as it was, for a rollback
+    '''
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+    db = schema_editor.connection.alias
+    expires_at = timezone.now() + timedelta(seconds=settings.TOKEN_TTL)
+
+    tokens = Token.objects.using(db).order_by('key')
+    last_key = ''
+    copied = 0
+    while True:
+        batch = list(tokens.filter(key__gt=last_key)
+                     .values_list('key', 'user_id')[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic(using=db):
+            AuthToken.objects.using(db).bulk_create(
+                AuthToken(digest=digest_token_key(key), user_id=user_id,
+                          expires_at=expires_at)
+                for key, user_id in batch)
+        copied += len(batch)
+        last_key = batch[-1][0]
+    if copied:
+        print(f'\n  Copied {copied} tokens', end='')
+
+
+def delete_tokens(apps, schema_editor):
+    AuthToken = apps.get_model('core', 'AuthToken')
+    AuthToken.objects.using(schema_editor.connection.alias).delete()
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # one short transaction per batch instead of one long
+
+    dependencies = [
+        ('authtoken', '0002_auto_20160226_1747'),
+        ('core', '0014_authtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_tokens, delete_tokens),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+# the tag list pages by (user_id, id), newest first
+INDEX_NAME = 'core_tag_user_id_idx'
+CREATE_INDEX = f'''
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME}
+ON core_tag (user_id, id)
+'''
+DROP_INDEX = f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'
+
+
+def index():
+    return models.Index(fields=['user', 'id'], name=INDEX_NAME)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+    else:
+        schema_editor.add_index(apps.get_model('core', 'Tag'), index())
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+    else:
+        schema_editor.remove_index(apps.get_model('core', 'Tag'), index())
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('core', '0015_copy_drf_tokens'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(fields=['user', 'id'], name='core_tag_user_id_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations, models
+
+
+# the tag list pages by (user_id, sort_name, id), names descending
+INDEX_NAME = 'core_tag_user_sort_name_idx'
+CREATE_INDEX = f'''
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME}
+ON core_tag (user_id, sort_name, id)
+'''
+DROP_INDEX = f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'
+
+BATCH_SIZE = 5000
+
+
+def index():
+    return models.Index(fields=['user', 'sort_name', 'id'], name=INDEX_NAME)
+
+
+def copy_names(apps, schema_editor):
+    '''copy the interned names, a short transaction per batch of tags'''
+    Tag = apps.get_model('core', 'Tag')
+    TagName = apps.get_model('core', 'TagName')
+    name = TagName.objects.filter(pk=models.OuterRef('tag_name_id'))
+    pending = Tag.objects.using(schema_editor.connection.alias).filter(
+        sort_name__isnull=True).order_by()
+    while True:
+        ids = list(pending.values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        Tag.objects.using(pending.db).filter(pk__in=ids).update(
+            sort_name=models.Subquery(name.values('name')[:1]))
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+    else:
+        schema_editor.add_index(apps.get_model('core', 'Tag'), index())
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+    else:
+        schema_editor.remove_index(apps.get_model('core', 'Tag'), index())
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # batches commit one by one, CONCURRENTLY needs it too
+
+    dependencies = [
+        ('core', '0016_tag_user_id_index'),
+    ]
+
+    operations = [
+        # nullable and without a default, adding it rewrites nothing
+        migrations.AddField(
+            model_name='tag',
+            name='sort_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(copy_names, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(fields=['user', 'sort_name', 'id'], name='core_tag_user_sort_name_idx'),
+                ),
+            ],
+        ),
+    ]
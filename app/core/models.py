@@ -1,11 +1,36 @@
-from django.db import models
+import hashlib
+import secrets
+import unicodedata
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+
+from core import hashers
+from core.db.bulk import raw_delete
 
 
 class UserManager(BaseUserManager):  # extends BaseUserManager
 
+    @classmethod
+    def normalize_email(cls, email):
+        '''return the canonical email, lower-cased as a whole
+
+        local parts are case sensitive by the RFC but not at the providers
+        our users are on. one stored form per address lets logins and the
+        unique index match exactly instead of with a slow iexact
+        '''
+        return super().normalize_email(email).lower()
+
+    def get_by_natural_key(self, email):
+        '''return the user of an email in any casing, one index probe'''
+        return self.get(**{self.model.USERNAME_FIELD:
+                           self.normalize_email(email)})
+
     def create_user(self, email, password=None, **extra_fields):
         '''Create and saves a new user'''
         if not email:  # email validation
@@ -19,13 +44,59 @@ class UserManager(BaseUserManager):  # extends BaseUserManager
 
     def create_superuser(self, email, password):  # superuser feature added
         '''create and saves a super user'''
-        user = self.create_user(email, password)  # create user
-        # staff, superuser
-        user.is_staff = True
-        user.is_superuser = True
-        user.save(using=self._db)  # save user
+        # staff, superuser flags set before the single save
+        return self.create_user(email, password,
+                                is_staff=True, is_superuser=True)
 
-        return user
+    # what an imported row may set besides email and password, never the
+    # permission or status flags
+    IMPORT_FIELDS = ('name', )
+
+    def unknown_import_fields(self, row):
+        '''the sorted keys of a row that bulk_create_users won't import'''
+        unknown = set(row) - {'email', 'password', *self.IMPORT_FIELDS}
+        return sorted(str(key) for key in unknown)  # keys may not be str
+
+    def bulk_create_users(self, rows, batch_size=1000, pool=None):
+        '''create users from dicts of fields in bulk and return them
+
+        emails are normalized and deduplicated (the first row wins), rows
+        whose email already exists are skipped instead of hitting the
+        unique constraint, and passwords are hashed in parallel when a
+        process pool is given or configured. a row with fields outside
+        IMPORT_FIELDS raises ValueError before anything is written
+        '''
+        fields = {}
+        for row in rows:
+            unknown = self.unknown_import_fields(row)
+            if unknown:
+                raise ValueError(
+                    'Cannot import user fields: ' + ', '.join(unknown))
+            row = dict(row)
+            email = self.normalize_email(row.pop('email', None) or '')
+            if email and email not in fields:
+                fields[email] = row
+
+        existing = set(self.using(self._db).filter(
+            email__in=list(fields)).values_list('email', flat=True))
+        for email in existing:
+            del fields[email]
+
+        passwords = hashers.make_passwords(
+            [row.pop('password', None) for row in fields.values()], pool)
+        users = [
+            self.model(email=email, password=password, **row)
+            for (email, row), password in zip(fields.items(), passwords)
+        ]
+
+        return self.using(self._db).bulk_create(users, batch_size=batch_size)
+
+    def deactivated(self, before=None):
+        '''users deactivated for deletion, before a time when given'''
+        users = self.filter(is_active=False, deactivated_at__isnull=False)
+        if before is not None:
+            users = users.filter(deactivated_at__lte=before)
+        return users
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -34,20 +105,317 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)  # for the ETags
+    # set when the account is deleted, purge_users removes it later
+    deactivated_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'  # default user name field is email
 
+    def clean(self):
+        super().clean()
+        self.email = self.__class__.objects.normalize_email(self.email)
+
+    def set_password(self, raw_password):
+        '''hash the password through the configurable hashing pool'''
+        self.password = hashers.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        '''check the password, upgrading an outdated hash on success'''
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # hash upgrades shouldn't be considered password changes
+            self._password = None
+            self.save(update_fields=['password'])
+        return hashers.check_password(raw_password, self.password, setter)
+
+    def deactivate(self):
+        '''delete the account as far as its owner can tell
+
+        the user can no longer log in and its cached tokens are dropped,
+        the rows are left to a purge_user task due USER_PURGE_DELAY
+        seconds later, so the request holds no long locks
+        '''
+        from core import tasks  # imports the models
+        self.is_active = False
+        self.deactivated_at = timezone.now()
+        # the purge is queued with the deactivation or neither happens
+        with transaction.atomic(using=self._state.db):
+            self.save(
+                update_fields=['is_active', 'deactivated_at', 'updated_at'])
+            tasks.enqueue(tasks.purge_user, delay=settings.USER_PURGE_DELAY,
+                          user_id=self.pk)
+
+    def purge(self, batch_size=1000):
+        '''delete the user and its tags, return the number of tags deleted
+
+        a plain delete() has the collector load every tag and send its
+        signals in one transaction. tags go first here, batch_size rows per
+        DELETE and transaction without loading or signalling them, so
+        memory and lock time stay bounded whatever the number of tags.
+        their cached lists are not invalidated, an inactive user can't
+        read them and they age out
+        '''
+        tags = Tag._base_manager.using(self._state.db).filter(user=self)
+        deleted = 0
+        while True:
+            ids = list(tags.order_by().values_list('pk', flat=True)
+                       [:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(using=tags.db):
+                deleted += raw_delete(tags.filter(pk__in=ids))
+        # what is left cascades to a few rows (token, admin log)
+        self.delete()
+        return deleted
+
+
+def fold_tag_name(name):
+    '''return the lookup key of a tag name
+
+    case, runs of whitespace and unicode compatibility forms are folded, so
+    "Vegan", " vegan" and "ｖｅｇａｎ" share a key
+    '''
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+class TagNameManager(models.Manager):
+
+    def intern(self, names, batch_size=500):
+        '''return a dict of the TagName ids of names, creating missing ones'''
+        names = list(set(names))
+        ids = {}
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            ids.update(self.filter(name__in=batch).values_list('name', 'id'))
+            missing = [name for name in batch if name not in ids]
+            if not missing:
+                continue
+            try:
+                with transaction.atomic(using=self.db):
+                    created = self.bulk_create(
+                        self.model(name=name, key=fold_tag_name(name))
+                        for name in missing)
+                ids.update((tag_name.name, tag_name.pk)
+                           for tag_name in created if tag_name.pk)
+            except IntegrityError:
+                # interned concurrently, create whatever is still missing
+                for name in missing:
+                    self.get_or_create(
+                        name=name, defaults={'key': fold_tag_name(name)})
+            # bulk_create only returns ids on postgresql, read them back
+            missing = [name for name in missing if name not in ids]
+            if missing:
+                ids.update(
+                    self.filter(name__in=missing).values_list('name', 'id'))
+        return ids
+
+
+class TagName(models.Model):
+    '''a tag name stored once however many tags use it
+
+    the name is kept exactly as given, it is what the API outputs. the
+    folded key groups the spellings of the same name for lookups
+    '''
+    name = models.CharField(max_length=255, unique=True)
+    key = models.CharField(max_length=255, db_index=True)
+
+    objects = TagNameManager()
+
+    def __str__(self):
+        return self.name
+
+
+class TagManager(models.Manager):
+    '''tags with their interned name annotated, so name reads like a field'''
+
+    def get_queryset(self):
+        return super().get_queryset().annotate(name=F('tag_name__name'))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        '''intern the names of new tags in one pass before inserting them'''
+        objs = list(objs)
+        pending = [obj for obj in objs
+                   if obj.tag_name_id is None and obj._name is not None]
+        if pending:
+            ids = TagName.objects.db_manager(self.db).intern(
+                obj._name for obj in pending)
+            for obj in pending:
+                obj.tag_name_id = ids[obj._name]
+        for obj in objs:
+            if obj._name is not None:
+                obj.sort_name = obj._name
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Tag(models.Model):
     '''tag to be used for a recipe'''
-    name = models.CharField(max_length=255)
+    tag_name = models.ForeignKey(
+        TagName,
+        on_delete=models.PROTECT,  # names are shared between users
+        related_name='tags',
+    )
     # foreign key for user object
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,  # when deleting user
     )
+    updated_at = models.DateTimeField(auto_now=True)  # for the ETags
+    # a copy of the interned name, only so an index orders the list pages
+    # by name. nullable so adding it took no table rewrite, always set
+    sort_name = models.CharField(max_length=255, null=True, editable=False)
+
+    objects = TagManager()
+
+    _name = None  # set from the queryset annotation or by assignment
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'tag_name'],
+                name='core_tag_user_tag_name_idx'),
+            # the keyset order of the export
+            models.Index(
+                fields=['user', 'id'],
+                name='core_tag_user_id_idx'),
+            # the keyset order of the tag list pages
+            models.Index(
+                fields=['user', 'sort_name', 'id'],
+                name='core_tag_user_sort_name_idx'),
+            # latest change of a user's tags without touching the rows
+            models.Index(
+                fields=['user', 'updated_at'],
+                name='core_tag_user_updated_idx'),
+        ]
+
+    @property
+    def name(self):
+        if self._name is None and self.tag_name_id is not None:
+            self._name = self.tag_name.name
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+
+    def save(self, *args, **kwargs):
+        '''point the tag at the interned name before writing it'''
+        if self._name is not None:
+            tag_name_id = TagName.objects.intern([self._name])[self._name]
+            if tag_name_id != self.tag_name_id:
+                self._state.fields_cache.pop('tag_name', None)
+                self.tag_name_id = tag_name_id
+        self.sort_name = self.name
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            fields = []
+            for field in update_fields:
+                fields.extend(
+                    ('tag_name', 'sort_name') if field == 'name' else
+                    (field, ))
+            kwargs['update_fields'] = fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
+
+
+def digest_token_key(key):
+    '''return the stored form of a token key, its 32 byte sha256'''
+    return hashlib.sha256(key.encode()).digest()
+
+
+class AuthTokenManager(models.Manager):
+
+    def issue(self, user, ttl=None):
+        '''create a token for a user, its key is only readable from the
+        returned instance'''
+        key = secrets.token_hex(20)
+        ttl = settings.TOKEN_TTL if ttl is None else ttl
+        token = self.create(
+            user=user, digest=digest_token_key(key),
+            expires_at=timezone.now() + timedelta(seconds=ttl))
+        token.key = key
+        return token
+
+    def expired(self, now=None):
+        return self.filter(expires_at__lte=now or timezone.now())
+
+
+class AuthToken(models.Model):
+    '''an expiring API token, stored as the digest of its key
+
+    a leaked table gives no usable keys, and a lookup probes the unique
+    fixed-width digest and checks expires_at in the same query. a user has
+    a token per login, purge_tokens deletes them once expired
+    '''
+    digest = models.BinaryField(max_length=32, unique=True, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='auth_tokens',
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = AuthTokenManager()
+
+    key = None  # the raw key, only set when issued
+
+    @property
+    def cache_key(self):
+        '''hex of the digest, authentication caches by it'''
+        return bytes(self.digest).hex()
+
+    @property
+    def expired(self):
+        return self.expires_at <= timezone.now()
+
+    def rotate(self):
+        '''replace the token by a new one with a fresh expiry'''
+        with transaction.atomic(using=self._state.db):
+            token = AuthToken.objects.db_manager(self._state.db).issue(
+                self.user)
+            self.delete()
+        return token
+
+    def __str__(self):
+        return f'{self.cache_key[:8]} ({self.user_id})'
+
+
+class Task(models.Model):
+    '''a deferred call queued by core.tasks and run by the run_tasks worker
+
+    pending tasks are due at run_after. a claimed task is leased, it is
+    running until run_after and claimed again if its worker died
+    '''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    payload = models.TextField(default='{}')  # JSON keyword arguments
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # the worker's claim query, due tasks in order
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'],
+                name='core_task_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
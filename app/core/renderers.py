@@ -0,0 +1,23 @@
+import msgpack
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class MessagePackRenderer(BaseRenderer):
+    '''MessagePack for clients sending Accept: application/msgpack
+
+    values MessagePack has no type for (dates, decimals, uuids, lazy
+    strings) are converted as the JSON renderer does, so both formats
+    carry the same data
+    '''
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(
+            data, default=JSONEncoder().default, use_bin_type=True)
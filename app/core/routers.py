@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+_state = threading.local()
+_down_until = {}  # replica alias -> time it may be tried again
+
+
+def use_replicas(enabled):
+    '''let reads of the current thread go to a replica or not
+
+    the replica is chosen on the first read and kept until this is called
+    again, so all the reads of a request see the same replica
+    '''
+    _state.use_replicas = enabled
+    _state.replica = None
+
+
+def replicas_enabled():
+    return getattr(_state, 'use_replicas', False)
+
+
+def pin(credentials):
+    '''pin the client sending these credentials to the primary when the
+    request ends, for views giving a client new credentials'''
+    _state.pins = getattr(_state, 'pins', ()) + (credentials, )
+
+
+def take_pins():
+    '''return and forget the credentials pinned by the current thread'''
+    pins = getattr(_state, 'pins', ())
+    _state.pins = ()
+    return pins
+
+
+def check_replica(alias):
+    '''make sure a connection to the replica is open, raise if it is down'''
+    connections[alias].ensure_connection()
+
+
+def healthy_replica():
+    '''return a random healthy replica alias, or None to use the primary
+
+    a replica that fails to connect is skipped for
+    DATABASE_REPLICA_RETRY_SECONDS before it is tried again
+    '''
+    now = time.monotonic()
+    replicas = [alias for alias in settings.DATABASE_REPLICAS
+                if _down_until.get(alias, 0) <= now]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            check_replica(alias)
+        except DatabaseError:
+            _down_until[alias] = now + settings.DATABASE_REPLICA_RETRY_SECONDS
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    '''route reads of safe requests to a replica, the rest to the primary
+
+    replicas are only used while the request has enabled them (see
+    ReplicaRoutingMiddleware), so writes, reads inside write requests and
+    management commands always see the primary. a request reads from the
+    same replica throughout
+    '''
+
+    def db_for_read(self, model, **hints):
+        if not replicas_enabled():
+            return 'default'
+        if _state.replica is None:
+            _state.replica = healthy_replica() or 'default'
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
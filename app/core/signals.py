@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.authentication import get_token_cache
+from core.models import AuthToken
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_token(sender, instance, using, **kwargs):
+    '''drop a deleted token from the authentication cache, and from the
+    local caches of the other workers once the delete commits'''
+    cache, key = get_token_cache(), instance.cache_key
+    cache.invalidate(key)
+    transaction.on_commit(lambda: cache.revoke(key), using=using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, using, **kwargs):
+    '''drop the cached tokens of a user that was changed
+
+    covers deactivation and password changes, and keeps the cached user
+    object from going stale after a profile update. this worker drops
+    them now, the others see the user's new stamp once the save commits
+    '''
+    if created:
+        return
+    cache = get_token_cache()
+    digests = AuthToken.objects.filter(user=instance) \
+        .values_list('digest', flat=True)
+    cache.invalidate(*(bytes(digest).hex() for digest in digests))
+    user_id, updated_at = instance.pk, instance.updated_at
+    transaction.on_commit(
+        lambda: cache.user_changed(user_id, updated_at), using=using)
@@ -0,0 +1,108 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# task name to function, filled by @task in the apps' tasks modules
+registry = {}
+
+
+def task(func):
+    '''register a function as a task, named after its module and name'''
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    registry[func.task_name] = func
+    return func
+
+
+def enqueue(func, delay=0, **kwargs):
+    '''queue a call of a registered task and return its Task row
+
+    the row is written in the caller's transaction, so the task only
+    exists if the work it follows up on was committed. keyword arguments
+    have to be JSON serializable. with TASKS_EAGER the task runs inline
+    '''
+    name = getattr(func, 'task_name', func)
+    if name not in registry:
+        raise KeyError(f'{name} is not a registered task')
+    if settings.TASKS_EAGER:
+        registry[name](**kwargs)
+        return None
+    return Task.objects.create(
+        name=name, payload=json.dumps(kwargs),
+        run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def claim(limit):
+    '''lease up to limit due tasks to the calling worker and return them
+
+    locked rows are skipped, so workers polling together never claim the
+    same task. a running task whose lease ran out had its worker die, it
+    is claimed again
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status__in=(Task.PENDING, Task.RUNNING),
+                    run_after__lte=now)
+            .order_by('run_after')[:limit])
+        if tasks:
+            Task.objects.filter(id__in=[t.id for t in tasks]).update(
+                status=Task.RUNNING,
+                run_after=now + timedelta(seconds=settings.TASK_LEASE),
+                attempts=F('attempts') + 1)
+    return tasks
+
+
+def run(task):
+    '''run a claimed task, deleting it on success
+
+    failures are retried with exponential backoff until TASK_MAX_ATTEMPTS,
+    then the task is kept as failed with its last error
+    '''
+    attempts = task.attempts + 1
+    try:
+        func = registry[task.name]
+        func(**json.loads(task.payload))
+    except Exception as exc:
+        logger.exception('Task %s (%s) failed', task.pk, task.name)
+        if attempts >= settings.TASK_MAX_ATTEMPTS:
+            status, delay = Task.FAILED, 0
+        else:
+            status, delay = Task.PENDING, \
+                settings.TASK_RETRY_DELAY * 2 ** (attempts - 1)
+        Task.objects.filter(id=task.id).update(
+            status=status, last_error=repr(exc),
+            run_after=timezone.now() + timedelta(seconds=delay))
+        return False
+    Task.objects.filter(id=task.id).delete()
+    return True
+
+
+def run_pending(limit=100):
+    '''claim and run due tasks, return how many ran and how many failed'''
+    done = failed = 0
+    for task in claim(limit):
+        if run(task):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+@task
+def purge_user(user_id):
+    '''delete a user deactivated for deletion and its tags in batches'''
+    user = get_user_model().objects.deactivated().filter(pk=user_id).first()
+    if user is not None:  # unless reactivated or purged since
+        user.purge(settings.USER_PURGE_BATCH_SIZE)
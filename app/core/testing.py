@@ -0,0 +1,65 @@
+from contextlib import ContextDecorator, contextmanager
+
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class query_budget(ContextDecorator):
+    '''fail unless the requests made inside run exactly `queries` queries
+
+    used as a test decorator or a with block. only the queries executed
+    while the test client handles a request are counted, the fixtures a
+    test creates around its requests are not. on failure the queries are
+    listed, like assertNumQueries does
+    '''
+
+    def __init__(self, queries, using=DEFAULT_DB_ALIAS):
+        self.budget = queries
+        self.using = using
+
+    def __enter__(self):
+        self.captured = []
+        self.in_request = False
+        request_started.connect(self.request_started)
+        request_finished.connect(self.request_finished)
+        self.wrapper = connections[self.using].execute_wrapper(self.record)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wrapper.__exit__(exc_type, exc_value, traceback)
+        request_started.disconnect(self.request_started)
+        request_finished.disconnect(self.request_finished)
+        if exc_type is None and len(self.captured) != self.budget:
+            raise AssertionError(
+                '%d queries executed by requests, the budget is %d\n%s' % (
+                    len(self.captured), self.budget, '\n'.join(
+                        '%d. %s' % (number, sql) for number, sql
+                        in enumerate(self.captured, start=1))))
+
+    def request_started(self, **kwargs):
+        self.in_request = True
+
+    def request_finished(self, **kwargs):
+        self.in_request = False
+
+    def record(self, execute, sql, params, many, context):
+        if self.in_request:
+            self.captured.append(sql)
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def on_commit_callbacks(using=DEFAULT_DB_ALIAS):
+    '''run the transaction.on_commit callbacks registered inside
+
+    a TestCase never commits, so they would never run. callbacks of
+    writes made in the block run when it exits, as after a commit
+    '''
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _savepoint_ids, callback in callbacks:
+        callback()
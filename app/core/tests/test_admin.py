@@ -2,6 +2,8 @@ from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core.models import Tag
+
 
 class AdminSiteTests(TestCase): # inherit TestCase
 
@@ -41,7 +43,79 @@ class AdminSiteTests(TestCase): # inherit TestCase
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
-        
 
-        
+    def test_delete_user_deactivates(self):
+        '''test that deleting a user deactivates it for purge_users'''
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        res = self.client.get(url)
+        self.assertContains(res, self.user.email)
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deactivated_at)
+
 
+class AdminChangeListTests(TestCase):
+
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@gmail.com',
+            password='password123'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
+    def create_tags(self, count):
+        users = [get_user_model().objects.create_user(
+            email=f'owner{index}@gmail.com', password='password123')
+            for index in range(3)]
+        Tag.objects.bulk_create(
+            Tag(user=users[index % 3], name=f'tag {index}')
+            for index in range(count))
+
+    def test_changelist_query_counts(self):
+        '''test that changelist pages run a fixed number of queries'''
+        self.create_tags(150)
+        pages = [
+            # session, user, count, page
+            ('admin:core_tag_changelist', {}, 4),
+            ('admin:core_tag_changelist', {'q': 'tag 1'}, 4),
+            ('admin:core_user_changelist', {}, 4),
+            ('admin:core_user_changelist', {'q': 'owner'}, 4),
+            ('admin:core_tagname_changelist', {}, 4),
+        ]
+        for name, params, queries in pages:
+            with self.assertNumQueries(queries):
+                res = self.client.get(reverse(name), params)
+            self.assertEqual(res.status_code, 200, name)
+
+    def test_changelist_keyset_pages(self):
+        '''test that the tag list pages after the last id shown'''
+        self.create_tags(150)
+        ids = list(Tag.objects.order_by('-id').values_list('id', flat=True))
+        url = reverse('admin:core_tag_changelist')
+
+        res = self.client.get(url)
+        shown = [tag.id for tag in res.context['cl'].result_list]
+        self.assertEqual(shown, ids[:100])
+        self.assertContains(res, f'?after={ids[99]}')
+
+        res = self.client.get(url, {'after': ids[99]})
+        shown = [tag.id for tag in res.context['cl'].result_list]
+        self.assertEqual(shown, ids[100:])
+        self.assertIsNone(res.context['cl'].next_page_url())
+        self.assertContains(res, '150 tags')
+
+    def test_changelist_sorted_pages_by_number(self):
+        '''test that other orderings fall back to numbered pages'''
+        self.create_tags(150)
+
+        res = self.client.get(
+            reverse('admin:core_tag_changelist'), {'o': '3', 'p': '1'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(res.context['cl'].keyset)
+        self.assertEqual(len(res.context['cl'].result_list), 50)
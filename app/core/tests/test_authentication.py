@@ -0,0 +1,238 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import exceptions
+
+from core.authentication import CachedTokenAuthentication, TokenCache, \
+    get_token_cache
+from core.cache import ExpiringFileBasedCache, LRUCache
+from core.models import AuthToken
+from core.testing import on_commit_callbacks
+
+
+def sample_user(email='test@gmail.com', password='testpass123'):
+    '''create a sample user'''
+    return get_user_model().objects.create_user(email, password)
+
+
+class LRUCacheTests(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        '''test that the oldest unused entry is evicted when full'''
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # 'b' is now the least recently used
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    @patch('core.cache.time.monotonic')
+    def test_entries_expire(self, monotonic):
+        '''test that entries are dropped after their ttl'''
+        monotonic.return_value = 100
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.set('a', 1)
+
+        monotonic.return_value = 111
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class ExpiringFileBasedCacheTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def test_live_entries_never_culled(self):
+        '''test that a full cache only ever drops expired entries'''
+        cache = ExpiringFileBasedCache(self.dir.name, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'SWEEP_INTERVAL': 0}})
+        cache.set('expired', 1, -1)
+        for index in range(50):
+            cache.set(f'key-{index}', index, None)
+
+        self.assertEqual(
+            cache.get_many([f'key-{index}' for index in range(50)]),
+            {f'key-{index}': index for index in range(50)})
+        self.assertEqual(len(os.listdir(self.dir.name)), 50)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        get_token_cache().clear()
+        caches['state'].clear()
+        self.user = sample_user()
+        self.token = AuthToken.objects.issue(self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_second_lookup_served_from_cache(self):
+        '''test that a cached token does not hit the database'''
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.pk, self.token.pk)
+        stats = get_token_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_lookup_single_query(self):
+        '''test that a miss is one probe of the digest with the expiry'''
+        with self.assertNumQueries(1) as queries:
+            self.auth.authenticate_credentials(self.token.key)
+
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"core_authtoken"."digest" = ', sql)
+        self.assertIn('"core_authtoken"."expires_at" > ', sql)
+        self.assertNotIn(self.token.key, sql)
+
+    def test_expired_token_rejected(self):
+        '''test that an expired token is rejected, cached or not'''
+        self.auth.authenticate_credentials(self.token.key)
+
+        # the cached copy expires without a query
+        with patch('django.utils.timezone.now',
+                   return_value=self.token.expires_at):
+            with self.assertNumQueries(0):
+                with self.assertRaises(exceptions.AuthenticationFailed):
+                    self.auth.authenticate_credentials(self.token.key)
+
+        AuthToken.objects.update(expires_at=timezone.now())
+        get_token_cache().clear()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_rotate(self):
+        '''test that rotating replaces the token and drops the old key'''
+        self.auth.authenticate_credentials(self.token.key)
+
+        token = self.token.rotate()
+
+        self.assertNotEqual(token.key, self.token.key)
+        self.assertGreaterEqual(token.expires_at, self.token.expires_at)
+        user, _token = self.auth.authenticate_credentials(token.key)
+        self.assertEqual(user, self.user)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_invalid_token_rejected(self):
+        '''test that an unknown token is rejected'''
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials('invalid')
+
+    def test_deleted_token_invalidated(self):
+        '''test that deleting a token drops it from the cache'''
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_invalidated(self):
+        '''test that deactivating a user drops their cached tokens'''
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_password_change_invalidated(self):
+        '''test that changing the password drops the cached tokens'''
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.assertIsNone(get_token_cache().get(self.token.cache_key))
+
+    def test_cached_user_is_a_copy(self):
+        '''test that changes to a returned user do not leak into the cache'''
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        user.name = 'changed'
+
+        user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.name, '')
+
+    def test_shared_tier_refills_local_tier(self):
+        '''test that a local miss is answered by the shared tier'''
+        cache = TokenCache(max_size=10, ttl=30, shared_alias='default')
+        cache.set(self.token.cache_key, self.user, self.token)
+        cache.local.clear()  # as seen from another worker process
+
+        user, token = cache.get(self.token.cache_key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 0)
+        cache.invalidate(self.token.cache_key)
+        self.assertIsNone(cache.get(self.token.cache_key))
+
+    def other_worker(self):
+        '''a token cache of another process, holding the user'''
+        worker = TokenCache(max_size=10, ttl=30, stamp_alias='state')
+        token = AuthToken.objects.select_related('user').get(pk=self.token.pk)
+        worker.set(self.token.cache_key, token.user, token)
+        self.assertIsNotNone(worker.get(self.token.cache_key))
+        return worker
+
+    def test_other_workers_see_user_changes(self):
+        '''test that a change committed by one worker reaches the others'''
+        worker = self.other_worker()
+
+        with on_commit_callbacks():
+            self.user.deactivate()
+
+        self.assertIsNone(worker.get(self.token.cache_key))
+        self.assertEqual(worker.stats()['stale_hits'], 1)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_other_workers_see_profile_updates(self):
+        '''test that other workers reload a user after a profile change'''
+        worker = self.other_worker()
+
+        with on_commit_callbacks():
+            self.user.name = 'changed'
+            self.user.save()
+
+        self.assertIsNone(worker.get(self.token.cache_key))
+        user = AuthToken.objects.get(pk=self.token.pk).user
+        worker.set(self.token.cache_key, user, self.token)
+        self.assertEqual(worker.get(self.token.cache_key)[0].name, 'changed')
+
+    def test_other_workers_see_revoked_tokens(self):
+        '''test that a token rotated on one worker fails on the others'''
+        worker = self.other_worker()
+
+        with on_commit_callbacks():
+            self.token.rotate()
+
+        self.assertIsNone(worker.get(self.token.cache_key))
+
+    def test_revocation_survives_full_stamp_cache(self):
+        '''test that stamps past the stock 300 entries drop no revocation'''
+        worker = self.other_worker()
+        with on_commit_callbacks():
+            self.token.rotate()
+
+        cache = get_token_cache()
+        for user_id in range(1000, 1400):
+            cache.user_changed(user_id, timezone.now())
+
+        self.assertIsNone(worker.get(self.token.cache_key))
+        self.assertIsNone(worker.get(self.token.cache_key))
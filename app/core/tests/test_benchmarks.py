@@ -0,0 +1,92 @@
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import LiveServerTestCase, TestCase
+
+from benchmarks import data, driver, scenarios
+from core.models import Tag
+from core.throttling import get_throttle_store
+
+
+class DriverStatsTests(TestCase):
+
+    def test_percentile_nearest_rank(self):
+        '''test the nearest rank percentiles of the results'''
+        ordered = list(range(1, 101))
+
+        self.assertEqual(driver.percentile(ordered, 0.5), 50)
+        self.assertEqual(driver.percentile(ordered, 0.99), 99)
+        self.assertEqual(driver.percentile([7], 0.95), 7)
+        self.assertIsNone(driver.percentile([], 0.5))
+
+    def test_seed_reproducible(self):
+        '''test that a seed gives the same manifest and keeps its data'''
+        first = data.seed(users=3, tags_per_user=4, seed=1)
+        second = data.seed(users=3, tags_per_user=4, seed=1)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(first['users']), 3)
+        self.assertEqual(len({user['token'] for user in first['users']}), 3)
+
+    def test_seed_resumes(self):
+        '''test that an interrupted seed keeps its batches and resumes'''
+        seed_batch = data.seed_batch
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            seed_batch(*args)
+
+        with patch('benchmarks.data.seed_batch', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                data.seed(users=4, tags_per_user=3, seed=4, batch_size=6)
+        self.assertEqual(Tag.objects.count(), 6)  # the first batch
+
+        data.seed(users=4, tags_per_user=3, seed=4, batch_size=6)
+        resumed = sorted(Tag.objects.values_list('user__email', 'name'))
+        Tag.objects.all().delete()
+        get_user_model().objects.all().delete()
+        data.seed(users=4, tags_per_user=3, seed=4, batch_size=6)
+
+        self.assertEqual(len(resumed), 12)
+        self.assertEqual(
+            sorted(Tag.objects.values_list('user__email', 'name')), resumed)
+
+
+class DriverLiveTests(LiveServerTestCase):
+
+    def test_scenarios_against_server(self):
+        '''test that the driver measures scenarios without errors'''
+        users = data.seed(users=2, tags_per_user=30, seed=2)['users']
+
+        for name in ('me_read', 'me_revalidate', 'tag_list_pages',
+                     'tag_autocomplete'):
+            result = driver.run(
+                self.live_server_url, scenarios.SCENARIOS[name], users,
+                concurrency=2, requests=20, warmup=2)
+
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 20, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_attack_in_background(self):
+        '''test that a background attack runs until stopped and is throttled'''
+        get_throttle_store().clear()
+        users = data.seed(users=1, tags_per_user=1, seed=3)['users']
+        stop = threading.Event()
+        timer = threading.Timer(1, stop.set)
+        timer.start()
+
+        rates = {'login_ip': '1/min', 'login_email': '1/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            result = driver.run(
+                self.live_server_url, scenarios.SCENARIOS['login_attack'],
+                users, concurrency=2, stop=stop)
+
+        self.assertEqual(result['errors'], 0)
+        self.assertIn('429', result['statuses'])
+        self.assertEqual(sum(result['statuses'].values()),
+                         result['requests'])
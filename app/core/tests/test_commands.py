@@ -1,8 +1,28 @@
-from unittest.mock import patch
+import json
+import os
+import socket
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+from unittest.mock import MagicMock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+from core import tasks
+from core.models import AuthToken, Tag
 
 
 class CommandTests(TestCase):
@@ -10,14 +30,246 @@ class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
         '''test wating for db when db is available'''
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True  # return the specified value
-            call_command('wait_for_db')  # minitor how many times called
+            gi.return_value = MagicMock()  # a connection that works
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 1)  # `getitem` only called once?
+            gi.return_value.cursor().__enter__().execute.assert_called_with(
+                'SELECT 1')  # a real query, not just a lookup
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         '''test wating for db'''
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]  # 6번째에 return
-            call_command('wait_for_db')
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]  # 6번째
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 6)  # `getitem` called 6 times?
+
+        delays = [call[0][0] for call in ts.call_args_list]
+        for attempt, delay in enumerate(delays):  # jittered, growing bound
+            self.assertLessEqual(delay, 0.1 * 2 ** attempt)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_many_attempts(self, ts):
+        '''test that the backoff bound stays finite over many attempts'''
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = [OperationalError] * 1100 + [MagicMock()]
+            call_command('wait_for_db', max_delay=2, stdout=StringIO())
+
+        self.assertLessEqual(max(call[0][0] for call in ts.call_args_list), 2)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_deadline(self, ts):
+        '''test that waiting gives up once the deadline has passed'''
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+            self.assertEqual(gi.call_count, 1)
+
+    @skipIf(psycopg2 is None, 'psycopg2 is not installed')
+    def test_wait_for_db_unreachable_host(self):
+        '''test that a server that never answers is given up at the
+        deadline, not after the OS connect timeout'''
+        from core.db.backends.postgresql.base import DatabaseWrapper
+
+        # accepts connections in the kernel, never answers them
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        settings_dict = dict(
+            connections.databases['default'], ENGINE='', NAME='app',
+            HOST='127.0.0.1', PORT=server.getsockname()[1], USER='u',
+            PASSWORD='p', OPTIONS={}, POOL={})
+
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = lambda alias: DatabaseWrapper(
+                dict(settings_dict), alias)
+            start = time.monotonic()
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', probe=True, timeout=2,
+                             stdout=StringIO())
+
+        self.assertLess(time.monotonic() - start, 4)
+
+    def test_wait_for_db_probe(self):
+        '''test that probe mode checks once without retrying'''
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', probe=True, stdout=StringIO())
+            self.assertEqual(gi.call_count, 1)
+
+            gi.side_effect = None
+            gi.return_value = MagicMock()
+            call_command('wait_for_db', probe=True, stdout=StringIO())
+
+
+class ImportUsersCommandTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_users_csv(self):
+        '''test importing users from a csv file in chunks'''
+        path = self.write('users.csv', (
+            'email,password,name\n'
+            'one@gmail.com,pass123,one\n'
+            'two@GMAIL.com,pass123,two\n'
+            'one@gmail.com,pass123,again\n'
+        ))
+        out = StringIO()
+
+        call_command('import_users', path, chunk_size=2, workers=0,
+                     stdout=out)
+
+        users = get_user_model().objects.order_by('email')
+        self.assertEqual(
+            [user.email for user in users], ['one@gmail.com', 'two@gmail.com'])
+        self.assertIn('Chunk 2: 1 rows, 0 created, 1 skipped, 0 rejected',
+                      out.getvalue())
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_users_csv_extra_columns(self):
+        '''test that a csv row with extra fields is rejected, not fatal'''
+        path = self.write('users.csv', (
+            'email,password,name\n'
+            'one@gmail.com,pass123,one,extra\n'
+            'two@gmail.com,pass123,two\n'
+        ))
+        out, err = StringIO(), StringIO()
+
+        call_command('import_users', path, workers=0, stdout=out, stderr=err)
+
+        emails = get_user_model().objects.values_list('email', flat=True)
+        self.assertEqual(list(emails), ['two@gmail.com'])
+        self.assertIn('Row 1 rejected: 1 extra columns', err.getvalue())
+        self.assertIn('Imported 1 users from 2 rows, 1 rejected',
+                      out.getvalue())
+
+    def test_import_users_rejects_other_fields(self):
+        '''test that rows setting fields outside the import are rejected'''
+        path = self.write('users.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'email': 'one@gmail.com', 'password': 'pass123',
+             'is_superuser': True, 'is_staff': True},
+            {'email': 'two@gmail.com', 'password': 'pass123', 'name': 'two'},
+            {'email': 'three@gmail.com', 'nickname': 'x'},
+            ['four@gmail.com'],
+        ]))
+        out, err = StringIO(), StringIO()
+
+        call_command('import_users', path, workers=0, stdout=out, stderr=err)
+
+        emails = get_user_model().objects.values_list('email', flat=True)
+        self.assertEqual(list(emails), ['two@gmail.com'])
+        self.assertIn('Row 1 rejected: cannot import is_staff, is_superuser',
+                      err.getvalue())
+        self.assertIn('Row 3 rejected: cannot import nickname', err.getvalue())
+        self.assertIn('Row 4 rejected: not an object', err.getvalue())
+        self.assertIn('1 users from 4 rows, 3 rejected', out.getvalue())
+
+    def test_import_users_resumes_from_checkpoint(self):
+        '''test that an interrupted import skips the rows already done'''
+        path = self.write('users.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'email': 'one@gmail.com', 'password': 'pass123'},
+            {'email': 'two@gmail.com', 'password': 'pass123'},
+        ]))
+        self.write('users.jsonl.checkpoint', '1')
+
+        call_command('import_users', path, workers=2, stdout=StringIO())
+
+        emails = get_user_model().objects.values_list('email', flat=True)
+        self.assertEqual(list(emails), ['two@gmail.com'])
+
+
+class ServeCommandTests(TestCase):
+
+    @patch('core.management.commands.serve.Command.run')
+    def test_serve_config(self, run):
+        '''test that serve configures a preloaded multi worker server'''
+        call_command('serve', workers=3, threads=2, stdout=StringIO())
+
+        app_path, config = run.call_args[0]
+        self.assertEqual(app_path, 'app.wsgi:application')
+        self.assertEqual(config['workers'], 3)
+        self.assertEqual(config['threads'], 2)
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertTrue(config['preload_app'])
+        self.assertGreater(config['max_requests'], 0)
+
+    def test_gunicorn_application_loads_wsgi_app(self):
+        '''test that the gunicorn application accepts the settings'''
+        from core.management.commands.serve import GunicornApplication
+        from app.wsgi import application
+
+        app = GunicornApplication('app.wsgi:application', {'workers': 2})
+
+        self.assertEqual(app.cfg.workers, 2)
+        self.assertIs(app.load(), application)
+
+
+@tasks.task
+def rename_user(user_id, name):
+    get_user_model().objects.filter(pk=user_id).update(name=name)
+
+
+class RunTasksCommandTests(TestCase):
+
+    def test_run_tasks_once(self):
+        '''test that run_tasks --once runs the due tasks and exits'''
+        user = get_user_model().objects.create_user(
+            'test@naver.com', 'testpass123')
+        tasks.enqueue(rename_user, user_id=user.pk, name='renamed')
+        out = StringIO()
+
+        call_command('run_tasks', once=True, stdout=out)
+
+        self.assertIn('1 tasks done, 0 failed', out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(user.name, 'renamed')
+
+
+class PurgeUsersCommandTests(TestCase):
+
+    def test_purge_users(self):
+        '''test that only users deactivated before the grace are deleted'''
+        User = get_user_model()
+        due = User.objects.create_user('due@naver.com', 'testpass123')
+        recent = User.objects.create_user('recent@naver.com', 'testpass123')
+        active = User.objects.create_user('active@naver.com', 'testpass123')
+        Tag.objects.create(user=due, name='Vegan')
+        due.deactivate()
+        recent.deactivate()
+        User.objects.filter(pk=due.pk).update(
+            deactivated_at=timezone.now() - timedelta(hours=2))
+        out = StringIO()
+
+        call_command('purge_users', grace=1, stdout=out)
+
+        self.assertIn(f'Deleted user {due.pk} and 1 tags', out.getvalue())
+        self.assertEqual(set(User.objects.all()), {recent, active})
+        self.assertFalse(Tag.objects.exists())
+
+
+class PurgeTokensCommandTests(TestCase):
+
+    def test_purge_tokens(self):
+        '''test that only expired tokens are deleted, in batches'''
+        user = get_user_model().objects.create_user(
+            'test@naver.com', 'testpass123')
+        for _index in range(5):
+            AuthToken.objects.issue(user, ttl=-1)
+        valid = AuthToken.objects.issue(user)
+        out = StringIO()
+
+        call_command('purge_tokens', batch_size=2, sleep=0, stdout=out)
+
+        self.assertIn('5 tokens deleted', out.getvalue())
+        self.assertEqual(list(AuthToken.objects.all()), [valid])
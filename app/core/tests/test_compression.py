@@ -0,0 +1,145 @@
+import gzip
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware
+from core.models import Tag
+
+from recipe.cache import get_tag_list_cache
+
+
+BODY = b'{"name": "Vegan"}' * 200
+JSON = 'application/json'
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(TestCase):
+
+    def compress(self, response, accept_encoding):
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_choose_encoding(self):
+        '''test that codings are chosen by q, brotli winning ties'''
+        prefers_br = 'br' if compression.brotli else 'gzip'
+
+        self.assertEqual(compression.choose_encoding('gzip'), 'gzip')
+        self.assertEqual(compression.choose_encoding('gzip, br'), prefers_br)
+        self.assertEqual(compression.choose_encoding('*'), prefers_br)
+        self.assertEqual(
+            compression.choose_encoding('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(compression.choose_encoding(''))
+
+    def test_gzip(self):
+        '''test that large bodies are gzipped with a weak ETag'''
+        response = HttpResponse(BODY, content_type=JSON)
+        response['ETag'] = '"abc"'
+
+        response = self.compress(response, 'gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        '''test that brotli is used when accepted'''
+        response = self.compress(
+            HttpResponse(BODY, content_type=JSON), 'gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), BODY)
+
+    def test_small_bodies_untouched(self):
+        '''test that bodies under the threshold are sent as they are'''
+        response = self.compress(
+            HttpResponse(BODY[:1000], content_type=JSON), 'gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY[:1000])
+
+    def test_not_accepted(self):
+        '''test that bodies are not compressed for other clients'''
+        response = self.compress(
+            HttpResponse(BODY, content_type=JSON), 'identity')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_html_untouched(self):
+        '''test that pages are not compressed, they may hold CSRF tokens'''
+        response = self.compress(HttpResponse(BODY), 'gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY)
+
+    def test_csrf_token_used(self):
+        '''test that responses using the CSRF token are not compressed'''
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        request.META['CSRF_COOKIE_USED'] = True
+        response = HttpResponse(BODY, content_type=JSON)
+
+        response = CompressionMiddleware(lambda request: response)(request)
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_no_transform(self):
+        '''test that Cache-Control: no-transform is honoured'''
+        response = HttpResponse(BODY, content_type=JSON)
+        response['Cache-Control'] = 'private, no-transform'
+
+        response = self.compress(response, 'gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY)
+
+    def test_streaming(self):
+        '''test that streamed bodies are compressed chunk by chunk'''
+        response = StreamingHttpResponse(
+            (BODY[i:i + 100] for i in range(0, len(BODY), 100)),
+            content_type=JSON)
+
+        response = self.compress(response, 'gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content), BODY)
+
+
+class CompressionApiTests(TestCase):
+
+    def setUp(self):
+        get_tag_list_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass123')
+        Tag.objects.bulk_create(Tag(user=self.user, name=f'tag {index}')
+                                for index in range(100))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tag_list_revalidates_compressed(self):
+        '''test that the weak ETag of a compressed list still gives 304'''
+        url = reverse('recipe:tag-list')
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertTrue(res['ETag'].startswith('W/"'))
+        self.assertIn(b'tag 99', gzip.decompress(res.content))
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                              HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, 304)
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def ping(connection):
+    if not connection.healthy:
+        raise RuntimeError('server closed the connection')
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('ping', ping)
+        return ConnectionPool(self.connect, **kwargs)
+
+    def test_connection_reused(self):
+        '''test that a released connection is handed out again'''
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(self.opened), 1)
+        stats = pool.stats()
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['reuses'], 1)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_overflow_closed_on_release(self):
+        '''test that connections beyond the pool size are not kept'''
+        pool = self.pool(size=1, max_overflow=1)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_acquire_timeout(self):
+        '''test that an exhausted pool raises after the timeout'''
+        pool = self.pool(size=1, max_overflow=0, timeout=0.01)
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_unhealthy_connection_replaced(self):
+        '''test that a connection failing the ping is not reused'''
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.healthy = False
+
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['failed_pings'], 1)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_old_connection_recycled(self, monotonic):
+        '''test that connections past their lifetime are reopened'''
+        monotonic.return_value = 0
+        pool = self.pool(size=1, recycle=60)
+        connection = pool.acquire()
+        pool.release(connection)
+
+        monotonic.return_value = 61
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+
+    def test_broken_connection_discarded(self):
+        '''test that a connection released after errors is closed'''
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        pool.release(connection, discard=True)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['open'], 0)
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from core import fastpath
+from core.models import Tag
+
+from recipe.serializers import TagSerializer
+from user.serializers import UserSerializer
+
+
+class FastPathTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass123',
+            name='Ünïcode "name"'
+        )
+        for name in ('Vegan', 'Dessert', '한식', 'quote " and \\ slash'):
+            Tag.objects.create(user=self.user, name=name)
+
+    def test_tag_output_byte_identical(self):
+        '''test that the fast path renders exactly like TagSerializer'''
+        tags = Tag.objects.order_by('-name')
+
+        expected = JSONRenderer().render(TagSerializer(tags, many=True).data)
+        fast = JSONRenderer().render(
+            list(fastpath.values(tags, TagSerializer)))
+
+        self.assertEqual(fast, expected)
+
+    def test_user_output_byte_identical(self):
+        '''test that the fast path renders exactly like UserSerializer'''
+        expected = JSONRenderer().render(UserSerializer(self.user).data)
+        fast = JSONRenderer().render(
+            fastpath.represent(self.user, UserSerializer))
+
+        self.assertEqual(fast, expected)
+        self.assertNotIn(b'password', fast)  # write only field
+
+    def test_converted_fields_refused(self):
+        '''test that fields DRF would convert have no fast path'''
+        class UpdatedSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Tag
+                fields = ('id', 'updated_at')
+
+        with self.assertRaises(ImproperlyConfigured):
+            fastpath.readable_fields(UpdatedSerializer)
+
+    def test_declared_fields_checked(self):
+        '''test that only plain declared fields without a source pass'''
+        class SourcedSerializer(serializers.ModelSerializer):
+            label = serializers.CharField(source='name')
+
+            class Meta:
+                model = Tag
+                fields = ('id', 'label')
+
+        self.assertEqual(
+            fastpath.readable_fields(TagSerializer), ('id', 'name'))
+        with self.assertRaises(ImproperlyConfigured):
+            fastpath.readable_fields(SourcedSerializer)
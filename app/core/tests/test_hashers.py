@@ -0,0 +1,72 @@
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import PBKDF2SHA1PasswordHasher, \
+    identify_hasher
+from django.test import TestCase, override_settings
+
+from core import hashers
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class PasswordHashingTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass123'
+        )
+
+    def test_new_hash_uses_configured_work_factor(self):
+        '''test that new hashes use the configured iterations'''
+        algorithm, iterations, salt, hash = self.user.password.split('$', 3)
+
+        self.assertEqual(algorithm, 'pbkdf2_sha256')
+        self.assertEqual(int(iterations), 1000)
+
+    def test_work_factor_upgraded_on_login(self):
+        '''test that a hash with an old work factor is redone at login'''
+        with self.settings(PASSWORD_HASH_ITERATIONS=500):
+            self.user.set_password('testpass123')
+            self.user.save()
+
+        user = authenticate(username='test@gmail.com', password='testpass123')
+
+        self.assertEqual(user, self.user)
+        user.refresh_from_db()
+        self.assertEqual(user.password.split('$')[1], '1000')
+
+    def test_legacy_hasher_upgraded_on_login(self):
+        '''test that a hash of a non preferred hasher is redone at login'''
+        self.user.password = PBKDF2SHA1PasswordHasher().encode(
+            'testpass123', 'salt', 1000)
+        self.user.save()
+
+        self.assertTrue(self.user.check_password('testpass123'))
+
+        self.user.refresh_from_db()
+        self.assertEqual(
+            identify_hasher(self.user.password).algorithm, 'pbkdf2_sha256')
+
+    def test_wrong_password_not_upgraded(self):
+        '''test that a failed login leaves the stored hash alone'''
+        with self.settings(PASSWORD_HASH_ITERATIONS=500):
+            self.user.set_password('testpass123')
+            self.user.save()
+        encoded = self.user.password
+
+        self.assertFalse(self.user.check_password('wrong'))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, encoded)
+
+    def test_hashing_in_process_pool(self):
+        '''test that hashing works when offloaded to worker processes'''
+        self.addCleanup(hashers.shutdown_pool)
+        with self.settings(PASSWORD_HASHING_POOL_SIZE=2):
+            self.assertIsNotNone(hashers.get_pool())
+            user = get_user_model().objects.create_user(
+                email='pool@gmail.com',
+                password='testpass123'
+            )
+
+            self.assertTrue(user.check_password('testpass123'))
+            self.assertFalse(user.check_password('wrong'))
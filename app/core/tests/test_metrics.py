@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Tag
+
+from recipe.cache import get_tag_list_cache
+
+
+METRICS_URL = reverse('metrics')
+
+
+def sample(text, line_start):
+    '''return the value of the metric line starting with line_start'''
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.split()[-1])
+    raise AssertionError(f'{line_start} not found')
+
+
+class HistogramTests(TestCase):
+
+    def test_observe_cumulative(self):
+        '''test that buckets are cumulative and bounds inclusive'''
+        histogram = metrics.Histogram((1, 5))
+        for value in (0.5, 1, 3, 9):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.snapshot(), ([2, 3, 4], 13.5))
+
+
+class MetricsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        settings = override_settings(METRICS_DIR=self.metrics_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics.reset()
+        get_tag_list_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_view_queries_recorded(self):
+        '''test that the queries of a request are counted per view'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(reverse('recipe:tag-list'))
+        self.client.get(reverse('user:me'))
+
+        res = self.client.get(METRICS_URL)
+        text = res.content.decode()
+
+        self.assertEqual(res['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertEqual(sample(
+            text, 'http_request_db_queries_count{view="recipe:tag-list"}'), 1)
+        self.assertEqual(sample(
+            text, 'http_request_db_queries_sum{view="recipe:tag-list"}'), 2)
+        self.assertEqual(sample(
+            text, 'http_request_db_queries_sum{view="user:me"}'), 0)
+        self.assertGreater(sample(
+            text, 'http_request_duration_seconds_sum{view="user:me"}'), 0)
+        self.assertEqual(sample(
+            text, 'http_response_render_seconds_count{view="user:me"}'), 1)
+        self.assertIn('token_cache_hits ', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        '''test that nothing is recorded or exposed when disabled'''
+        self.client.get(reverse('user:me'))
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(metrics.REQUEST_SECONDS.histograms, {})
+
+    def test_workers_summed(self):
+        '''test that the snapshots of other workers are added up'''
+        self.client.get(reverse('user:me'))
+        other = metrics.merge({}, metrics.snapshot())
+        with open(os.path.join(self.metrics_dir.name, '1-other.json'),
+                  'w') as f:
+            json.dump(other, f)
+        self.client.get(reverse('user:me'))
+
+        text = self.client.get(METRICS_URL).content.decode()
+
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_count{view="user:me"}'), 3)
+
+    def test_exited_worker_archived(self):
+        '''test that the counts of an exited worker are kept'''
+        self.client.get(reverse('user:me'))
+        metrics.archive()
+        for family in metrics.FAMILIES:  # as if this was a new worker
+            family.histograms.clear()
+
+        text = self.client.get(METRICS_URL).content.decode()
+
+        self.assertEqual(os.listdir(self.metrics_dir.name).count(
+            'archive.json'), 1)
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_count{view="user:me"}'), 1)
+
+    def test_remote_address_forbidden(self):
+        '''test that /metrics refuses addresses not allowed'''
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(res.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_allowed_network(self):
+        '''test that addresses in an allowed network are served'''
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='10.1.2.3')
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        '''test that the bearer token is accepted from anywhere'''
+        client = APIClient()
+
+        res = client.get(
+            METRICS_URL, REMOTE_ADDR='203.0.113.7',
+            HTTP_AUTHORIZATION='Bearer s3cret')
+        wrong = client.get(
+            METRICS_URL, REMOTE_ADDR='203.0.113.7',
+            HTTP_AUTHORIZATION='Bearer wrong')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(wrong.status_code, 403)
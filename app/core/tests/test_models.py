@@ -1,7 +1,13 @@
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.utils import timezone
 
-from core import models
+from core import models, tasks
+from core.db.bulk import raw_delete
 
 
 def sample_user(email='test@naver.com', password='testpass123'):
@@ -26,12 +32,14 @@ class ModelTests(TestCase):
 
     def test_new_user_email_normalized(self):
         '''test the email for a new user is normalized'''
-        email = 'sirzzang@NAVER.COM'
+        email = 'SirZzang@NAVER.COM'
         user = get_user_model().objects.\
             create_user(email, 'test123')  # throwaway string assigned as pw
 
-        # check if email normalized
-        self.assertEqual(user.email, email.lower())
+        # check if email normalized, local part included
+        self.assertEqual(user.email, 'sirzzang@naver.com')
+        self.assertEqual(
+            get_user_model().objects.get_by_natural_key(email), user)
 
     def test_new_user_invalid_email(self):
         '''test creating user with no email raises error'''
@@ -49,6 +57,48 @@ class ModelTests(TestCase):
         self.assertTrue(user.is_superuser)
         self.assertTrue(user.is_staff)
 
+    def test_create_new_superuser_single_write(self):
+        '''test that a superuser is created with a single insert'''
+        with self.assertNumQueries(1):
+            get_user_model().objects.create_superuser(
+                'sirzzang@naver.com',
+                'test123'
+            )
+
+    def test_bulk_create_users(self):
+        '''test creating users in bulk normalizes and deduplicates emails'''
+        sample_user(email='existing@naver.com')
+        rows = [
+            {'email': 'new@NAVER.COM', 'password': 'pass123', 'name': 'a'},
+            {'email': 'new@naver.com', 'password': 'other123'},  # duplicate
+            {'email': 'existing@naver.com', 'password': 'pass123'},
+            {'email': '', 'password': 'pass123'},  # no email
+            {'email': 'second@naver.com'},  # no password
+        ]
+
+        users = get_user_model().objects.bulk_create_users(rows)
+
+        self.assertEqual(
+            [user.email for user in users],
+            ['new@naver.com', 'second@naver.com'])
+        user = get_user_model().objects.get(email='new@naver.com')
+        self.assertEqual(user.name, 'a')
+        self.assertTrue(user.check_password('pass123'))
+        second = get_user_model().objects.get(email='second@naver.com')
+        self.assertFalse(second.has_usable_password())
+
+    def test_bulk_create_users_rejects_other_fields(self):
+        '''test that bulk imports can't set flags like is_superuser'''
+        rows = [
+            {'email': 'fine@naver.com', 'password': 'pass123'},
+            {'email': 'admin@naver.com', 'is_superuser': True},
+        ]
+
+        with self.assertRaises(ValueError):
+            get_user_model().objects.bulk_create_users(rows)
+
+        self.assertFalse(get_user_model().objects.exists())
+
     def test_tag_str(self):
         '''test the tag string representation'''
         tag = models.Tag.objects.create(
@@ -57,3 +107,105 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(str(tag), tag.name)
+
+    def test_tag_names_interned(self):
+        '''test that tags with the same name share one stored name'''
+        user = sample_user()
+        other = sample_user(email='other@naver.com')
+        first = models.Tag.objects.create(user=user, name='Vegan')
+        second = models.Tag.objects.create(user=other, name='Vegan')
+        models.Tag.objects.create(user=user, name='vegan')
+
+        self.assertEqual(first.tag_name_id, second.tag_name_id)
+        self.assertEqual(models.TagName.objects.count(), 2)
+        self.assertEqual(
+            set(models.TagName.objects.values_list('key', flat=True)),
+            {'vegan'})
+        self.assertEqual(
+            models.Tag.objects.get(id=second.id).name, 'Vegan')
+
+    def test_tag_rename_repoints(self):
+        '''test that renaming a tag leaves the other users' tag alone'''
+        user = sample_user()
+        other = sample_user(email='other@naver.com')
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        kept = models.Tag.objects.create(user=other, name='Vegan')
+
+        tag.name = 'Dinner'
+        tag.save(update_fields=['name'])
+
+        self.assertEqual(models.Tag.objects.get(id=tag.id).name, 'Dinner')
+        self.assertEqual(models.Tag.objects.get(id=kept.id).name, 'Vegan')
+
+    def test_fold_tag_name(self):
+        '''test that the key folds case, whitespace and unicode forms'''
+        self.assertEqual(
+            models.fold_tag_name('  Ｇｌｕｔｅｎ   FREE '), 'gluten free')
+        self.assertEqual(models.fold_tag_name('Straße'), 'strasse')
+
+    def test_user_deactivate(self):
+        '''test that deactivating keeps the user but disables it'''
+        user = sample_user()
+
+        user.deactivate()
+
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertIsNotNone(user.deactivated_at)
+        self.assertEqual(
+            list(get_user_model().objects.deactivated()), [user])
+
+    @override_settings(USER_PURGE_DELAY=3600)
+    def test_user_deactivate_queues_purge(self):
+        '''test that a deactivated user is purged by a task once due'''
+        user = sample_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+
+        user.deactivate()
+
+        task = models.Task.objects.get()
+        self.assertEqual(task.name, 'core.tasks.purge_user')
+        self.assertGreater(task.run_after, timezone.now())
+        models.Task.objects.update(run_after=timezone.now())
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertFalse(get_user_model().objects.filter(pk=user.pk).exists())
+        self.assertFalse(models.Tag.objects.exists())
+
+    def test_user_deactivate_rolled_back_without_purge(self):
+        '''test that a failure to queue the purge undoes the deactivation'''
+        user = sample_user()
+
+        with patch('core.tasks.enqueue', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                user.deactivate()
+
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        self.assertIsNone(user.deactivated_at)
+
+    def test_user_purge_in_batches(self):
+        '''test that purging deletes tags in batches of bounded DELETEs'''
+        user = sample_user()
+        other = sample_user(email='other@naver.com')
+        models.Tag.objects.bulk_create(
+            models.Tag(user=user, name=f'tag {index}') for index in range(5))
+        kept = models.Tag.objects.create(user=other, name='tag 0')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(user.purge(batch_size=2), 5)
+
+        deletes = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE FROM "core_tag"')]
+        self.assertEqual(len(deletes), 3)
+
+        self.assertFalse(get_user_model().objects.filter(
+            pk=user.pk).exists())
+        self.assertEqual(list(models.Tag.objects.all()), [kept])
+
+    def test_raw_delete_refuses_dependants(self):
+        '''test that raw deletes refuse models other rows point to'''
+        sample_user()
+
+        with self.assertRaises(ValueError):
+            raw_delete(get_user_model().objects.all())
+        self.assertEqual(get_user_model().objects.count(), 1)
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.middleware import RepeatedQueryDetector, RepeatedQueryMiddleware, \
+    query_shape
+from core.models import Tag
+from core.testing import query_budget
+
+from recipe.cache import get_tag_list_cache
+
+
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        get_tag_list_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_only_requests_counted(self):
+        '''test that queries outside of requests are not counted'''
+        with query_budget(2):
+            Tag.objects.create(user=self.user, name='Vegan')
+            self.client.get(reverse('recipe:tag-list'))
+
+    def test_over_budget_fails(self):
+        '''test that a request over its budget fails with the queries'''
+        with self.assertRaisesRegex(AssertionError, 'budget is 1\n1. '):
+            with query_budget(1):
+                self.client.get(reverse('recipe:tag-list'))
+
+
+class RepeatedQueryDetectorTests(TestCase):
+
+    def test_query_shape(self):
+        '''test that parameter lists of any length have one shape'''
+        self.assertEqual(
+            query_shape('SELECT 1 WHERE id IN (%s, %s, %s) AND a = %s'),
+            'SELECT 1 WHERE id IN (...) AND a = %s')
+
+    def test_repeated_query_logged_once(self):
+        '''test that a query per row is logged once with its caller'''
+        user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass123')
+        tags = [Tag.objects.create(user=user, name=str(i)) for i in range(5)]
+        detector = RepeatedQueryDetector(threshold=3)
+
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            with connection.execute_wrapper(detector):
+                for tag in tags:
+                    Tag.objects.get(id=tag.id)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('more than 3 times', logs.output[0])
+        self.assertIn('test_queries.py', logs.output[0])
+
+    @override_settings(DEBUG=False)
+    def test_middleware_only_with_debug(self):
+        '''test that the detector is not loaded in production'''
+        with self.assertRaises(MiddlewareNotUsed):
+            RepeatedQueryMiddleware(lambda request: None)
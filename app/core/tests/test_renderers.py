@@ -0,0 +1,95 @@
+import datetime
+import uuid
+
+import msgpack
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from core.parsers import MessagePackParser
+from core.renderers import MessagePackRenderer
+from core.throttling import get_throttle_store
+
+from recipe.cache import get_tag_list_cache
+
+
+class MessagePackTests(TestCase):
+
+    def test_round_trip(self):
+        '''test that rendered data parses back, odd types as in JSON'''
+        key = uuid.uuid4()
+        data = {'name': 'Vegan', 'ids': [1, 2], 'key': key,
+                'at': datetime.datetime(2021, 5, 1, 12, 30)}
+
+        content = MessagePackRenderer().render(data)
+        parsed = MessagePackParser().parse(_Stream(content))
+
+        self.assertEqual(parsed, {
+            'name': 'Vegan', 'ids': [1, 2], 'key': str(key),
+            'at': '2021-05-01T12:30:00'})
+        self.assertEqual(MessagePackRenderer().render(None), b'')
+
+    def test_malformed_body(self):
+        '''test that a malformed body is a parse error'''
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(_Stream(b'\xc1'))
+
+
+class _Stream:
+
+    def __init__(self, content):
+        self.content = content
+
+    def read(self):
+        return self.content
+
+
+class MessagePackApiTests(TestCase):
+
+    def setUp(self):
+        get_tag_list_cache().clear()
+        get_throttle_store().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass123')
+        self.client = APIClient()
+
+    def test_tag_list_accept_msgpack(self):
+        '''test that the tag list is rendered as MessagePack on request'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(reverse('recipe:tag-list'),
+                              HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        body = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual([tag['name'] for tag in body['results']], ['Vegan'])
+
+        res = self.client.get(reverse('recipe:tag-list'))
+        self.assertEqual(res['Content-Type'], 'application/json')
+
+    def test_login_with_msgpack_body(self):
+        '''test that a token is issued for credentials sent as MessagePack'''
+        body = msgpack.packb(
+            {'email': 'test@gmail.com', 'password': 'testpass123'})
+
+        res = self.client.post(reverse('user:token'), body,
+                               content_type='application/msgpack',
+                               HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', msgpack.unpackb(res.content, raw=False))
+
+    def test_malformed_msgpack_body(self):
+        '''test that a malformed MessagePack body is answered 400'''
+        res = self.client.post(reverse('user:token'), b'\xc1',
+                               content_type='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,150 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware, pin_key
+from core.models import Tag
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+@patch('core.routers.check_replica')
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        routers._down_until.clear()
+        self.router = routers.ReplicaRouter()
+        self.addCleanup(routers.use_replicas, False)
+
+    def test_reads_use_primary_by_default(self, check):
+        '''test that reads go to the primary unless replicas are enabled'''
+        self.assertEqual(self.router.db_for_read(Tag), 'default')
+        check.assert_not_called()
+
+    def test_reads_use_replica(self, check):
+        '''test that enabled reads go to one of the replicas'''
+        routers.use_replicas(True)
+
+        self.assertIn(self.router.db_for_read(Tag), ['replica1', 'replica2'])
+
+    def test_writes_use_primary(self, check):
+        '''test that writes always go to the primary'''
+        routers.use_replicas(True)
+
+        self.assertEqual(self.router.db_for_write(Tag), 'default')
+
+    def test_one_replica_per_request(self, check):
+        '''test that the reads of a request all go to the same replica'''
+        routers.use_replicas(True)
+
+        aliases = {self.router.db_for_read(Tag) for i in range(20)}
+
+        self.assertEqual(len(aliases), 1)
+        self.assertEqual(check.call_count, 1)
+
+    def test_failover_to_healthy_replica(self, check):
+        '''test that a replica that is down is skipped for a while'''
+        check.side_effect = lambda alias: self.fail_for(alias, 'replica1')
+        routers.use_replicas(True)
+
+        for i in range(5):
+            routers.use_replicas(True)  # a new request
+            self.assertEqual(self.router.db_for_read(Tag), 'replica2')
+        # replica1 is only tried once, then skipped until it may be retried
+        tried = [call[0][0] for call in check.call_args_list]
+        self.assertLessEqual(tried.count('replica1'), 1)
+
+    def test_failover_to_primary(self, check):
+        '''test that reads fall back to the primary if all replicas fail'''
+        check.side_effect = OperationalError
+        routers.use_replicas(True)
+
+        self.assertEqual(self.router.db_for_read(Tag), 'default')
+
+    def test_replicas_not_migrated(self, check):
+        '''test that migrations only run on the primary'''
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+
+    def fail_for(self, alias, down):
+        if alias == down:
+            raise OperationalError('connection refused')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'],
+                   DATABASE_REPLICA_PIN_CACHE='default')
+class ReplicaRoutingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.factory = RequestFactory()
+        self.seen = []
+        self.middleware = ReplicaRoutingMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.seen.append(routers.replicas_enabled())
+        return HttpResponse()
+
+    def request(self, method, token='abc', **extra):
+        if token is not None:
+            extra['HTTP_AUTHORIZATION'] = 'Token ' + token
+        request = getattr(self.factory, method)('/api/user/me/', **extra)
+        self.middleware(request)
+        return self.seen[-1]
+
+    def test_safe_requests_use_replicas(self):
+        '''test that only safe requests read from the replicas'''
+        self.assertTrue(self.request('get'))
+        self.assertFalse(self.request('patch'))
+        self.assertFalse(routers.replicas_enabled())  # reset afterwards
+
+    def test_client_pinned_to_primary_after_write(self):
+        '''test that a client reads from the primary right after a write'''
+        self.request('patch')
+
+        self.assertFalse(self.request('get'))
+        self.assertTrue(self.request('get', token='other'))
+
+    def test_new_token_pinned(self):
+        '''test that credentials handed out by a write are pinned'''
+        def login(request):
+            routers.pin('Token new')
+            return HttpResponse()
+        request = self.factory.post('/api/user/token/')
+        ReplicaRoutingMiddleware(login)(request)
+
+        self.assertFalse(self.request('get', token='new'))
+        self.assertTrue(self.request('get', token='other'))
+
+    def test_anonymous_write_pins_address(self):
+        '''test that an anonymous client is pinned by its address'''
+        self.request('post', token=None, REMOTE_ADDR='198.51.100.1')
+
+        self.assertFalse(
+            self.request('get', token=None, REMOTE_ADDR='198.51.100.1'))
+        self.assertTrue(
+            self.request('get', token=None, REMOTE_ADDR='198.51.100.2'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'],
+                   DATABASE_REPLICA_PIN_CACHE='default')
+class LoginPinTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        get_user_model().objects.create_user('test@gmail.com', 'testpass123')
+
+    def test_login_pins_token(self):
+        '''test that the first reads with a new token use the primary'''
+        res = APIClient().post(reverse('user:token'), {
+            'email': 'test@gmail.com', 'password': 'testpass123'})
+
+        key = pin_key('Token ' + res.data['token'])
+        self.assertTrue(caches['default'].get(key))
@@ -0,0 +1,90 @@
+import json
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+
+
+calls = []
+
+
+@tasks.task
+def record(value):
+    calls.append(value)
+
+
+@tasks.task
+def explode():
+    raise ValueError('boom')
+
+
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        '''test that a queued task runs once and is removed'''
+        queued = tasks.enqueue(record, value=3)
+
+        self.assertEqual(queued.name, 'core.tests.test_tasks.record')
+        self.assertEqual(json.loads(queued.payload), {'value': 3})
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertEqual(tasks.run_pending(), (0, 0))
+        self.assertEqual(calls, [3])
+        self.assertFalse(Task.objects.exists())
+
+    def test_enqueue_unregistered(self):
+        '''test that only registered tasks can be queued'''
+        with self.assertRaises(KeyError):
+            tasks.enqueue('core.tests.test_tasks.missing')
+
+    def test_delayed_task_waits(self):
+        '''test that a task is not run before it is due'''
+        tasks.enqueue(record, delay=60, value=1)
+
+        self.assertEqual(tasks.run_pending(), (0, 0))
+        self.assertEqual(calls, [])
+
+    @override_settings(TASK_MAX_ATTEMPTS=2, TASK_RETRY_DELAY=10)
+    def test_failed_task_retried_then_kept(self):
+        '''test that failures back off and are kept after the last try'''
+        queued = tasks.enqueue(explode)
+
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('boom', queued.last_error)
+        self.assertGreater(
+            queued.run_after, timezone.now() + timedelta(seconds=5))
+
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('core.tasks', 'ERROR'):
+            tasks.run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.FAILED)
+        self.assertEqual(tasks.run_pending(), (0, 0))
+
+    def test_expired_lease_reclaimed(self):
+        '''test that a task whose worker died is run again'''
+        tasks.enqueue(record, value=5)
+        Task.objects.update(
+            status=Task.RUNNING, run_after=timezone.now() + timedelta(1))
+        self.assertEqual(tasks.run_pending(), (0, 0))
+
+        Task.objects.update(run_after=timezone.now())
+
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertEqual(calls, [5])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager(self):
+        '''test that eager tasks run inline without a row'''
+        self.assertIsNone(tasks.enqueue(record, value=7))
+        self.assertEqual(calls, [7])
+        self.assertFalse(Task.objects.exists())
@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.cache import SharedCounters
+from core.throttling import SlidingWindowCounter, get_throttle_store, \
+    parse_rate
+
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+
+
+class SlidingWindowCounterTests(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+        self.store = SharedCounters(self.path, slots=64)
+        self.counter = SlidingWindowCounter(self.store)
+
+    def test_parse_rate(self):
+        '''test that rates are read as a count per period in seconds'''
+        self.assertEqual(parse_rate('5/min'), (5, 60))
+        self.assertEqual(parse_rate('100/s'), (100, 1))
+        self.assertEqual(parse_rate('20/hour'), (20, 3600))
+
+    def test_limit_within_window(self):
+        '''test that hits over the limit are rejected with a wait'''
+        for i in range(3):
+            self.assertEqual(
+                self.counter.hit('k', 3, 60, now=6000 + i), (True, None))
+
+        allowed, wait = self.counter.hit('k', 3, 60, now=6010)
+
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 120)
+
+    def test_previous_window_slides_out(self):
+        '''test that the previous window counts by how much is covered'''
+        for i in range(4):
+            self.counter.hit('k', 5, 60, now=6000 + i)
+
+        # 3/4 of the previous window is still covered, estimate 3
+        self.assertTrue(self.counter.hit('k', 5, 60, now=6075)[0])
+        # estimate 3 + 1 then, under the limit
+        self.assertTrue(self.counter.hit('k', 5, 60, now=6075)[0])
+        # 3 + 2 is not, until half of the previous window is left
+        allowed, wait = self.counter.hit('k', 5, 60, now=6075)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(6075 + wait, 6090)
+        self.assertTrue(self.counter.hit('k', 5, 60, now=6090)[0])
+
+    def test_keys_counted_apart(self):
+        '''test that each key has its own counters'''
+        self.counter.hit('a', 1, 60, now=6000)
+
+        self.assertFalse(self.counter.hit('a', 1, 60, now=6001)[0])
+        self.assertTrue(self.counter.hit('b', 1, 60, now=6001)[0])
+
+    def test_rejected_not_counted(self):
+        '''test that rejected hits do not extend the block'''
+        self.counter.hit('k', 1, 60, now=6000)
+        for i in range(10):
+            self.counter.hit('k', 1, 60, now=6001 + i)
+
+        self.assertTrue(self.counter.hit('k', 1, 60, now=6120)[0])
+
+    def test_counter_expires_after_next_window(self):
+        '''test that a counter lasts until the end of the next window'''
+        for i in range(3):
+            self.counter.hit('k', 3, 3600, now=36000 + i)
+
+        # long idle periods within the hour don't reset the count
+        self.assertFalse(self.counter.hit('k', 3, 3600, now=36000 + 3000)[0])
+        with self.store.locked():
+            self.assertEqual(self.store.get('k:10', 36000 + 7199), 3)
+            self.assertEqual(self.store.get('k:10', 36000 + 7200), 0)
+
+    def test_counters_bounded(self):
+        '''test that a full table reuses the slot expiring first'''
+        with self.store.locked():
+            for i in range(200):
+                self.store.incr(f'k{i}', 100 + i, now=0)
+            self.assertEqual(self.store.get('k199', 0), 1)
+        self.assertEqual(os.path.getsize(self.path),
+                         64 * SharedCounters.SLOT.size)
+
+    def test_hits_counted_across_processes(self):
+        '''test that concurrent worker processes lose no increments'''
+        processes = [multiprocessing.Process(
+            target=hit_many, args=(self.path, 200)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        with self.store.locked():
+            self.assertEqual(self.store.get('k:100', 6000), 800)
+
+
+def hit_many(path, hits):
+    counter = SlidingWindowCounter(SharedCounters(path, slots=64))
+    for _ in range(hits):
+        counter.hit('k', 10000, 60, now=6000)
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        get_throttle_store().clear()
+        self.client = APIClient()
+
+    def rates(self, **rates):
+        return self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {
+            'login_ip': '100/min', 'login_email': '100/min',
+            'signup_ip': '100/min', 'signup_email': '100/min', **rates}})
+
+    def test_login_throttled_per_email(self):
+        '''test that logins for one email are throttled without queries'''
+        payload = {'email': 'test@gmail.com', 'password': 'wrong'}
+        with self.rates(login_email='2/min'):
+            for i in range(2):
+                res = self.client.post(TOKEN_URL, payload)
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            with self.assertNumQueries(0):
+                res = self.client.post(
+                    TOKEN_URL, {**payload, 'email': ' Test@Gmail.com'})
+            other = self.client.post(
+                TOKEN_URL, {**payload, 'email': 'other@gmail.com'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(other.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_throttled_per_ip(self):
+        '''test that logins from one address are throttled for any email'''
+        with self.rates(login_ip='2/min'):
+            for i in range(2):
+                self.client.post(
+                    TOKEN_URL, {'email': f'{i}@gmail.com', 'password': 'pw'})
+
+            with self.assertNumQueries(0):
+                res = self.client.post(
+                    TOKEN_URL, {'email': 'new@gmail.com', 'password': 'pw'})
+            other = self.client.post(
+                TOKEN_URL, {'email': 'new@gmail.com', 'password': 'pw'},
+                REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_signup_throttled_per_ip(self):
+        '''test that signups from one address are throttled'''
+        with self.rates(signup_ip='1/min'):
+            self.client.post(CREATE_USER_URL, {
+                'email': 'a@gmail.com', 'password': 'testpass', 'name': 'a'})
+
+            with self.assertNumQueries(0):
+                res = self.client.post(CREATE_USER_URL, {
+                    'email': 'b@gmail.com', 'password': 'testpass',
+                    'name': 'b'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_missing_rate(self):
+        '''test that a throttled scope without a rate is a config error'''
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {}}):
+            with self.assertRaises(ImproperlyConfigured):
+                self.client.post(TOKEN_URL, {'email': 'a@gmail.com'})
@@ -0,0 +1,131 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from core.cache import SharedCounters
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    '''"<count>/<period>" as (count, seconds), period is s, m, h or d'''
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class SlidingWindowCounter:
+    '''approximate sliding window hit counts, kept in SharedCounters
+
+    each key has a counter per fixed window, only the current and the
+    previous one are read. the previous count is weighted by how much of
+    it the sliding window still covers, so a check is two reads and an
+    increment whatever the rate. both happen under the store lock, so
+    concurrent workers never lose hits, and a counter expires at the end
+    of the window after its own
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key, limit, window, now=None):
+        '''count a hit unless the limit is reached, return (allowed, wait)'''
+        now = time.time() if now is None else now
+        index, offset = divmod(now, window)
+        current_key = '%s:%d' % (key, index)
+        previous_key = '%s:%d' % (key, index - 1)
+        with self.store.locked():
+            current = self.store.get(current_key, now)
+            previous = self.store.get(previous_key, now)
+
+            weight = 1 - offset / window  # share of the previous window left
+            if previous * weight + current >= limit:
+                return False, self.wait(
+                    previous, current, limit, window, offset)
+
+            # read as the previous window until the next one ends
+            self.store.incr(current_key, (index + 2) * window, now)
+        return True, None
+
+    def wait(self, previous, current, limit, window, offset):
+        '''seconds until the estimate drops below the limit'''
+        if current < limit and previous:
+            # the previous window slides out until one more hit fits
+            share = 1 - (limit - 1 - current) / previous
+            return max(share * window - offset, 0)
+        # the current window has to become the previous one first
+        wait = window - offset
+        if current:
+            wait += max(1 - (limit - 1) / current, 0) * window
+        return wait
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    '''limit the requests of a view per key with a sliding window
+
+    the rate is DEFAULT_THROTTLE_RATES["<view.throttle_scope>_<kind>"],
+    the counters live in the THROTTLE_STORE_PATH file, shared by the
+    worker processes of a host. a check never touches the database, so
+    rejected requests cost a locked read of shared memory
+    '''
+    kind = None
+
+    def get_key(self, request):
+        '''identify the client, None leaves the request unthrottled'''
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = '%s_%s' % (view.throttle_scope, self.kind)
+        try:
+            limit, window = parse_rate(
+                api_settings.DEFAULT_THROTTLE_RATES[scope])
+        except KeyError:
+            raise ImproperlyConfigured(f'No throttle rate for {scope}')
+
+        key = self.get_key(request)
+        if key is None:
+            return True
+        counter = SlidingWindowCounter(get_throttle_store())
+        allowed, self.wait_seconds = counter.hit(
+            f'throttle:{scope}:{key}', limit, window)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SlidingWindowIPThrottle(SlidingWindowThrottle):
+    '''per client address, behind NUM_PROXIES proxies'''
+    kind = 'ip'
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class SlidingWindowEmailThrottle(SlidingWindowThrottle):
+    '''per account the request names in its email field'''
+    kind = 'email'
+
+    def get_key(self, request):
+        data = request.data  # a body that isn't an object has no email
+        email = data.get('email') if isinstance(data, dict) else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return hashlib.sha1(email.strip().lower().encode()).hexdigest()
+
+
+_throttle_store = None
+
+
+def get_throttle_store():
+    '''return the process wide throttle counters, built from the settings'''
+    global _throttle_store
+    if _throttle_store is None:
+        _throttle_store = SharedCounters(
+            settings.THROTTLE_STORE_PATH, settings.THROTTLE_STORE_SLOTS)
+    return _throttle_store
@@ -0,0 +1,36 @@
+import hmac
+import ipaddress
+
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.conf import settings
+
+from core import metrics as core_metrics
+
+
+def metrics_allowed(request):
+    '''whether the request comes from METRICS_ALLOWED_IPS or carries the
+    METRICS_TOKEN bearer token'''
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if settings.METRICS_TOKEN and hmac.compare_digest(
+            auth.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    '''expose the metrics of every worker process to Prometheus
+
+    the workers flush their histograms to METRICS_DIR and the answering
+    worker sums the files, so any worker can be scraped
+    '''
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        core_metrics.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,88 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.cache import LRUCache
+
+
+class TagListCache:
+    '''per-user cache of rendered tag list responses
+
+    entries are keyed by user, a per-user generation and the request path
+    with its query string. invalidating a user just starts a new
+    generation, so the old entries are never served again and age out of
+    the LRU or TTL. the backend is a local LRU or any django cache alias.
+
+    a response is stored under the generation read before its rows were,
+    and writers invalidate once they committed, so a list read before a
+    write lands under a generation that write already retired
+    '''
+
+    def __init__(self, backend='local', max_size=10000, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        if backend == 'local':
+            self.local = LRUCache(max_size=max_size, ttl=ttl)
+
+    def _get(self, key):
+        if self.backend == 'local':
+            return self.local.get(key)
+        return caches[self.backend].get(key)
+
+    def _set(self, key, value):
+        if self.backend == 'local':
+            self.local.set(key, value)
+        else:
+            caches[self.backend].set(key, value, self.ttl)
+
+    def generation(self, user_id):
+        '''return the current generation of a user's entries'''
+        key = 'tag-list-gen:%s' % user_id
+        generation = self._get(key)
+        if generation is None:
+            # a lost generation must never bring back older entries
+            generation = uuid.uuid4().hex
+            self._set(key, generation)
+        return generation
+
+    def key(self, user_id, generation, full_path):
+        digest = hashlib.md5(full_path.encode()).hexdigest()
+        return 'tag-list:%s:%s:%s' % (user_id, generation, digest)
+
+    def get(self, user_id, generation, full_path):
+        '''return the cached (etag, content, content type) or None'''
+        return self._get(self.key(user_id, generation, full_path))
+
+    def set(self, user_id, generation, full_path, etag, content,
+            content_type):
+        '''store a response under the generation read before its rows'''
+        self._set(self.key(user_id, generation, full_path),
+                  (etag, content, content_type))
+
+    def invalidate(self, user_id):
+        '''forget every cached list of a user'''
+        self._set('tag-list-gen:%s' % user_id, uuid.uuid4().hex)
+
+    def clear(self):
+        if self.backend == 'local':
+            self.local.clear()
+        else:
+            caches[self.backend].clear()
+
+
+_tag_list_cache = None
+
+
+def get_tag_list_cache():
+    '''return the process wide tag list cache, built from the settings'''
+    global _tag_list_cache
+    if _tag_list_cache is None:
+        options = settings.TAG_LIST_CACHE
+        _tag_list_cache = TagListCache(
+            backend=options['BACKEND'],
+            max_size=options['MAX_SIZE'],
+            ttl=options['TTL'],
+        )
+    return _tag_list_cache
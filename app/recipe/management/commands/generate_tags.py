@@ -0,0 +1,79 @@
+import itertools
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Tag
+
+
+# tag names are built from these so prefixes and near misses repeat the way
+# they do in real data, which is what search and autocomplete have to rank
+WORDS = (
+    'apple', 'basil', 'butter', 'cajun', 'chili', 'cinnamon', 'coconut',
+    'curry', 'dessert', 'dinner', 'garlic', 'ginger', 'gluten free',
+    'grill', 'honey', 'italian', 'kosher', 'lemon', 'lunch', 'mango',
+    'mexican', 'mint', 'noodle', 'onion', 'paleo', 'pasta', 'pepper',
+    'quick', 'roast', 'salad', 'smoky', 'soup', 'spicy', 'summer', 'sweet',
+    'thai', 'tomato', 'vegan', 'vegetarian', 'winter',
+)
+
+
+def tag_names(rng):
+    '''yield tag names forever, one or two words and a rare numeric suffix'''
+    while True:
+        name = ' '.join(rng.sample(WORDS, rng.choice((1, 2, 2, 3))))
+        if rng.random() < 0.3:
+            name = f'{name} {rng.randrange(1000)}'
+        yield name.title() if rng.random() < 0.5 else name
+
+
+class Command(BaseCommand):
+    '''Django command to fill the database with tags for benchmarks'''
+    help = 'Generate a reproducible tag dataset for search benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='users owning the generated tags')
+        parser.add_argument(
+            '--tags-per-user', type=int, default=1000,
+            help='tags created for each user')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='seed of the names, the same seed gives the same dataset')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='tags inserted and committed together')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = tag_names(rng)
+        batch_size = options['batch_size']
+
+        user_ids = self.create_users(options['users'], options['seed'])
+        for user_id in user_ids:
+            tags = (
+                Tag(user_id=user_id, name=name) for name in
+                itertools.islice(names, options['tags_per_user'])
+            )
+            while True:
+                batch = list(itertools.islice(tags, batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    Tag.objects.bulk_create(batch)
+
+        total = len(user_ids) * options['tags_per_user']
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} tags for {len(user_ids)} users'))
+
+    def create_users(self, count, seed):
+        '''create the owners, passwordless, and return their ids'''
+        emails = [f'tags-{seed}-{i}@example.com' for i in range(count)]
+        manager = get_user_model().objects
+        manager.bulk_create_users(
+            {'email': email, 'name': email} for email in emails)
+        return list(manager.filter(email__in=emails)
+                    .order_by('email').values_list('id', flat=True))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from core.models import Tag, TagName
+
+
+class Command(BaseCommand):
+    '''Django command reporting the storage saved by interned tag names'''
+    help = 'Report tag name storage, interned against one copy per tag'
+
+    def handle(self, *args, **options):
+        tags = Tag._base_manager.aggregate(
+            count=Count('id'), size=Sum(Length('tag_name__name')))
+        names = TagName.objects.aggregate(
+            count=Count('id'), size=Sum(Length('name')))
+        per_tag = tags['size'] or 0
+        interned = names['size'] or 0
+        self.stdout.write(
+            f'{tags["count"]} tags share {names["count"]} names: '
+            f'{interned} name characters stored instead of {per_tag}, '
+            f'{per_tag - interned} saved')
+
+        if connection.vendor == 'postgresql':
+            for table in (Tag._meta.db_table, TagName._meta.db_table):
+                self.stdout.write(self.relation_sizes(table))
+
+    def relation_sizes(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_size_pretty(pg_table_size(%s)), '
+                'pg_size_pretty(pg_indexes_size(%s))', [table, table])
+            table_size, index_size = cursor.fetchone()
+        return f'{table}: table {table_size}, indexes {index_size}'
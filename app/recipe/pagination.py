@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TagCursorPagination(CursorPagination):
+    '''keyset pagination over a user's tags
+
+    pages are addressed by an opaque cursor instead of an OFFSET, so the
+    cost of fetching a page stays flat however deep the client scrolls and
+    is served by the (user, sort_name, id) index on the tag table.
+    sort_name copies the interned name, the rows hold it as name
+    '''
+    ordering = ('-sort_name', '-id')  # matches the index, id breaks ties
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def _get_position_from_instance(self, instance, ordering):
+        return super()._get_position_from_instance(
+            instance, [field.replace('sort_name', 'name')
+                       for field in ordering])
@@ -1,12 +1,73 @@
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from core.models import Tag
 
 
-class TagSerializer(serializerisers.ModelSerializer):
+class TagSerializer(serializers.ModelSerializer):
     '''serializer for tag objects'''
+    # the interned name, the same field the model column used to give
+    name = serializers.CharField(max_length=255)
 
     class Meta:
         model = Tag
         fields = ('id', 'name')
         read_only_fields = ('id', )
+
+
+class TagUpdateSerializer(TagSerializer):
+    '''serializer for a tag update, addressed by id'''
+    id = serializers.IntegerField()
+
+
+class TagBulkSerializer(serializers.Serializer):
+    '''serializer for a batch of tag creates, updates and deletes
+
+    every item is validated before anything is written, errors are
+    reported per item at the index it had in the payload
+    '''
+    create = TagSerializer(many=True, required=False)
+    update = TagUpdateSerializer(many=True, required=False)
+    delete = serializers.ListField(
+        child=serializers.IntegerField(), required=False)
+
+    def to_internal_value(self, data):
+        '''check the batch size before validating any item'''
+        if isinstance(data, dict):
+            size = sum(len(data[key]) for key in self.fields
+                       if isinstance(data.get(key), list))
+            if size > settings.TAG_BULK_MAX_ITEMS:
+                raise serializers.ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        _('At most %d items per request') %
+                        settings.TAG_BULK_MAX_ITEMS]})
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        '''check that the addressed tags exist'''
+        updates = [item['id'] for item in attrs.get('update', ())]
+        deletes = attrs.get('delete', [])
+        owned = set(Tag._base_manager.filter(
+            user=self.context['request'].user,
+            id__in=updates + deletes,
+        ).values_list('id', flat=True))  # one query for the whole batch
+
+        errors = {}
+        for key, ids in (('update', updates), ('delete', deletes)):
+            seen = set()
+            item_errors = [{} for _id in ids]
+            for index, tag_id in enumerate(ids):
+                if tag_id not in owned:
+                    item_errors[index] = {'id': [_('Tag not found')]}
+                elif tag_id in seen:
+                    item_errors[index] = {'id': [_('Tag given twice')]}
+                seen.add(tag_id)
+            if any(item_errors):
+                errors[key] = item_errors
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return attrs
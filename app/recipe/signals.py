@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Tag
+
+from recipe.cache import get_tag_list_cache
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_lists(sender, instance, using, **kwargs):
+    '''drop the cached tag lists of the tag owner once the write commits,
+    a list read before that would be cached again otherwise'''
+    user_id = instance.user_id
+    transaction.on_commit(
+        lambda: get_tag_list_cache().invalidate(user_id), using=using)
@@ -0,0 +1,61 @@
+import json
+
+from django.db import connections
+
+
+def iter_rows(queryset, chunk_size):
+    '''yield the dicts of a values() queryset holding one chunk at a time
+
+    backends with chunked reads stream from a server-side cursor. the
+    others (sqlite) would fetch the whole result at once, so they are
+    walked in keyset batches on the primary key instead
+    '''
+    queryset = queryset.order_by('id')
+    if connections[queryset.db].features.can_use_chunked_reads:
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else \
+            queryset.filter(id__gt=last_id)
+        rows = list(batch[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]['id']
+
+
+def dumps(row):
+    # same compact, non ascii escaping output as DRF's JSONRenderer
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+
+
+def ndjson(rows):
+    '''one JSON document per line'''
+    for row in rows:
+        yield dumps(row) + '\n'
+
+
+def json_array(rows):
+    '''a single JSON array, written element by element'''
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + dumps(row)
+        separator = ','
+    yield ']'
+
+
+def buffered(chunks, size):
+    '''join small text chunks into utf-8 blocks of about size bytes'''
+    buffer, length = [], 0
+    for chunk in chunks:
+        chunk = chunk.encode()
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
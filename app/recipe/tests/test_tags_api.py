@@ -1,16 +1,33 @@
+import gzip
+import io
+import json
+import random
+import tracemalloc
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Tag
+from core.testing import on_commit_callbacks, query_budget
 
+from recipe.cache import get_tag_list_cache
+from recipe.management.commands.generate_tags import tag_names
 from recipe.serializers import TagSerializer
+from recipe.views import TagViewsSet
 
 
 TAGS_URL = reverse('recipe:tag-list')
+EXPORT_URL = reverse('recipe:tag-export')
+BULK_URL = reverse('recipe:tag-bulk')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsApiTests(TestCase):
@@ -19,6 +36,7 @@ class PublicTagsApiTests(TestCase):
     def setUp(self):
         self.client = APIClient()
 
+    @query_budget(0)
     def test_login_required(self):
         '''test that login is required for retrieving tags'''
         res = self.client.get(TAGS_URL)
@@ -30,13 +48,15 @@ class PrivateTagsApiTests(TestCase):
     '''test the authorized user tags API'''
 
     def setUp(self):
-        self.user = get_user_model().objects().create_user(
+        get_tag_list_cache().clear()
+        self.user = get_user_model().objects.create_user(
             'test@londonappdev.com',
             'testpass123'
         )
         self.client = APIClient()
         self.client.force_authenticate(self.user)
 
+    @query_budget(2)
     def test_retrieve_tags(self):
         '''test retrieving tags'''
         Tag.objects.create(user=self.user, name='Vegan')
@@ -48,8 +68,9 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
+    @query_budget(2)
     def test_tags_limited_to_user(self):
         '''test that tags returned are for the authenticated user'''
         user2 = get_user_model().objects.create_user(
@@ -62,5 +83,368 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)  # authenticated user only 1
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)  # authenticated user
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+
+    @query_budget(6)
+    def test_tags_paginated_by_cursor(self):
+        '''test that tags are paged with an opaque cursor, not an offset'''
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['e', 'd'])
+        self.assertIn('cursor=', res.data['next'])
+        self.assertNotIn('offset=', res.data['next'])
+
+        names = []
+        url = res.data['next']
+        while url:  # follow the cursors until the last page
+            res = self.client.get(url)
+            names += [tag['name'] for tag in res.data['results']]
+            url = res.data['next']
+
+        self.assertEqual(names, ['c', 'b', 'a'])
+
+    def test_renamed_tags_listed_by_new_name(self):
+        '''test that the list order follows renames, single and bulk'''
+        first = Tag.objects.create(user=self.user, name='a')
+        second = Tag.objects.create(user=self.user, name='b')
+        Tag.objects.create(user=self.user, name='c')
+        first.name = 'z'
+        first.save(update_fields=['name'])
+        self.client.post(BULK_URL, {
+            'update': [{'id': second.id, 'name': 'y'}]}, format='json')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['z', 'y', 'c'])
+
+    @query_budget(4)
+    def test_tags_not_modified(self):
+        '''test that an unchanged tag list is answered with a 304'''
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):  # answered from the cache
+            res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+        with on_commit_callbacks():
+            tag.delete()
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    @query_budget(4)
+    def test_tags_etag_changes_on_update(self):
+        '''test that renaming a tag changes the list ETag'''
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        with on_commit_callbacks():
+            tag.name = 'Vegetarian'
+            tag.save()
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @query_budget(2)
+    def test_tags_served_from_cache(self):
+        '''test that a repeated list call skips the ORM and serializer'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(TAGS_URL)
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached['ETag'], res['ETag'])
+        self.assertEqual(cached['Content-Type'], res['Content-Type'])
+
+    @query_budget(4)
+    def test_tags_cache_keyed_by_query(self):
+        '''test that pages with other query params are cached apart'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(TAGS_URL, {'page_size': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    @query_budget(6)
+    def test_tags_cache_invalidated_on_change(self):
+        '''test that saving or deleting a tag drops the cached lists'''
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with on_commit_callbacks():
+            Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(len(res.data['results']), 2)
+
+        with on_commit_callbacks():
+            tag.delete()
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tags_cache_invalidated_after_commit(self):
+        '''test that a list read before a write commits is never served'''
+        cache = get_tag_list_cache()
+        generation = cache.generation(self.user.pk)
+
+        with on_commit_callbacks():
+            Tag.objects.create(user=self.user, name='Vegan')
+            # a concurrent list still sees the generation it read
+            self.assertEqual(cache.generation(self.user.pk), generation)
+
+        # and the response it stores under it is retired
+        cache.set(self.user.pk, generation, TAGS_URL, '"stale"', b'[]',
+                  'application/json')
+        self.assertIsNone(cache.get(
+            self.user.pk, cache.generation(self.user.pk), TAGS_URL))
+
+    @query_budget(2)
+    def test_export_json(self):
+        '''test exporting all tags of the user as a streamed JSON array'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass123')
+        Tag.objects.create(user=other, name='Fruity')
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dessert')]
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        data = json.loads(b''.join(res.streaming_content))
+        self.assertEqual(data, TagSerializer(tags, many=True).data)
+
+    @query_budget(2)
+    def test_export_ndjson_gzip(self):
+        '''test exporting tags as gzip compressed NDJSON'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(
+            EXPORT_URL, {'layout': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(res.streaming_content)).splitlines()
+        self.assertEqual(
+            [json.loads(line)['name'] for line in lines], ['Vegan', 'Dessert'])
+
+    @override_settings(TAG_EXPORT_CHUNK_SIZE=500, TAG_EXPORT_BLOCK_SIZE=8192)
+    @query_budget(81)
+    def test_export_memory_bounded(self):
+        '''test that exporting holds one chunk of rows at a time'''
+        Tag.objects.bulk_create(
+            Tag(user=self.user, name='tag number %06d' % i)
+            for i in range(40000))
+        res = self.client.get(EXPORT_URL)
+
+        tracemalloc.start()
+        size = sum(len(block) for block in res.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertGreater(size, 1536 * 1024)
+        self.assertLess(peak, 1024 * 1024)  # the same bound holds for 5M
+
+    @query_budget(6)
+    def test_create_tag_successful(self):
+        '''test creating a new tag'''
+        res = self.client.post(TAGS_URL, {'name': 'Test tag'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            Tag.objects.filter(user=self.user, name='Test tag').exists())
+
+    @query_budget(0)
+    def test_create_tag_invalid(self):
+        '''test creating a new tag with invalid payload'''
+        res = self.client.post(TAGS_URL, {'name': ''})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @query_budget(11)
+    def test_bulk_changes(self):
+        '''test creating, renaming and deleting tags in one request'''
+        rename = Tag.objects.create(user=self.user, name='Vegan')
+        remove = Tag.objects.create(user=self.user, name='Dessert')
+        payload = {
+            'create': [{'name': 'Fruity'}, {'name': 'Spicy'}],
+            'update': [{'id': rename.id, 'name': 'Vegetarian'}],
+            'delete': [remove.id],
+        }
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data['created']], ['Fruity', 'Spicy'])
+        self.assertEqual(res.data['deleted'], [remove.id])
+        names = Tag.objects.filter(user=self.user).values_list(
+            'name', flat=True)
+        self.assertEqual(
+            sorted(names), ['Fruity', 'Spicy', 'Vegetarian'])
+
+    @query_budget(11)
+    def test_bulk_one_statement_per_kind(self):
+        '''test that a batch of hundreds of items is a handful of queries'''
+        tags = Tag.objects.bulk_create(
+            Tag(user=self.user, name='old %d' % i) for i in range(400))
+        ids = list(Tag.objects.filter(user=self.user).values_list(
+            'id', flat=True))
+        payload = {
+            'create': [{'name': 'new %d' % i} for i in range(200)],
+            'update': [{'id': i, 'name': 'renamed'} for i in ids[:200]],
+            'delete': ids[200:],
+        }
+
+        # validation, savepoint, names interned (SELECT, savepoint, INSERT,
+        # release, SELECT), INSERT, UPDATE, DELETE, release
+        with self.assertNumQueries(11):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(tags), 400)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 400)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, name='renamed').count(), 200)
+
+    @query_budget(0)
+    def test_bulk_errors_reported_per_item(self):
+        '''test that one invalid item fails the batch with its index'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass123')
+        foreign = Tag.objects.create(user=other, name='Fruity')
+        payload = {
+            'create': [{'name': 'Fine'}, {'name': ''}],
+            'delete': [foreign.id],
+        }
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['create'][0], {})
+        self.assertIn('name', res.data['create'][1])
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+        self.assertTrue(Tag.objects.filter(id=foreign.id).exists())
+
+    @override_settings(TAG_BULK_MAX_ITEMS=3)
+    @query_budget(0)
+    def test_bulk_size_checked_first(self):
+        '''test that oversized batches are refused before any item'''
+        payload = {'create': [{'name': ''}] * 2, 'delete': ['x', 'y']}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(res.data), ['non_field_errors'])
+
+    @query_budget(2)
+    def test_search_tags(self):
+        '''test that ?search= matches any part of the name, any case'''
+        Tag.objects.create(user=self.user, name='Spicy Curry')
+        Tag.objects.create(user=self.user, name='curry night')
+        Tag.objects.create(user=self.user, name='Dessert')
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass123')
+        Tag.objects.create(user=other, name='Curry')
+
+        res = self.client.get(TAGS_URL, {'search': 'CURRY'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']],
+            ['curry night', 'Spicy Curry'])
+
+    @query_budget(1)
+    def test_autocomplete_prefix_ranked(self):
+        '''test that autocomplete returns prefix matches, closest first'''
+        Tag.objects.create(user=self.user, name='Vegetarian')
+        Tag.objects.create(user=self.user, name='vegan')
+        Tag.objects.create(user=self.user, name='Vegan Dessert')
+        Tag.objects.create(user=self.user, name='Not Vegan')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'Vega'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['vegan', 'Vegan Dessert'])
+
+    @override_settings(TAG_AUTOCOMPLETE_LIMIT=2)
+    @query_budget(1)
+    def test_autocomplete_limited(self):
+        '''test that autocomplete caps the number of suggestions'''
+        for name in ('Soup', 'Soup Base', 'Soup Night'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'so'})
+        empty = self.client.get(AUTOCOMPLETE_URL, {'q': ' '})
+
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(empty.data, [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram index on pg')
+    def test_search_uses_index(self):
+        '''test that the ?search= query of the list is served by the
+        trigram index once a user has many tags'''
+        names = tag_names(random.Random(0))
+        Tag.objects.bulk_create(
+            Tag(user=self.user, name=f'{next(names)} {index}')
+            for index in range(20000))
+        Tag.objects.create(user=self.user, name='Spicy Curry')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_tag')
+            cursor.execute('ANALYZE core_tagname')
+        request = Request(APIRequestFactory().get(
+            TAGS_URL, {'search': 'curry'}))
+        request.user = self.user
+        view = TagViewsSet(request=request, action='list', format_kwarg=None)
+
+        plan = view.filter_queryset(view.get_queryset()).explain()
+
+        self.assertIn('core_tagname_name_trgm_idx', plan)
+
+    def test_generate_tags_reproducible(self):
+        '''test that the dataset generator gives the same names per seed'''
+        out = io.StringIO()
+        call_command('generate_tags', users=2, tags_per_user=30,
+                     batch_size=7, seed=3, stdout=out)
+        first = list(Tag.objects.order_by('id').values_list('name', flat=True))
+        Tag.objects.all().delete()
+        call_command('generate_tags', users=2, tags_per_user=30,
+                     seed=3, stdout=io.StringIO())
+        second = list(
+            Tag.objects.order_by('id').values_list('name', flat=True))
+
+        self.assertIn('Generated 60 tags for 2 users', out.getvalue())
+        self.assertEqual(len(first), 60)
+        self.assertEqual(first, second)
+
+    def test_tag_storage_report(self):
+        '''test that the storage report counts each shared name once'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass123')
+        for user in (self.user, other):
+            Tag.objects.create(user=user, name='Vegan')
+            Tag.objects.create(user=user, name='Dinner')
+        out = io.StringIO()
+
+        call_command('tag_storage', stdout=out)
+
+        self.assertIn('4 tags share 2 names: 11 name characters stored '
+                      'instead of 22, 11 saved', out.getvalue())
@@ -1,15 +1,225 @@
-from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, CharField, Count, IntegerField, Max, \
+    Value, When
+from django.db.models.functions import Length
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.filters import SearchFilter
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from core.models import Tag
+from core import etags, fastpath
+from core.authentication import CachedTokenAuthentication
+from core.db.bulk import raw_delete
+from core.models import Tag, TagName, fold_tag_name
 
-from recipe import serizlizers
+from recipe import serializers, streaming
+from recipe.cache import get_tag_list_cache
+from recipe.pagination import TagCursorPagination
 
 
-class TagViewsSet(viewsets.GenericViewSet, mixins.ListModelMixin):
+EXPORT_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class TagViewsSet(viewsets.GenericViewSet,
+                  mixins.ListModelMixin,
+                  mixins.CreateModelMixin):
     '''manage tags in the database'''
-    authentication_classes = (TokenAuthentication, )
+    authentication_classes = (CachedTokenAuthentication, )
     permission_classes = (IsAuthenticated, )
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    pagination_class = TagCursorPagination
+    filter_backends = (SearchFilter, )  # ?search=, trigram index on pg
+    search_fields = ('name', )
+
+    def get_queryset(self):
+        '''return objects for the current authenticated user only'''
+        return self.queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        '''create a new tag owned by the authenticated user'''
+        serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        '''list tags, answering 304 when the client copy is current
+
+        JSON pages are served from the rendered response cache when
+        possible, without touching the ORM or the serializer. otherwise the
+        ETag comes from the number of tags and their latest change, so it
+        is computed from the index without loading or serializing rows.
+        no Last-Modified is sent, it would not notice deleted tags
+        '''
+        cache = get_tag_list_cache()
+        path = request.get_full_path()
+        cacheable = request.accepted_renderer.format == 'json'
+        if cacheable:
+            # read before the rows, a write after them retires it
+            self.cache_generation = cache.generation(request.user.pk)
+            cached = cache.get(request.user.pk, self.cache_generation, path)
+            if cached is not None:
+                etag, content, content_type = cached
+                response = etags.not_modified(request, etag) or \
+                    HttpResponse(content, content_type=content_type)
+                return etags.set_validators(response, etag)
+
+        version = self.filter_queryset(self.get_queryset()).aggregate(
+            count=Count('id'), updated_at=Max('updated_at'))
+        etag = etags.make_etag(
+            request.user.pk, version['count'], version['updated_at'],
+            request.accepted_renderer.format, path)
+
+        response = etags.not_modified(request, etag)
+        if response is None:
+            response = self.fast_list()
+            if cacheable:
+                self.cache_response = True  # stored once it is rendered
+        return etags.set_validators(response, etag)
+
+    def fast_list(self):
+        '''paginated TagSerializer output built from values() rows'''
+        queryset = fastpath.values(
+            self.filter_queryset(self.get_queryset()),
+            self.get_serializer_class())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(page)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        '''stream every tag of the user as a JSON array or NDJSON
+
+        rows are read in chunks and written as they come, so memory stays
+        flat however many tags the user has. ?layout=ndjson selects one
+        document per line
+        '''
+        layout = request.query_params.get('layout', 'json')
+        if layout not in EXPORT_CONTENT_TYPES:
+            layout = 'json'
+        rows = streaming.iter_rows(
+            fastpath.values(self.get_queryset(), self.get_serializer_class()),
+            settings.TAG_EXPORT_CHUNK_SIZE)
+        if layout == 'ndjson':
+            chunks = streaming.ndjson(rows)
+        else:
+            chunks = streaming.json_array(rows)
+        blocks = streaming.buffered(chunks, settings.TAG_EXPORT_BLOCK_SIZE)
+
+        # CompressionMiddleware compresses the blocks as they are sent
+        response = StreamingHttpResponse(
+            blocks, content_type=EXPORT_CONTENT_TYPES[layout])
+        response['Content-Disposition'] = \
+            'attachment; filename="tags.%s"' % layout
+        return response
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        '''return the user's tags starting with ?q=, best matches first
+
+        ranked by trigram similarity on postgresql and by length elsewhere,
+        the prefix is matched case, whitespace and unicode insensitively
+        '''
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response([])
+
+        # folded the same way as the interned keys, whose index serves it
+        tags = self.get_queryset().filter(
+            tag_name__key__startswith=fold_tag_name(term))
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            tags = tags.annotate(rank=TrigramSimilarity('name', term)) \
+                .order_by('-rank', 'name')
+        else:
+            tags = tags.order_by(Length('name'), 'name')
+
+        limit = settings.TAG_AUTOCOMPLETE_LIMIT
+        return Response(
+            fastpath.values(tags, self.get_serializer_class())[:limit])
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        '''create, rename and delete many tags in one request
+
+        {"create": [{"name": ..}], "update": [{"id": .., "name": ..}],
+        "delete": [id, ..]} is validated in one pass and written in one
+        transaction, a batch with any invalid item writes nothing
+        '''
+        serializer = serializers.TagBulkSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        result = self.perform_bulk(serializer.validated_data)
+
+        return Response({
+            'created': serializers.TagSerializer(
+                result['created'], many=True).data,
+            'updated': result['updated'],
+            'deleted': result['deleted'],
+        }, status=status.HTTP_200_OK)
+
+    def perform_bulk(self, data):
+        '''write a validated batch with one statement per kind of change'''
+        user = self.request.user
+        # the plain manager, without the joined name annotation
+        tags = Tag._base_manager.filter(user=user)
+        batch_size = settings.TAG_BULK_BATCH_SIZE
+        creates = data.get('create', [])
+        updates = data.get('update', [])
+        deletes = data.get('delete', [])
+
+        with transaction.atomic():
+            # every new and renamed tag's name is interned in one pass
+            name_ids = TagName.objects.intern(
+                [item['name'] for item in creates + updates])
+
+            created = Tag.objects.bulk_create(
+                [Tag(user=user, tag_name_id=name_ids[item['name']],
+                     name=item['name'])
+                 for item in creates],
+                batch_size=batch_size)
+
+            now = timezone.now()  # update() skips auto_now fields
+            for start in range(0, len(updates), batch_size):
+                batch = updates[start:start + batch_size]
+                tags.filter(id__in=[item['id'] for item in batch]).update(
+                    tag_name=Case(
+                        *[When(id=item['id'],
+                               then=Value(name_ids[item['name']]))
+                          for item in batch],
+                        output_field=IntegerField()),
+                    sort_name=Case(
+                        *[When(id=item['id'], then=Value(item['name']))
+                          for item in batch],
+                        output_field=CharField()),
+                    updated_at=now)
+
+            if deletes:
+                # tags have no dependants, skip the collector and its
+                # per-row signals, the cache is invalidated once below
+                raw_delete(tags.filter(id__in=deletes))
+
+            transaction.on_commit(
+                lambda: get_tag_list_cache().invalidate(user.pk))
+
+        return {
+            'created': created,
+            'updated': [dict(item) for item in updates],
+            'deleted': deletes,
+        }
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if getattr(self, 'cache_response', False) and \
+                response.status_code == 200:
+            response.render()
+            get_tag_list_cache().set(
+                request.user.pk, self.cache_generation,
+                request.get_full_path(), response['ETag'],
+                response.content, response['Content-Type'])
+        return response
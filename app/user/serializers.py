@@ -1,11 +1,27 @@
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from core import tasks
+from user.tasks import send_welcome_email
+
+
+class CanonicalEmailField(serializers.EmailField):
+    '''email field returning the canonical form stored for users, so the
+    unique check and lookups compare like with like'''
+
+    def to_internal_value(self, data):
+        email = super().to_internal_value(data)
+        return get_user_model().objects.normalize_email(email)
 
 
 class UserSerializer(serializers.ModelSerializer):
     '''serializer for the users object'''
+    email = CanonicalEmailField(max_length=255, validators=[
+        UniqueValidator(queryset=get_user_model().objects.all())])
 
     class Meta:
         model = get_user_model()
@@ -13,21 +29,35 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
 
     def create(self, validated_data):
-        '''create a new user with encrypted password and return it'''
-        return get_user_model().objects.create_user(**validated_data)
+        '''create a new user with encrypted password and return it
+
+        the welcome email is queued with the user, in its transaction, and
+        sent by a worker. tokens are issued at login
+        '''
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(**validated_data)
+            tasks.enqueue(send_welcome_email, user_id=user.pk)
+        return user
 
     def update(self, instance, validated_data):
-        '''update a user, setting the password correctly and return it'''
-        password = validated_data.pop('password', None)  # default None
+        '''update a user, setting the password correctly and return it
 
-        # 상속한 ModelSerializer의 update 메소드 호출하여 업데이트
-        user = super().update(instance, validated_data)
+        the changed fields, password included, are written by one UPDATE
+        '''
+        password = validated_data.pop('password', None)  # default None
 
+        changed = []
+        for field, value in validated_data.items():
+            if getattr(instance, field) != value:
+                setattr(instance, field, value)
+                changed.append(field)
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+            changed.append('password')
 
-        return user
+        if changed:
+            instance.save(update_fields=changed + ['updated_at'])
+        return instance
 
 
 class AuthTokenSerializer(serializers.Serializer):
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+
+from core.tasks import task
+
+
+WELCOME_SUBJECT = 'Welcome to the recipe app'
+WELCOME_MESSAGE = '''Hi {name},
+
+your account {email} is ready. Log in to get your API token.
+'''
+
+
+@task
+def send_welcome_email(user_id):
+    '''mail a new user once the signup committed, off the request'''
+    user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return  # deleted before the mail went out
+    send_mail(
+        WELCOME_SUBJECT,
+        WELCOME_MESSAGE.format(name=user.name or user.email, email=user.email),
+        settings.DEFAULT_FROM_EMAIL, [user.email])
@@ -1,14 +1,22 @@
+from django.core import mail
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
+from core import tasks
+from core.models import AuthToken, digest_token_key
+from core.testing import query_budget
+from core.throttling import get_throttle_store
 
 
 # url constant variables
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
+ROTATE_TOKEN_URL = reverse('user:token-rotate')
 ME_URL = reverse('user:me')
 
 
@@ -17,13 +25,21 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
+def writes(queries):
+    '''return the INSERT, UPDATE and DELETE statements of captured queries'''
+    return [query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+
 # test class
 class PublicUsersApiTests(TestCase):
     '''test the users API (public)'''
 
     def setUp(self):
+        get_throttle_store().clear()
         self.client = APIClient()
 
+    @query_budget(5)  # with the savepoint of the user and task inserts
     def test_create_valid_user_success(self):
         '''test creating user with valid payload'''
         payload = {
@@ -38,6 +54,32 @@ class PublicUsersApiTests(TestCase):
         self.assertTrue(user.check_password(payload['password']))  # check PW
         self.assertNotIn('password', res.data)  # for security
 
+    @query_budget(5)
+    def test_create_user_single_write(self):
+        '''test that signup writes the user and queues its welcome email,
+        sending nothing itself, tokens come at login'''
+        payload = {
+            'email': 'test@gmail.com',
+            'password': 'testpass',
+            'name': 'test'
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        statements = writes(queries)
+        self.assertEqual(len(statements), 2)
+        self.assertIn('"core_user"', statements[0])
+        self.assertIn('"core_task"', statements[1])
+        self.assertFalse(AuthToken.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@gmail.com'])
+
+    @query_budget(1)
     def test_user_exists(self):
         '''test creating a user that already exists fails'''
         payload = {
@@ -50,6 +92,7 @@ class PublicUsersApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)  # bad
 
+    @query_budget(1)
     def test_password_too_short(self):
         '''test that the password must be more than 5 characters'''
         payload = {
@@ -65,18 +108,66 @@ class PublicUsersApiTests(TestCase):
         ).exists()  # returns True when the user exists
         self.assertFalse(user_exists)
 
+    @query_budget(2)
     def test_create_token_for_user(self):
         '''test that a token is created for the user'''
         payload = {
             'email': 'sirzzang@naver.com',
             'password': 'testpass'
         }
-        create_user(**payload)  # helper function for creating user
+        user = create_user(**payload)  # helper function for creating user
         res = self.client.post(TOKEN_URL, payload)  # response for token url
 
         self.assertIn('token', res.data)  # check if 'token' key in response
+        self.assertIn('expires_at', res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # only the digest of the key is stored
+        token = AuthToken.objects.get(user=user)
+        self.assertEqual(token.digest, digest_token_key(res.data['token']))
+
+    @query_budget(8)
+    def test_rotate_token(self):
+        '''test that rotating returns a new key and revokes the old one'''
+        payload = {'email': 'sirzzang@naver.com', 'password': 'testpass'}
+        create_user(**payload)
+        key = self.client.post(TOKEN_URL, payload).data['token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
 
+        res = self.client.post(ROTATE_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], key)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    @query_budget(2)
+    def test_create_token_any_email_casing(self):
+        '''test that a login in another casing probes the email once'''
+        payload = {'email': 'sirzzang@naver.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                TOKEN_URL, {**payload, 'email': 'SirZzang@Naver.com'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        lookups = [query['sql'] for query in queries.captured_queries
+                   if 'FROM "core_user"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('"core_user"."email" = ', lookups[0])
+
+    @query_budget(1)
+    def test_user_exists_other_casing(self):
+        '''test that signing up again in another casing fails'''
+        create_user(email='test@gmail.com', password='testpass')
+
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'Test@Gmail.com', 'password': 'testpass', 'name': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data)
+
+    @query_budget(1)
     def test_create_token_invalid_credentials(self):
         '''test that token is not created if invalid credentials are given'''
         create_user(email='test@gmail.com', password='testpass')
@@ -86,6 +177,7 @@ class PublicUsersApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @query_budget(1)
     def test_create_token_no_user(self):
         '''test that token is not created if user does not exists'''
         payload = {'email': 'test@gmail.com', 'password': 'testpass'}
@@ -94,6 +186,7 @@ class PublicUsersApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @query_budget(0)
     def test_create_token_missing_field(self):
         '''test that email and password are required'''
         res = self.client.post(
@@ -102,6 +195,7 @@ class PublicUsersApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @query_budget(0)
     def test_retrived_user_unauthorized(self):
         '''test that authentication is required for users'''
         res = self.client.get(ME_URL)
@@ -121,6 +215,7 @@ class PrivateUserApiTests(TestCase):
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
 
+    @query_budget(0)
     def test_retrieve_profile_success(self):
         '''test retrieving profile for logged in user'''
         res = self.client.get(ME_URL)  # HTTP response
@@ -131,12 +226,37 @@ class PrivateUserApiTests(TestCase):
             'email': self.user.email
         })
 
+    @query_budget(0)
+    def test_retrieve_profile_not_modified(self):
+        '''test that an unchanged profile is answered with a 304'''
+        res = self.client.get(ME_URL)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    @query_budget(2)
+    def test_retrieve_profile_modified_after_update(self):
+        '''test that updating the profile changes the ETag'''
+        etag = self.client.get(ME_URL)['ETag']
+
+        self.client.patch(ME_URL, {'name': 'new name'})
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], 'new name')
+
+    @query_budget(0)
     def test_post_me_not_allowed(self):
         '''test that POST is not allowed on the me url'''
         res = self.client.post(ME_URL, {})
 
         self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @query_budget(2)
     def test_update_user_profile(self):
         '''test updating the user profile for authenticated user'''
         payload = {'name': 'new name', 'password': 'newpassword123'}
@@ -148,3 +268,45 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @query_budget(2)
+    def test_update_user_single_write(self):
+        '''test that an update writes only the changed fields, once'''
+        payload = {'name': 'new name', 'password': 'newpassword123'}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        statements = writes(queries)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('"name"', statements[0])
+        self.assertIn('"password"', statements[0])
+        self.assertNotIn('"email"', statements[0])
+
+    @query_budget(0)
+    def test_update_user_unchanged_no_write(self):
+        '''test that an update changing nothing writes nothing'''
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, {'name': 'name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(writes(queries), [])
+
+    @query_budget(6)  # the update and purge task share a savepoint
+    def test_delete_user_deactivates(self):
+        '''test that deleting the profile deactivates the user at once'''
+        token = AuthToken.objects.issue(self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(
+            list(get_user_model().objects.deactivated()), [self.user])
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
@@ -1,28 +1,82 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.settings import api_settings
 
+from core import etags, fastpath, routers
+from core.authentication import CachedTokenAuthentication
+from core.models import AuthToken
+from core.throttling import SlidingWindowEmailThrottle, \
+    SlidingWindowIPThrottle
+
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
     '''create a new user in the system'''
     serializer_class = UserSerializer  # class variable for serializer
+    # anonymous, so throttled requests are rejected before any query
+    authentication_classes = ()
+    throttle_classes = (SlidingWindowIPThrottle, SlidingWindowEmailThrottle)
+    throttle_scope = 'signup'
 
 
 class CreateTokenView(ObtainAuthToken):
     '''create a new auth token for user'''
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES  # endpoint
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    # rejected before the password is hashed or the user looked up
+    authentication_classes = ()
+    throttle_classes = (SlidingWindowIPThrottle, SlidingWindowEmailThrottle)
+    throttle_scope = 'login'
+
+    def post(self, request, *args, **kwargs):
+        '''issue a new expiring token for the credentials'''
+        serializer = self.serializer_class(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        token = AuthToken.objects.issue(serializer.validated_data['user'])
+        # the next reads with the token see the primary, not a lagging replica
+        routers.pin(f'{CachedTokenAuthentication.keyword} {token.key}')
+        return Response({'token': token.key, 'expires_at': token.expires_at})
+
+
+class RotateTokenView(APIView):
+    '''replace the token of the request by a new one'''
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
 
+    def post(self, request, *args, **kwargs):
+        token = request.auth.rotate()
+        routers.pin(f'{CachedTokenAuthentication.keyword} {token.key}')
+        return Response({'token': token.key, 'expires_at': token.expires_at})
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     '''manage the authenticated user'''
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     # override get_object method
     def get_object(self):
         '''retrieve and return authentication user'''
         return self.request.user
+
+    def retrieve(self, request, *args, **kwargs):
+        '''return the profile, or 304 when the client copy is current'''
+        user = self.get_object()
+        etag = etags.make_etag(
+            user.pk, user.updated_at, request.accepted_renderer.format)
+
+        response = etags.not_modified(request, etag, user.updated_at)
+        if response is None:  # UserSerializer output, without building it
+            response = Response(
+                fastpath.represent(user, self.get_serializer_class()))
+        return etags.set_validators(response, etag, user.updated_at)
+
+    def perform_destroy(self, instance):
+        '''deactivate now, a purge_user task deletes the rows in batches'''
+        instance.deactivate()